@@ -9,8 +9,10 @@ from .bot import StreamBot
 from .vars import Var
 from aiohttp import web
 from .server import web_server
+from .server.static_assets import load_static_assets
 from .utils.keepalive import ping_server
 from f2lnk.bot.multi_clients import initialize_clients
+from f2lnk.utils.database import Database
 
 LOGO = """
  ____ ___ ___ ____    _    _
@@ -44,6 +46,10 @@ async def start_services():
         "---------------------- Initializing Clients ----------------------"
     )
     await initialize_clients()
+    try:
+        await Database(Var.DATABASE_URL, Var.name).ensure_indexes()
+    except Exception as e:
+        print(f'Creating database indexes failed: {e}')
     print("------------------------------ DONE ------------------------------")
     print('\n')
     print('--------------------------- Importing ---------------------------')
@@ -59,6 +65,8 @@ async def start_services():
             sys.modules["f2lnk.bot.plugins." + plugin_name] = load
             print("Imported => " + plugin_name)
     print('-------------------- Initalizing Web Server -------------------------')
+    # Watch-page CSS/JS bundle, mirrored at build time; read from disk only.
+    await load_static_assets()
     app = web.AppRunner(await web_server())
     await app.setup()
     bind_address = "0.0.0.0"
@@ -80,6 +88,12 @@ async def start_services():
     except Exception as e:
         print(f'got this err to send restart msg to owner : {e}')
     print('Bot ready to use ✅')
+    # Pick up /l tasks interrupted by the last restart or crash
+    try:
+        from f2lnk.bot.plugins.leech import resume_leech_tasks
+        await resume_leech_tasks(StreamBot)
+    except Exception as e:
+        print(f'Resuming leech tasks failed: {e}')
     # Start the auto-restart watchdog
     try:
         from f2lnk.bot.plugins.restart import start_watchdog
@@ -87,6 +101,13 @@ async def start_services():
         print('Restart watchdog started ✅')
     except Exception as e:
         print(f'Watchdog failed to start: {e}')
+    # Clean up temp dirs left behind by failed or killed jobs
+    try:
+        from f2lnk.utils.janitor import start_janitor
+        start_janitor()
+        print('Temp janitor started ✅')
+    except Exception as e:
+        print(f'Janitor failed to start: {e}')
     await idle()
 
 if __name__ == '__main__':
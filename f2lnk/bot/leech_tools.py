@@ -11,8 +11,8 @@
 from f2lnk.utils.split_upload import upload_file_or_split
 
 import os
-import json
 import asyncio
+import contextvars
 import logging
 
 from f2lnk.bot.task_manager import (
@@ -23,16 +23,43 @@ from f2lnk.bot.task_manager import (
     SUBTITLE_EXTENSIONS,
     cleanup_task_files,
     remove_task,
+    save_task_state,
 )
 from f2lnk.utils.human_readable import humanbytes
+from f2lnk.utils.ffmpeg_runner import run_ffmpeg
+from f2lnk.utils import probe_cache
+from f2lnk.utils.smartcut import (
+    smart_trim, keyframe_after, parse_timestamp, boundary_encoder_args, inband_tag_args,
+)
+from f2lnk.utils.chunked_encode import chunk_count, chunked_encode, stream_maps
+from f2lnk.utils.two_pass import target_size_encode
+from f2lnk.vars import Var
 
 logger = logging.getLogger(__name__)
 
+# Set inside each FilePipeline job. A failing per-file tool records its
+# error here instead of tearing the task down under its sibling jobs.
+_pipeline_job = contextvars.ContextVar("_pipeline_job", default=None)
+
 
 # ═══════════════════════════════════════════════════════════════
 #  SHARED HELPERS
 # ═══════════════════════════════════════════════════════════════
 
+def _fail_task(task: LeechTask, error: str = ""):
+    """
+    Drop a failed task's files and registry entry. Inside a FilePipeline
+    job only the error is recorded: the pipeline cleans up once, after
+    the other files' jobs are cancelled.
+    """
+    job = _pipeline_job.get()
+    if job is not None:
+        job["error"] = error
+        return
+    cleanup_task_files(task)
+    remove_task(task.task_id)
+
+
 def _detect_file_type(msg) -> str:
     """Detect 'video', 'audio', 'subtitle', or 'unknown'."""
     if msg.video:
@@ -64,29 +91,111 @@ def _classify_by_path(path: str) -> str:
     return "unknown"
 
 
-async def _run_ffmpeg(task: LeechTask, cmd: list, status_msg=None):
+# Containers that carry a moov index and benefit from +faststart
+FASTSTART_EXTENSIONS = (".mp4", ".m4v", ".mov")
+
+
+def _moov_before_mdat(path: str):
+    """
+    Walk the top-level MP4 boxes and report whether `moov` precedes `mdat`.
+    Returns True/False, or None if the file could not be parsed.
+    """
+    try:
+        size_total = os.path.getsize(path)
+        with open(path, "rb") as f:
+            pos = 0
+            while pos + 8 <= size_total:
+                f.seek(pos)
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                box_size = int.from_bytes(header[:4], "big")
+                box_type = header[4:8]
+                if box_type == b"moov":
+                    return True
+                if box_type == b"mdat":
+                    return False
+                if box_size == 1:  # 64-bit largesize follows the header
+                    ext = f.read(8)
+                    if len(ext) < 8:
+                        return None
+                    box_size = int.from_bytes(ext, "big")
+                elif box_size == 0:  # box runs to EOF
+                    return None
+                if box_size < 8:
+                    return None
+                pos += box_size
+    except OSError:
+        return None
+    return None
+
+
+async def _ensure_faststart(task: LeechTask, path: str):
+    """
+    Make sure an MP4 output has its moov atom at the front so /watch can start
+    playback without a tail range request. Remuxes in place if it doesn't.
+    """
+    if _moov_before_mdat(path) is not False:
+        return
+    logger.info("Task %s: relocating moov atom for %s", task.task_id, path)
+    tmp_path = path + ".faststart" + os.path.splitext(path)[1]
+    cmd = [
+        "ffmpeg", "-y", "-i", path,
+        "-map", "0", "-c", "copy", "-movflags", "+faststart",
+        tmp_path,
+    ]
+    try:
+        returncode, stderr_text = await run_ffmpeg(
+            cmd, user_id=task.user_id,
+            on_start=lambda proc: setattr(task, "merge_process", proc),
+            cancel_event=task.cancel_event,
+        )
+    except asyncio.CancelledError:
+        return
+    if returncode == 0 and os.path.isfile(tmp_path):
+        os.replace(tmp_path, path)
+    else:
+        # Not fatal — the file still plays, just with a slower start.
+        logger.warning(
+            "Task %s: faststart remux failed: %s",
+            task.task_id, stderr_text[-300:],
+        )
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+async def _run_ffmpeg(task: LeechTask, cmd: list, status_msg=None, faststart: bool = True,
+                      duration: float = None):
     """
     Run an ffmpeg command as a subprocess.
     Returns (success: bool, stderr: str).
+
+    MP4/MOV outputs (the last argument) get `-movflags +faststart` and are
+    checked afterwards; pass faststart=False for intermediate files.
     """
+    output_path = cmd[-1] if cmd else ""
+    is_mp4 = os.path.splitext(output_path)[1].lower() in FASTSTART_EXTENSIONS
+    if faststart and is_mp4 and "-movflags" not in cmd:
+        cmd = cmd[:-1] + ["-movflags", "+faststart", output_path]
+
     logger.info("Task %s: ffmpeg cmd = %s", task.task_id, " ".join(cmd))
     try:
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
+        # Queues for a free slot, then streams progress into status_msg.
+        returncode, stderr_text = await run_ffmpeg(
+            cmd, user_id=task.user_id, status_msg=status_msg,
+            label=f"task `{task.task_id}`", duration=duration,
+            on_start=lambda proc: setattr(task, "merge_process", proc),
+            cancel_event=task.cancel_event,
         )
-        task.merge_process = proc
-        stdout, stderr = await proc.communicate()
     except asyncio.CancelledError:
         return False, "Cancelled"
 
     if task.cancel_event.is_set():
         return False, "Cancelled"
 
-    stderr_text = stderr.decode("utf-8", errors="replace")
-
-    if proc.returncode != 0:
+    if returncode != 0:
         task.status = TaskStatus.FAILED
         # Show the LAST part of stderr — the actual error is at the end,
         # the beginning is always ffmpeg version/config info.
@@ -99,13 +208,22 @@ async def _run_ffmpeg(task: LeechTask, cmd: list, status_msg=None):
                 )
             except Exception:
                 pass
-        cleanup_task_files(task)
-        remove_task(task.task_id)
+        _fail_task(task, err_short)
         return False, stderr_text
 
+    if faststart and is_mp4 and os.path.isfile(output_path):
+        await _ensure_faststart(task, output_path)
+
     return True, stderr_text
 
 
+def _finish_output(task, total: int, out_name: str) -> list:
+    """Single-file tasks upload task.output_name; batches find outputs by prefix."""
+    if total == 1:
+        task.output_name = out_name
+    return [out_name]
+
+
 def _split_files(downloaded_files, classify_msgs=True):
     """
     Split downloaded files into video/audio/subtitle lists.
@@ -401,120 +519,109 @@ async def process_compress_video(client, task, downloaded_files, status_msg) ->
         remove_task(task.task_id)
         return False
 
-    output_base = os.path.splitext(task.output_name)[0]
-    output_ext = os.path.splitext(task.output_name)[1] or ".mp4"
-    mode = task.compress_mode or 2
-
     total = len(videos)
     for i, (idx, path, msg) in enumerate(videos):
         if task.cancel_event.is_set():
             return False
-
-        out_name = f"{output_base}_{i + 1}{output_ext}" if total > 1 else task.output_name
-        output_path = os.path.join(task.work_dir, out_name)
-
-        await status_msg.edit_text(
-            f"⚙️ **Compressing** {i + 1}/{total} — Task: `{task.task_id}`\n"
-            f"Mode: {COMPRESS_PRESETS.get(mode, {}).get('label', f'Mode {mode}')}"
-        )
-
-        if mode in (1, 2, 3):
-            preset = COMPRESS_PRESETS[mode]
-            cmd = [
-                "ffmpeg", "-y", "-i", path,
-                "-c:v", "libx264",
-                "-crf", str(preset["crf"]),
-                "-preset", preset["preset"],
-                "-c:a", "copy",
-                output_path,
-            ]
-        elif mode == 4:
-            # Target file size mode
-            cmd = await _build_target_size_cmd(task, path, output_path, status_msg)
-            if cmd is None:
-                return False
-        elif mode == 5:
-            # Custom CRF
-            crf = task.custom_crf or 23
-            cmd = [
-                "ffmpeg", "-y", "-i", path,
-                "-c:v", "libx264",
-                "-crf", str(crf),
-                "-preset", "medium",
-                "-c:a", "copy",
-                output_path,
-            ]
-        else:
-            continue
-
-        ok, _ = await _run_ffmpeg(task, cmd, status_msg)
-        if not ok:
+        if await compress_file(task, i, total, path, status_msg) is None:
             return False
 
-        # Update output_name for upload (last file or single file)
-        if total == 1:
-            task.output_name = out_name
-
     return True
 
 
-async def _build_target_size_cmd(task, input_path, output_path, status_msg):
-    """Build ffmpeg command for target size compression."""
-    target_mb = task.target_size_mb or 100
-    target_bytes = target_mb * 1024 * 1024
-    target_bits = target_bytes * 8
-
-    # Probe the input file for duration and audio bitrate
-    probe_cmd = [
-        "ffprobe", "-v", "quiet", "-print_format", "json",
-        "-show_format", "-show_streams", input_path,
-    ]
-    try:
-        proc = await asyncio.create_subprocess_exec(
-            *probe_cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        stdout, _ = await proc.communicate()
-        info = json.loads(stdout.decode("utf-8", errors="replace"))
-    except Exception as e:
-        logger.warning("ffprobe failed for task %s: %s", task.task_id, e)
-        # Fallback to balanced mode
-        return [
-            "ffmpeg", "-y", "-i", input_path,
-            "-c:v", "libx264", "-crf", "23", "-preset", "medium",
-            "-c:a", "copy", output_path,
-        ]
-
-    duration = float(info.get("format", {}).get("duration", 0))
-    if duration <= 0:
-        duration = 60  # fallback
+async def compress_file(task, i, total, path, status_msg):
+    """Compress one input. Returns its output names ([] if skipped), None on failure."""
+    output_base = os.path.splitext(task.output_name)[0]
+    output_ext = os.path.splitext(task.output_name)[1] or ".mp4"
+    mode = task.compress_mode or 2
 
-    # Find audio bitrate
-    audio_bitrate = 128000  # default 128kbps
-    for stream in info.get("streams", []):
-        if stream.get("codec_type") == "audio":
-            audio_bitrate = int(stream.get("bit_rate", 128000))
-            break
+    out_name = f"{output_base}_{i + 1}{output_ext}" if total > 1 else task.output_name
+    output_path = os.path.join(task.work_dir, out_name)
 
-    total_bitrate = target_bits / duration
-    video_bitrate = int((total_bitrate - audio_bitrate) / 1000)  # kbps
+    await status_msg.edit_text(
+        f"⚙️ **Compressing** {i + 1}/{total} — Task: `{task.task_id}`\n"
+        f"Mode: {COMPRESS_PRESETS.get(mode, {}).get('label', f'Mode {mode}')}"
+    )
 
-    if video_bitrate < 100:
-        video_bitrate = 100
-        await status_msg.edit_text(
-            f"⚠️ Target size too small for duration. Using minimum bitrate.\n"
-            f"Consider a shorter target or lower resolution."
+    if mode in (1, 2, 3):
+        preset = COMPRESS_PRESETS[mode]
+        video_args = [
+            "-c:v", "libx264",
+            "-crf", str(preset["crf"]),
+            "-preset", preset["preset"],
+        ]
+        audio_args = ["-c:a", "copy"]
+    elif mode == 4:
+        # Target file size mode: two-pass, analysis cached per file
+        if not await _compress_target_size(task, path, output_path, status_msg):
+            return None
+        return _finish_output(task, total, out_name)
+    elif mode == 5:
+        # Custom CRF
+        crf = task.custom_crf or 23
+        video_args = [
+            "-c:v", "libx264",
+            "-crf", str(crf),
+            "-preset", "medium",
+        ]
+        audio_args = ["-c:a", "copy"]
+    else:
+        return []
+
+    chunks = chunk_count(await probe_cache.probe_duration(path))
+    if chunks > 1:
+        # Long input: encode keyframe-aligned segments in parallel.
+        # Same encoder args for every segment, so rate control matches.
+        chunk_ok, err = await chunked_encode(
+            path, output_path, video_args, audio_args, chunks,
+            user_id=task.user_id, status_msg=status_msg,
+            label=f"task `{task.task_id}`",
+            on_start=lambda proc: setattr(task, "merge_process", proc),
+            cancel_event=task.cancel_event,
         )
+        if task.cancel_event.is_set():
+            return None
+        if chunk_ok:
+            if os.path.splitext(output_path)[1].lower() in FASTSTART_EXTENSIONS:
+                await _ensure_faststart(task, output_path)
+            return _finish_output(task, total, out_name)
+        logger.warning("Task %s: chunked encode failed (%s), encoding in one pass",
+                       task.task_id, err[-200:])
+
+    cmd = ["ffmpeg", "-y", "-i", path, *stream_maps(), *video_args, *audio_args, output_path]
+    ok, _ = await _run_ffmpeg(task, cmd, status_msg)
+    if not ok:
+        return None
+    return _finish_output(task, total, out_name)
 
-    return [
-        "ffmpeg", "-y", "-i", input_path,
-        "-c:v", "libx264",
-        "-b:v", f"{video_bitrate}k",
-        "-preset", "medium",
-        "-c:a", "aac", "-b:a", "128k",
-        output_path,
-    ]
+
+async def _compress_target_size(task, input_path, output_path, status_msg) -> bool:
+    """Two-pass encode to task.target_size_mb (pass 1 reused across re-runs)."""
+    target_mb = task.target_size_mb or 100
+    ok, err = await target_size_encode(
+        input_path, output_path, target_mb * 1024 * 1024,
+        status_msg=status_msg,
+        user_id=task.user_id,
+        label=f"task `{task.task_id}`",
+        on_start=lambda proc: setattr(task, "merge_process", proc),
+        cancel_event=task.cancel_event,
+    )
+    if task.cancel_event.is_set():
+        return False
+    if not ok:
+        task.status = TaskStatus.FAILED
+        try:
+            await status_msg.edit_text(
+                f"❌ **Processing failed** for task `{task.task_id}`:\n"
+                f"```\n{err[-800:]}\n```"
+            )
+        except Exception:
+            pass
+        _fail_task(task, err[-800:])
+        return False
+    if os.path.splitext(output_path)[1].lower() in FASTSTART_EXTENSIONS:
+        await _ensure_faststart(task, output_path)
+    return True
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -550,52 +657,55 @@ async def process_watermark_video(client, task, downloaded_files, status_msg) ->
         remove_task(task.task_id)
         return False
 
-    output_base = os.path.splitext(task.output_name)[0]
-    output_ext = os.path.splitext(task.output_name)[1] or ".mp4"
     total = len(videos)
-
     for i, (idx, path, msg) in enumerate(videos):
         if task.cancel_event.is_set():
             return False
+        if await watermark_file(task, i, total, path, status_msg) is None:
+            return False
 
-        out_name = f"{output_base}_{i + 1}{output_ext}" if total > 1 else task.output_name
-        output_path = os.path.join(task.work_dir, out_name)
+    return True
 
-        await status_msg.edit_text(
-            f"⚙️ **Watermarking** {i + 1}/{total} — Task: `{task.task_id}`"
-        )
 
-        if task.watermark_type == "text":
-            vf = _build_text_watermark_filter(task)
-            cmd = [
-                "ffmpeg", "-y", "-i", path,
-                "-vf", vf,
-                "-c:a", "copy",
-                output_path,
-            ]
-        elif task.watermark_type == "image":
-            vf = _build_image_watermark_filter(task)
-            cmd = [
-                "ffmpeg", "-y",
-                "-i", path,
-                "-i", task.watermark_image_path,
-                "-filter_complex", vf,
-                "-map", "[out]",
-                "-map", "0:a?",
-                "-c:a", "copy",
-                output_path,
-            ]
-        else:
-            continue
+async def watermark_file(task, i, total, path, status_msg):
+    """Watermark one input. Returns its output names ([] if skipped), None on failure."""
+    output_base = os.path.splitext(task.output_name)[0]
+    output_ext = os.path.splitext(task.output_name)[1] or ".mp4"
 
-        ok, _ = await _run_ffmpeg(task, cmd, status_msg)
-        if not ok:
-            return False
+    out_name = f"{output_base}_{i + 1}{output_ext}" if total > 1 else task.output_name
+    output_path = os.path.join(task.work_dir, out_name)
 
-        if total == 1:
-            task.output_name = out_name
+    await status_msg.edit_text(
+        f"⚙️ **Watermarking** {i + 1}/{total} — Task: `{task.task_id}`"
+    )
 
-    return True
+    if task.watermark_type == "text":
+        vf = _build_text_watermark_filter(task)
+        cmd = [
+            "ffmpeg", "-y", "-i", path,
+            "-vf", vf,
+            "-c:a", "copy",
+            output_path,
+        ]
+    elif task.watermark_type == "image":
+        vf = _build_image_watermark_filter(task)
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", path,
+            "-i", task.watermark_image_path,
+            "-filter_complex", vf,
+            "-map", "[out]",
+            "-map", "0:a?",
+            "-c:a", "copy",
+            output_path,
+        ]
+    else:
+        return []
+
+    ok, _ = await _run_ffmpeg(task, cmd, status_msg)
+    if not ok:
+        return None
+    return _finish_output(task, total, out_name)
 
 
 def _build_text_watermark_filter(task) -> str:
@@ -774,24 +884,17 @@ async def upload_batch_results(client, task, status_msg) -> bool:
     for i, (fname, fpath) in enumerate(output_files):
         if task.cancel_event.is_set():
             return False
+        if fname in task.uploaded_outputs:
+            continue  # sent before a restart
 
         await status_msg.edit_text(
             f"⬆️ **Uploading** {i + 1}/{total} — `{fname}`"
         )
 
         try:
-            file_size = os.path.getsize(fpath)
-            caption = (
-                f"✅ **Processed**\n"
-                f"📁 `{fname}`\n"
-                f"📦 Size: `{humanbytes(file_size)}`\n"
-                f"🆔 Task: `{task.task_id}`"
-            )
-
-            await upload_file_or_split(
-                client, task.chat_id, fpath,
-                caption=caption, file_name=fname,
-            )
+            await _upload_output(client, task, fname, fpath)
+            task.uploaded_outputs.append(fname)
+            save_task_state(task)
         except Exception as e:
             task.status = TaskStatus.FAILED
             await status_msg.edit_text(f"❌ Upload failed: `{e}`")
@@ -800,143 +903,288 @@ async def upload_batch_results(client, task, status_msg) -> bool:
     return True
 
 
+async def _upload_output(client, task, fname: str, fpath: str):
+    """Send one processed file to the user (auto-split if needed)."""
+    file_size = os.path.getsize(fpath)
+    caption = (
+        f"✅ **Processed**\n"
+        f"📁 `{fname}`\n"
+        f"📦 Size: `{humanbytes(file_size)}`\n"
+        f"🆔 Task: `{task.task_id}`"
+    )
+    sent = await upload_file_or_split(
+        client, task.chat_id, fpath,
+        caption=caption, file_name=fname,
+    )
+    task.uploaded_messages.extend(sent)
+
+
 # ═══════════════════════════════════════════════════════════════
 #  TOOL: TV — Trim Video (extract segment)
 # ═══════════════════════════════════════════════════════════════
 
 async def process_trim_video(task, downloaded_files, status_msg) -> bool:
-    """Extract segment between start_time and end_time."""
+    """
+    Extract segment between start_time and end_time.
+    In smart mode only the boundary GOPs are re-encoded (frame-accurate);
+    otherwise, or if smart cut can't handle the file, stream-copy.
+    """
+    total = len(downloaded_files)
+    for i, (idx, path, msg) in enumerate(downloaded_files):
+        if task.cancel_event.is_set():
+            return False
+        if await trim_file(task, i, total, path, status_msg) is None:
+            return False
+
+    return True
+
+
+async def trim_file(task, i, total, path, status_msg):
+    """Trim one input. Returns its output names, None on failure."""
     if not task.start_time or not task.end_time:
         task.status = TaskStatus.FAILED
         await status_msg.edit_text(
             f"❌ Missing timestamps for task `{task.task_id}`."
         )
-        cleanup_task_files(task)
-        remove_task(task.task_id)
-        return False
+        _fail_task(task, "Missing timestamps")
+        return None
 
-    total = len(downloaded_files)
     output_base = os.path.splitext(task.output_name)[0]
     output_ext = os.path.splitext(task.output_name)[1] or ".mp4"
- 
-    for i, (idx, path, msg) in enumerate(downloaded_files):
-        if task.cancel_event.is_set():
-            return False
 
-        out_name = f"{output_base}_{i + 1}{output_ext}" if total > 1 else task.output_name
-        output_path = os.path.join(task.work_dir, out_name)
-
-        await status_msg.edit_text(
-            f"✂️ **Trimming** {i + 1}/{total} — Task: `{task.task_id}`\n"
-            f"⏱️ {task.start_time} → {task.end_time}"
-        )
+    out_name = f"{output_base}_{i + 1}{output_ext}" if total > 1 else task.output_name
+    output_path = os.path.join(task.work_dir, out_name)
 
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", path,
-            "-ss", task.start_time,
-            "-to", task.end_time,
-            "-c", "copy",
-            output_path,
-        ]
+    await status_msg.edit_text(
+        f"✂️ **Trimming** {i + 1}/{total} — Task: `{task.task_id}`\n"
+        f"⏱️ {task.start_time} → {task.end_time}"
+    )
 
-        ok, _ = await _run_ffmpeg(task, cmd, status_msg)
-        if not ok:
-            return False
+    if Var.TRIM_MODE == "smart":
+        smart_ok, err = await smart_trim(
+            path, task.start_time, task.end_time, output_path,
+            user_id=task.user_id, status_msg=status_msg,
+            label=f"task `{task.task_id}`",
+            on_start=lambda proc: setattr(task, "merge_process", proc),
+            cancel_event=task.cancel_event,
+        )
+        if task.cancel_event.is_set():
+            return None
+        if smart_ok:
+            if os.path.splitext(output_path)[1].lower() in FASTSTART_EXTENSIONS:
+                await _ensure_faststart(task, output_path)
+            return _finish_output(task, total, out_name)
+        logger.info("Task %s: smart cut unavailable (%s), using stream copy",
+                    task.task_id, err[-200:])
 
-        if total == 1:
-            task.output_name = out_name
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", path,
+        "-ss", task.start_time,
+        "-to", task.end_time,
+        "-c", "copy",
+        output_path,
+    ]
 
-    return True
+    ok, _ = await _run_ffmpeg(task, cmd, status_msg)
+    if not ok:
+        return None
+    return _finish_output(task, total, out_name)
 
 
 # ═══════════════════════════════════════════════════════════════
 #  TOOL: CUT — Cut Video (remove segment, keep rest)
 # ═══════════════════════════════════════════════════════════════
 
+def _concat_quote(path: str) -> str:
+    """Escape a path for a single-quoted concat demuxer `file` line."""
+    return path.replace(chr(92), "/").replace("'", "'\\''")
+
+
+CUT_BRIDGE_MIN = 0.04  # seconds of skipped frames worth a re-encoded bridge
+
+# Source container → muxer for the bridge piece. Writing it in the source's
+# own container keeps the time base and the packet format the concat
+# demuxer sees identical across the pieces.
+CUT_BRIDGE_FORMATS = {".mkv": "matroska", ".mp4": "mp4", ".m4v": "mp4", ".mov": "mov", ".ts": "mpegts"}
+# Source audio codec → encoder producing the same codec for the bridge
+CUT_BRIDGE_AUDIO_ENCODERS = {
+    "aac": "aac", "mp3": "libmp3lame", "mp2": "mp2", "ac3": "ac3", "eac3": "eac3",
+    "opus": "libopus", "vorbis": "libvorbis", "flac": "flac",
+}
+
+
+async def _encode_cut_bridge(task, path: str, t0: float, t1: float, out_base: str):
+    """
+    Re-encode [t0, t1) — the partial GOP between the cut end and the next
+    keyframe — so the concat pass can keep those frames. The video matches
+    the source's profile/level/pixel format (smartcut.boundary_encoder_args)
+    and the audio is re-encoded to the source codec, since stream-copied
+    audio would start at the seek point's keyframe, not at t0. Returns
+    (bridge_path, extra output args) or (None, reason); declined for
+    anything but one H.264/HEVC video stream plus audio, in MKV/MP4/MOV/TS,
+    with audio codecs it can re-encode.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in CUT_BRIDGE_FORMATS:
+        return None, f"{ext or 'this'} container"
+    info = await probe_cache.probe(path)
+    all_streams = probe_cache.streams(info)
+    video = probe_cache.streams(info, "video")
+    audio = probe_cache.streams(info, "audio")
+    if len(video) != 1 or len(video) + len(audio) != len(all_streams):
+        return None, "streams other than one video plus audio"
+    encoder_args, err = boundary_encoder_args(video[0])
+    if encoder_args is None:
+        return None, err
+    audio_args = []
+    for n, stream in enumerate(audio):
+        encoder = CUT_BRIDGE_AUDIO_ENCODERS.get(stream.get("codec_name"))
+        if encoder is None:
+            return None, f"{stream.get('codec_name')} audio"
+        audio_args += [f"-c:a:{n}", encoder]
+        for key, option in (("sample_rate", "-ar"), ("channels", "-ac"), ("bit_rate", "-b")):
+            if stream.get(key):
+                audio_args += [f"{option}:a:{n}", str(stream[key])]
+
+    out_path = out_base + ext
+    cmd = [
+        "ffmpeg", "-y", "-ss", f"{t0:.6f}", "-i", path, "-t", f"{t1 - t0:.6f}",
+        "-map", "0", *encoder_args, *audio_args,
+    ]
+    time_base = str(video[0].get("time_base") or "")
+    if CUT_BRIDGE_FORMATS[ext] in ("mp4", "mov") and time_base.startswith("1/"):
+        cmd += ["-video_track_timescale", time_base[2:]]
+    cmd += ["-f", CUT_BRIDGE_FORMATS[ext], out_path]
+    rc, err = await run_ffmpeg(
+        cmd, user_id=task.user_id, label=f"task `{task.task_id}` (cut boundary)",
+        duration=t1 - t0, cancel_event=task.cancel_event,
+    )
+    if rc != 0 or not os.path.isfile(out_path):
+        logger.warning("Task %s: cut bridge [%.3f, %.3f) failed: %s", task.task_id, t0, t1, err[-300:])
+        try:
+            os.remove(out_path)
+        except OSError:
+            pass
+        return None, "the bridge encode failed"
+    return out_path, inband_tag_args(video[0]["codec_name"], task.output_name)
+
+
 async def process_cut_video(task, downloaded_files, status_msg) -> bool:
     """
     Remove segment between start_time and end_time.
     Keeps: [0 → start] + [end → EOF], stitched together.
     """
+    total = len(downloaded_files)
+    for i, (idx, path, msg) in enumerate(downloaded_files):
+        if task.cancel_event.is_set():
+            return False
+        if await cut_file(task, i, total, path, status_msg) is None:
+            return False
+
+    return True
+
+
+async def cut_file(task, i, total, path, status_msg):
+    """Cut one input. Returns its output names, None on failure."""
     if not task.start_time or not task.end_time:
         task.status = TaskStatus.FAILED
         await status_msg.edit_text(
             f"❌ Missing timestamps for task `{task.task_id}`."
         )
-        cleanup_task_files(task)
-        remove_task(task.task_id)
-        return False
+        _fail_task(task, "Missing timestamps")
+        return None
 
-    total = len(downloaded_files)
     output_base = os.path.splitext(task.output_name)[0]
     output_ext = os.path.splitext(task.output_name)[1] or ".mp4"
 
-    for i, (idx, path, msg) in enumerate(downloaded_files):
-        if task.cancel_event.is_set():
-            return False
+    out_name = f"{output_base}_{i + 1}{output_ext}" if total > 1 else task.output_name
+    output_path = os.path.join(task.work_dir, out_name)
 
-        out_name = f"{output_base}_{i + 1}{output_ext}" if total > 1 else task.output_name
-        output_path = os.path.join(task.work_dir, out_name)
+    await status_msg.edit_text(
+        f"✂️ **Cutting** {i + 1}/{total} — Task: `{task.task_id}`\n"
+        f"🗑️ Removing: {task.start_time} → {task.end_time}"
+    )
 
+    # One pass: the concat demuxer reads two windows of the same file
+    # ([0, start) and [resume, EOF)) and muxes them straight into the
+    # output — no part files, the source is read once.
+    cut_start = parse_timestamp(task.start_time)
+    cut_end = parse_timestamp(task.end_time)
+    if cut_start is None or cut_end is None or cut_end <= cut_start:
+        task.status = TaskStatus.FAILED
         await status_msg.edit_text(
-            f"✂️ **Cutting** {i + 1}/{total} — Task: `{task.task_id}`\n"
-            f"🗑️ Removing: {task.start_time} → {task.end_time}"
+            f"❌ Invalid timestamps for task `{task.task_id}`: "
+            f"`{task.start_time}` → `{task.end_time}`"
         )
+        _fail_task(task, f"Invalid timestamps: {task.start_time} → {task.end_time}")
+        return None
+
+    # A stream copy can only resume on a keyframe. The frames between the
+    # cut end and that keyframe are re-encoded into a small bridge piece
+    # listed between the two windows, so nothing after the cut is lost. Its
+    # parameter sets differ from the source's (see smartcut), so the seam
+    # is not a clean splice for every player: only with TRIM_MODE "smart",
+    # otherwise the kept part resumes on the keyframe.
+    resume = await keyframe_after(path, cut_end)
+    if resume is None:
+        resume = cut_end
+    source_duration = await probe_cache.probe_duration(path)
+    if source_duration:
+        resume = min(resume, source_duration)
+
+    bridge, tag_args = None, []
+    if Var.TRIM_MODE == "smart" and resume - cut_end > CUT_BRIDGE_MIN:
+        bridge, detail = await _encode_cut_bridge(
+            task, path, cut_end, resume, os.path.join(task.work_dir, f"cut_{i}_bridge"),
+        )
+        if bridge:
+            tag_args = detail
+        else:
+            reason = detail
+            if task.cancel_event.is_set():
+                return None
+            # Explicit fallback: the tail starts on the keyframe instead.
+            logger.warning(
+                "Task %s: no cut bridge for %s (%s), dropping %.2fs after the cut end",
+                task.task_id, path, reason, resume - cut_end,
+            )
+            await status_msg.edit_text(
+                f"✂️ **Cutting** {i + 1}/{total} — Task: `{task.task_id}`\n"
+                f"⚠️ This source can't be cut frame-accurately ({reason}); the kept part "
+                f"resumes at the next keyframe, {resume - cut_end:.2f}s after {task.end_time}."
+            )
 
-        # Step 1: Extract segment BEFORE the cut
-        part_a = os.path.join(task.work_dir, f"cut_{i}_partA{output_ext}")
-        cmd_a = [
-            "ffmpeg", "-y", "-i", path,
-            "-to", task.start_time,
-            "-c", "copy", part_a,
-        ]
-        ok, _ = await _run_ffmpeg(task, cmd_a, status_msg)
-        if not ok:
-            return False
-
-        if task.cancel_event.is_set():
-            return False
-
-        # Step 2: Extract segment AFTER the cut
-        part_b = os.path.join(task.work_dir, f"cut_{i}_partB{output_ext}")
-        cmd_b = [
-            "ffmpeg", "-y", "-i", path,
-            "-ss", task.end_time,
-            "-c", "copy", part_b,
-        ]
-        ok, _ = await _run_ffmpeg(task, cmd_b, status_msg)
-        if not ok:
-            return False
-
-        if task.cancel_event.is_set():
-            return False
+    src = _concat_quote(os.path.abspath(path))
+    concat_file = os.path.join(task.work_dir, f"cut_{i}_concat.txt")
+    with open(concat_file, "w", encoding="utf-8") as f:
+        if cut_start > 0:
+            f.write(f"file '{src}'\noutpoint {cut_start:.6f}\n")
+        if bridge:
+            f.write(f"file '{_concat_quote(os.path.abspath(bridge))}'\n")
+        if not source_duration or resume < source_duration:
+            f.write(f"file '{src}'\ninpoint {resume:.6f}\n")
 
-        # Step 3: Concat the two parts
-        concat_file = os.path.join(task.work_dir, f"cut_{i}_concat.txt")
-        with open(concat_file, "w", encoding="utf-8") as f:
-            f.write(f"file '{os.path.abspath(part_a).replace(chr(92), '/')}'\n")
-            f.write(f"file '{os.path.abspath(part_b).replace(chr(92), '/')}'\n")
+    kept = None
+    if source_duration:
+        kept = cut_start + max(0.0, source_duration - (cut_end if bridge else resume))
 
-        cmd_concat = [
-            "ffmpeg", "-y", "-f", "concat", "-safe", "0",
-            "-i", concat_file, "-c", "copy", output_path,
-        ]
-        ok, _ = await _run_ffmpeg(task, cmd_concat, status_msg)
-        if not ok:
-            return False
-
-        # Clean temp parts
-        for tmp in (part_a, part_b, concat_file):
-            try:
+    cmd = [
+        "ffmpeg", "-y", "-f", "concat", "-safe", "0",
+        "-i", concat_file,
+        "-c", "copy", *tag_args, "-avoid_negative_ts", "make_zero",
+        output_path,
+    ]
+    ok, _ = await _run_ffmpeg(task, cmd, status_msg, duration=kept)
+    for tmp in (concat_file, bridge):
+        try:
+            if tmp:
                 os.remove(tmp)
-            except Exception:
-                pass
-
-        if total == 1:
-            task.output_name = out_name
-
-    return True
+        except Exception:
+            pass
+    if not ok:
+        return None
+    return _finish_output(task, total, out_name)
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -958,10 +1206,6 @@ async def process_remove_video(task, downloaded_files, status_msg) -> bool:
     If a video has multiple audio streams, each is extracted as a separate file.
     In copy mode, the actual codec is detected to pick the right container.
     """
-    fmt = task.audio_format or "mp3"
-    fmt_info = AUDIO_FORMAT_MAP.get(fmt, AUDIO_FORMAT_MAP["mp3"])
-    is_copy = fmt_info["codec"] == "copy"
-
     total = len(downloaded_files)
     output_base = os.path.splitext(task.output_name)[0]
 
@@ -970,85 +1214,10 @@ async def process_remove_video(task, downloaded_files, status_msg) -> bool:
     for i, (idx, path, msg) in enumerate(downloaded_files):
         if task.cancel_event.is_set():
             return False
-
-        await status_msg.edit_text(
-            f"🎵 **Extracting audio** {i + 1}/{total} — Task: `{task.task_id}`\n"
-            f"🔍 Probing audio streams..."
-        )
-
-        # Probe for audio stream count
-        audio_count = await _probe_audio_stream_count(path)
-        logger.info("Task %s: file %d has %d audio stream(s)", task.task_id, i, audio_count)
-
-        if audio_count <= 1:
-            # Single audio stream — simple extraction
-            # Determine extension
-            if is_copy:
-                codec = await _probe_audio_codec(path, 0)
-                ext = CODEC_TO_EXT.get(codec, ".mka")
-            else:
-                ext = fmt_info["ext"]
-
-            file_prefix = f"{output_base}_{i + 1}" if total > 1 else output_base
-            out_name = f"{file_prefix}{ext}"
-            output_path = os.path.join(task.work_dir, out_name)
-
-            await status_msg.edit_text(
-                f"🎵 **Extracting audio** {i + 1}/{total} — Task: `{task.task_id}`\n"
-                f"Format: {fmt}"
-            )
-
-            if is_copy:
-                cmd = ["ffmpeg", "-y", "-i", path, "-vn", "-c:a", "copy", output_path]
-            else:
-                cmd = ["ffmpeg", "-y", "-i", path, "-vn", "-c:a", fmt_info["codec"], output_path]
-
-            ok, _ = await _run_ffmpeg(task, cmd, status_msg)
-            if not ok:
-                return False
-            all_outputs.append(out_name)
-        else:
-            # Multi-audio — extract each stream separately
-            for a in range(audio_count):
-                if task.cancel_event.is_set():
-                    return False
-
-                # Determine extension per stream
-                if is_copy:
-                    codec = await _probe_audio_codec(path, a)
-                    ext = CODEC_TO_EXT.get(codec, ".mka")
-                else:
-                    ext = fmt_info["ext"]
-
-                file_prefix = f"{output_base}_{i + 1}" if total > 1 else output_base
-                out_name = f"{file_prefix}_audio{a + 1}{ext}"
-                output_path = os.path.join(task.work_dir, out_name)
-
-                await status_msg.edit_text(
-                    f"🎵 **Extracting audio** {i + 1}/{total} — "
-                    f"Stream {a + 1}/{audio_count} — Task: `{task.task_id}`\n"
-                    f"Format: {fmt}"
-                )
-
-                if is_copy:
-                    cmd = [
-                        "ffmpeg", "-y", "-i", path,
-                        "-map", f"0:a:{a}", "-vn", "-c:a", "copy",
-                        output_path,
-                    ]
-                else:
-                    cmd = [
-                        "ffmpeg", "-y", "-i", path,
-                        "-map", f"0:a:{a}", "-vn", "-c:a", fmt_info["codec"],
-                        output_path,
-                    ]
-
-                ok, _ = await _run_ffmpeg(task, cmd, status_msg)
-                if not ok:
-                    # Skip this stream but continue with others
-                    logger.warning("Task %s: stream %d failed, skipping", task.task_id, a)
-                    continue
-                all_outputs.append(out_name)
+        outputs = await remove_video_file(task, i, total, path, status_msg)
+        if outputs is None:
+            return False
+        all_outputs.extend(outputs)
 
     if not all_outputs:
         task.status = TaskStatus.FAILED
@@ -1066,24 +1235,99 @@ async def process_remove_video(task, downloaded_files, status_msg) -> bool:
     return True
 
 
-async def _probe_audio_stream_count(path: str) -> int:
-    """Use ffprobe to count audio streams in a file."""
-    cmd = [
-        "ffprobe", "-v", "quiet", "-print_format", "json",
-        "-show_streams", "-select_streams", "a", path,
-    ]
-    try:
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
+async def remove_video_file(task, i, total, path, status_msg):
+    """
+    Extract the audio track(s) of one input.
+    Returns the output names (may be empty), None on failure.
+    """
+    fmt = task.audio_format or "mp3"
+    fmt_info = AUDIO_FORMAT_MAP.get(fmt, AUDIO_FORMAT_MAP["mp3"])
+    is_copy = fmt_info["codec"] == "copy"
+    output_base = os.path.splitext(task.output_name)[0]
+    outputs = []
+
+    await status_msg.edit_text(
+        f"🎵 **Extracting audio** {i + 1}/{total} — Task: `{task.task_id}`\n"
+        f"🔍 Probing audio streams..."
+    )
+
+    # Probe for audio stream count
+    audio_count = await _probe_audio_stream_count(path)
+    logger.info("Task %s: file %d has %d audio stream(s)", task.task_id, i, audio_count)
+
+    if audio_count <= 1:
+        # Single audio stream — simple extraction
+        # Determine extension
+        if is_copy:
+            codec = await _probe_audio_codec(path, 0)
+            ext = CODEC_TO_EXT.get(codec, ".mka")
+        else:
+            ext = fmt_info["ext"]
+
+        file_prefix = f"{output_base}_{i + 1}" if total > 1 else output_base
+        out_name = f"{file_prefix}{ext}"
+        output_path = os.path.join(task.work_dir, out_name)
+
+        await status_msg.edit_text(
+            f"🎵 **Extracting audio** {i + 1}/{total} — Task: `{task.task_id}`\n"
+            f"Format: {fmt}"
+        )
+
+        if is_copy:
+            cmd = ["ffmpeg", "-y", "-i", path, "-vn", "-c:a", "copy", output_path]
+        else:
+            cmd = ["ffmpeg", "-y", "-i", path, "-vn", "-c:a", fmt_info["codec"], output_path]
+
+        ok, _ = await _run_ffmpeg(task, cmd, status_msg)
+        if not ok:
+            return None
+        outputs.append(out_name)
+    else:
+        # Multi-audio — one demux pass, one output per stream. ffmpeg
+        # reads the input once and feeds every encoder from it.
+        file_prefix = f"{output_base}_{i + 1}" if total > 1 else output_base
+        cmd = ["ffmpeg", "-y", "-i", path]
+        stream_outputs = []
+        for a in range(audio_count):
+            # Determine extension per stream
+            if is_copy:
+                codec = await _probe_audio_codec(path, a)
+                ext = CODEC_TO_EXT.get(codec, ".mka")
+            else:
+                ext = fmt_info["ext"]
+
+            out_name = f"{file_prefix}_audio{a + 1}{ext}"
+            cmd += [
+                "-map", f"0:a:{a}", "-vn", "-c:a", fmt_info["codec"],
+                os.path.join(task.work_dir, out_name),
+            ]
+            stream_outputs.append(out_name)
+
+        await status_msg.edit_text(
+            f"🎵 **Extracting audio** {i + 1}/{total} — "
+            f"{audio_count} streams in one pass — Task: `{task.task_id}`\n"
+            f"Format: {fmt}"
         )
-        stdout, _ = await proc.communicate()
-        info = json.loads(stdout.decode("utf-8", errors="replace"))
-        return len(info.get("streams", []))
-    except Exception as e:
-        logger.warning("ffprobe failed: %s", e)
+
+        ok, _ = await _run_ffmpeg(task, cmd, status_msg)
+        if not ok:
+            return None
+        for out_name in stream_outputs:
+            out_path = os.path.join(task.work_dir, out_name)
+            if os.path.isfile(out_path) and os.path.getsize(out_path) > 0:
+                outputs.append(out_name)
+            else:
+                logger.warning("Task %s: %s came out empty, skipping", task.task_id, out_name)
+
+    return outputs
+
+
+async def _probe_audio_stream_count(path: str) -> int:
+    """Count audio streams in a file (from the shared probe cache)."""
+    info = await probe_cache.probe(path)
+    if not info:
         return 1  # assume single audio
+    return len(probe_cache.streams(info, "audio"))
 
 
 # Codec name → container extension (for copy mode)
@@ -1094,24 +1338,10 @@ CODEC_TO_EXT = {
 
 
 async def _probe_audio_codec(path: str, stream_index: int = 0) -> str:
-    """Use ffprobe to detect the audio codec of a specific stream."""
-    cmd = [
-        "ffprobe", "-v", "quiet", "-print_format", "json",
-        "-show_streams", "-select_streams", f"a:{stream_index}", path,
-    ]
-    try:
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        stdout, _ = await proc.communicate()
-        info = json.loads(stdout.decode("utf-8", errors="replace"))
-        streams = info.get("streams", [])
-        if streams:
-            return streams[0].get("codec_name", "unknown")
-    except Exception as e:
-        logger.warning("ffprobe codec detection failed: %s", e)
+    """Detect the audio codec of a specific stream (from the shared probe cache)."""
+    audio = probe_cache.streams(await probe_cache.probe(path), "audio")
+    if stream_index < len(audio):
+        return audio[stream_index].get("codec_name", "unknown")
     return "unknown"
 
 
@@ -1122,31 +1352,198 @@ async def _probe_audio_codec(path: str, stream_index: int = 0) -> str:
 async def process_extract_video(task, downloaded_files, status_msg) -> bool:
     """Remove all audio streams, keep video only."""
     total = len(downloaded_files)
-    output_base = os.path.splitext(task.output_name)[0]
-    output_ext = os.path.splitext(task.output_name)[1] or ".mp4"
-
     for i, (idx, path, msg) in enumerate(downloaded_files):
         if task.cancel_event.is_set():
             return False
+        if await extract_video_file(task, i, total, path, status_msg) is None:
+            return False
 
-        out_name = f"{output_base}_{i + 1}{output_ext}" if total > 1 else task.output_name
-        output_path = os.path.join(task.work_dir, out_name)
+    return True
 
-        await status_msg.edit_text(
-            f"🎬 **Extracting video** {i + 1}/{total} — Task: `{task.task_id}`\n"
-            f"Removing all audio streams..."
-        )
 
-        cmd = [
-            "ffmpeg", "-y", "-i", path,
-            "-an", "-c:v", "copy", output_path,
-        ]
+async def extract_video_file(task, i, total, path, status_msg):
+    """Strip audio from one input. Returns its output names, None on failure."""
+    output_base = os.path.splitext(task.output_name)[0]
+    output_ext = os.path.splitext(task.output_name)[1] or ".mp4"
 
-        ok, _ = await _run_ffmpeg(task, cmd, status_msg)
-        if not ok:
-            return False
+    out_name = f"{output_base}_{i + 1}{output_ext}" if total > 1 else task.output_name
+    output_path = os.path.join(task.work_dir, out_name)
 
-        if total == 1:
-            task.output_name = out_name
+    await status_msg.edit_text(
+        f"🎬 **Extracting video** {i + 1}/{total} — Task: `{task.task_id}`\n"
+        f"Removing all audio streams..."
+    )
 
-    return True
+    cmd = [
+        "ffmpeg", "-y", "-i", path,
+        "-an", "-c:v", "copy", output_path,
+    ]
+
+    ok, _ = await _run_ffmpeg(task, cmd, status_msg)
+    if not ok:
+        return None
+    return _finish_output(task, total, out_name)
+
+
+# ═══════════════════════════════════════════════════════════════
+#  BATCH PIPELINE — download → process → upload per file
+# ═══════════════════════════════════════════════════════════════
+
+PER_FILE_TOOLS = {
+    "cv": compress_file,
+    "wv": watermark_file,
+    "tv": trim_file,
+    "cut": cut_file,
+    "rv": remove_video_file,
+    "ev": extract_video_file,
+}
+
+
+class _StatusLine:
+    """Stands in for status_msg inside one file's pipeline; edits feed the board."""
+
+    def __init__(self, board, index: int):
+        self._board = board
+        self._index = index
+
+    async def edit_text(self, text, *args, **kwargs):
+        self._board.set(self._index, text)
+
+
+class _StatusBoard:
+    """One status message showing a line per file, redrawn every few seconds."""
+
+    REDRAW_INTERVAL = 5
+    LINE_LIMIT = 300
+
+    def __init__(self, status_msg, task_id: str, total: int):
+        self._msg = status_msg
+        self._task_id = task_id
+        self._lines = ["⏳ Waiting for download"] * total
+        self._dirty = asyncio.Event()
+
+    def line(self, index: int) -> _StatusLine:
+        return _StatusLine(self, index)
+
+    def set(self, index: int, text: str):
+        text = " — ".join(part.strip() for part in str(text).splitlines() if part.strip())
+        self._lines[index] = text[:self.LINE_LIMIT]
+        self._dirty.set()
+
+    async def run(self):
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            body = "\n".join(f"**{n + 1}.** {line}" for n, line in enumerate(self._lines))
+            try:
+                await self._msg.edit_text(f"📦 **Batch** — Task: `{self._task_id}`\n\n{body}"[:4000])
+            except Exception:
+                pass
+            await asyncio.sleep(self.REDRAW_INTERVAL)
+
+
+class FilePipeline:
+    """
+    Run a per-file tool over a multi-file task as each download lands.
+    Up to LEECH_PIPELINE_CONCURRENCY files are processed at once (their
+    ffmpeg jobs still queue in the shared scheduler), and every output is
+    uploaded as soon as it and all earlier files' outputs are sent, so the
+    chat keeps the original order.
+    """
+
+    def __init__(self, client, task: LeechTask, status_msg, tool_fn, total: int):
+        self.client = client
+        self.task = task
+        self.tool_fn = tool_fn
+        self.total = total
+        self.board = _StatusBoard(status_msg, task.task_id, total)
+        self.downloaded = []
+        self._slots = asyncio.Semaphore(max(1, Var.LEECH_PIPELINE_CONCURRENCY))
+        self._turns = [asyncio.Event() for _ in range(total)]
+        if total:
+            self._turns[0].set()
+        self._jobs = []
+
+    def add(self, index: int, download):
+        """Attach the download task of file `index`; processing starts when it finishes."""
+        self._jobs.append(asyncio.ensure_future(self._run(index, download)))
+
+    async def _run(self, index: int, download):
+        line = self.board.line(index)
+        job = {"error": ""}
+        _pipeline_job.set(job)
+        try:
+            if index in self.task.uploaded_indices:
+                self.downloaded.append(await download)
+                await line.edit_text("✅ Done (before restart)")
+                await self._turns[index].wait()
+                return
+            await line.edit_text("⬇️ Downloading...")
+            idx, path, msg = await download
+            if not path:
+                raise RuntimeError(f"File {index + 1}: download returned nothing")
+            self.downloaded.append((idx, path, msg))
+
+            async with self._slots:
+                outputs = await self.tool_fn(self.task, index, self.total, path, line)
+            if outputs is None:
+                error = f"File {index + 1}: processing failed"
+                if job["error"]:
+                    error += f"\n{job['error']}"
+                raise RuntimeError(error)
+
+            await self._turns[index].wait()
+            for n, fname in enumerate(outputs):
+                await line.edit_text(f"⬆️ Uploading {n + 1}/{len(outputs)} — `{fname}`")
+                await _upload_output(
+                    self.client, self.task, fname, os.path.join(self.task.work_dir, fname)
+                )
+            self.task.uploaded_indices.append(index)
+            save_task_state(self.task)
+            await line.edit_text(f"✅ Done ({len(outputs)} file(s))" if outputs else "⚠️ No output")
+        finally:
+            if index + 1 < self.total:
+                self._turns[index + 1].set()
+
+    async def wait(self) -> bool:
+        """True once every file is processed and uploaded; False on failure/cancel."""
+        redraw = asyncio.ensure_future(self.board.run())
+        cancelled = asyncio.ensure_future(self.task.cancel_event.wait())
+        pending = set(self._jobs)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending | {cancelled}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if cancelled in done:
+                    raise asyncio.CancelledError()
+                pending.discard(cancelled)
+                for job in done:
+                    if job.exception() is not None:
+                        raise job.exception()
+            return True
+        except asyncio.CancelledError:
+            return False
+        except Exception as e:
+            logger.error("Task %s: batch pipeline failed: %s", self.task.task_id, e)
+            # Stop the other files first so nothing still writes into the
+            # work dir (the caller removes it) or redraws over this message.
+            await self._stop(redraw, cancelled)
+            if not self.task.cancel_event.is_set():
+                self.task.status = TaskStatus.FAILED
+                try:
+                    await self.board._msg.edit_text(
+                        f"❌ **Batch failed** — Task: `{self.task.task_id}`\n```\n{e}\n```"[:4000]
+                    )
+                except Exception:
+                    pass
+            return False
+        finally:
+            await self._stop(redraw, cancelled)
+
+    async def _stop(self, *watchers):
+        for job in self._jobs:
+            job.cancel()
+        await asyncio.gather(*self._jobs, return_exceptions=True)
+        for watcher in watchers:
+            watcher.cancel()
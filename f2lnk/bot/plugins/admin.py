@@ -15,6 +15,7 @@ from f2lnk.bot import StreamBot, last_file_for_test
 from f2lnk.utils.broadcast_helper import send_msg
 from f2lnk.utils.database import Database
 from f2lnk.utils.human_readable import humanbytes
+from f2lnk.utils.disk_budget import disk_budget
 from f2lnk.vars import Var
 from f2lnk.utils.file_properties import get_name, get_hash, get_media_from_message
 
@@ -277,6 +278,26 @@ async def speed_test(c: Client, m: Message):
     )
     await msg.edit(result_text)
 
+@StreamBot.on_message(filters.command("disk") & filters.private & filters.user(Var.OWNER_ID))
+async def disk_status(c: Client, m: Message):
+    snap = disk_budget.snapshot()
+    text = (
+        f"💾 **Disk**\n\n"
+        f"**Free:** `{humanbytes(snap['free'])}` of `{humanbytes(snap['total'])}`\n"
+        f"**Reserved:** `{humanbytes(snap['reserved'])}`"
+    )
+    if snap['budget']:
+        text += f" of `{humanbytes(snap['budget'])}` budget"
+    if snap['active']:
+        text += "\n\n**Running:**\n" + "\n".join(
+            f"• {r['label']} — `{humanbytes(r['bytes'])}`, {r['age'] // 60}m" for r in snap['active']
+        )
+    if snap['waiting']:
+        text += "\n\n**Waiting for space:**\n" + "\n".join(
+            f"• {r['label']} — `{humanbytes(r['bytes'])}`, {r['age'] // 60}m" for r in snap['waiting']
+        )
+    await m.reply_text(text, quote=True)
+
 # --- NEW AND IMPROVED /batch COMMAND ---
 @StreamBot.on_message(filters.command("batch") & filters.private & filters.user(Var.OWNER_ID))
 async def batch_link_generator(c: Client, m: Message):
@@ -178,7 +178,8 @@ async def help_cd(b, m):
         "`-i 5` — Number of files to collect\n"
         "`-m output` — Output filename\n"
         "`-start 00:01:00` — Start time (trim/cut)\n"
-        "`-end 00:02:30` — End time (trim/cut)\n\n"
+        "`-end 00:02:30` — End time (trim/cut)\n"
+        "`-stream` — Process while downloading (cv/wv/rv/ev)\n\n"
 
         "**10 Tools:**\n"
         "`-vt` **Merge Videos** — Concatenate into one\n"
@@ -21,7 +21,8 @@ from f2lnk.bot import StreamBot
 from f2lnk.vars import Var
 from f2lnk.utils.database import Database
 from f2lnk.utils.human_readable import humanbytes
-from f2lnk.utils.split_upload import upload_file_or_split
+from f2lnk.utils.split_upload import upload_files_ordered
+from f2lnk.utils.ffmpeg_runner import run_ffmpeg
 
 logger = logging.getLogger(__name__)
 db = Database(Var.DATABASE_URL, Var.name)
@@ -163,7 +164,8 @@ _MEDIA_PATTERNS = [
 
 
 async def _try_scrape_and_download(url: str, out_dir: str,
-                                   status_msg: Message) -> list:
+                                   status_msg: Message,
+                                   user_id: int = None) -> list:
     """
     Scrape the page HTML for video URLs, then download the best one found.
     Uses browser headers + cookies for maximum compatibility.
@@ -230,7 +232,7 @@ async def _try_scrape_and_download(url: str, out_dir: str,
         if is_hls:
             # Use ffmpeg for HLS
             files = await _download_hls(media_url, out_dir, status_msg,
-                                        headers)
+                                        headers, user_id)
             if files:
                 return files
         else:
@@ -244,7 +246,8 @@ async def _try_scrape_and_download(url: str, out_dir: str,
 
 
 async def _download_hls(stream_url: str, out_dir: str,
-                        status_msg: Message, headers: dict) -> list:
+                        status_msg: Message, headers: dict,
+                        user_id: int = None) -> list:
     """Download HLS stream using ffmpeg."""
     try:
         await status_msg.edit_text(
@@ -259,7 +262,7 @@ async def _download_hls(stream_url: str, out_dir: str,
     fname = "video.mp4"
     fpath = os.path.join(out_dir, fname)
 
-    proc = await asyncio.create_subprocess_exec(
+    cmd = [
         "ffmpeg", "-y",
         "-headers", header_str,
         "-i", stream_url,
@@ -267,13 +270,11 @@ async def _download_hls(stream_url: str, out_dir: str,
         "-b:a", "128k", "-crf", "23",
         "-movflags", "+faststart",
         fpath,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    _, stderr = await proc.communicate()
-    if proc.returncode != 0:
-        logger.warning("FFmpeg HLS failed: %s",
-                       stderr.decode(errors="replace")[-200:])
+    ]
+    returncode, stderr_text = await run_ffmpeg(
+        cmd, user_id=user_id, status_msg=status_msg, label="HLS download")
+    if returncode != 0:
+        logger.warning("FFmpeg HLS failed: %s", stderr_text[-200:])
         return []
     if os.path.exists(fpath) and os.path.getsize(fpath) > 0:
         return [fpath]
@@ -437,7 +438,7 @@ async def process_jl_task(client: Client, message: Message, page_url: str):
             await status_msg.edit_text(
                 "⬇️ **yt-dlp failed, trying page scraping...**")
             downloaded_files = await _try_scrape_and_download(
-                page_url, temp_dir, status_msg)
+                page_url, temp_dir, status_msg, message.from_user.id)
 
         # ── STRATEGY 3: Direct download ──
         if not downloaded_files:
@@ -468,38 +469,37 @@ async def process_jl_task(client: Client, message: Message, page_url: str):
             filename = custom_name
 
         # ── Upload ──
+        # Footer
+        try:
+            user_info = await db.get_user_info(message.from_user.id)
+            footer = user_info.get("footer", "")
+        except Exception:
+            footer = ""
+
         total = len(downloaded_files)
-        for i, fp in enumerate(downloaded_files):
+        uploads = []
+        for fp in downloaded_files:
             fname = os.path.basename(fp)
-            fsize = os.path.getsize(fp)
-
-            try:
-                await status_msg.edit_text(
-                    f"⬆️ **Uploading** {i+1}/{total}: `{fname}`\n"
-                    f"📦 Size: `{humanbytes(fsize)}`")
-            except Exception:
-                pass
-
-            # Footer
-            try:
-                user_info = await db.get_user_info(message.from_user.id)
-                footer = user_info.get("footer", "")
-            except Exception:
-                footer = ""
-
             caption = f"**{fname}**"
             if footer:
                 caption += f"\n\n{footer}"
+            uploads.append((fp, caption, fname))
 
-            try:
-                await upload_file_or_split(
-                    client, message.chat.id, fp,
-                    caption=caption, file_name=fname,
-                    reply_to=message.id,
-                )
-            except Exception as e:
+        try:
+            await status_msg.edit_text(
+                f"⬆️ **Uploading** {total} file(s)\n"
+                f"📦 Size: `{humanbytes(sum(os.path.getsize(fp) for fp in downloaded_files))}`")
+        except Exception:
+            pass
+
+        # Files upload concurrently across clients but arrive in order
+        results = await upload_files_ordered(
+            client, message.chat.id, uploads, reply_to=message.id,
+        )
+        for (_fp, _caption, fname), result in zip(uploads, results):
+            if isinstance(result, Exception):
                 await message.reply_text(
-                    f"❌ Upload failed for `{fname}`: `{e}`")
+                    f"❌ Upload failed for `{fname}`: `{result}`")
 
         try:
             await status_msg.delete()
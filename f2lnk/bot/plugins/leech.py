@@ -29,6 +29,7 @@ from pyromod.exceptions import ListenerTimeout
 from f2lnk.bot import StreamBot
 from f2lnk.vars import Var
 from f2lnk.utils.human_readable import humanbytes
+from f2lnk.utils.file_properties import get_media_file_size, get_name
 from f2lnk.bot.task_manager import (
     LeechTask,
     TaskStatus,
@@ -38,6 +39,10 @@ from f2lnk.bot.task_manager import (
     generate_task_id,
     get_task,
     register_task,
+    save_task_state,
+    delete_task_state,
+    load_task_states,
+    RESUMABLE_STATES,
     remove_task,
     cancel_task,
     cleanup_task_files,
@@ -54,14 +59,18 @@ from f2lnk.bot.leech_tools import (
     process_remove_video,
     process_extract_video,
     upload_batch_results,
+    PER_FILE_TOOLS,
+    FilePipeline,
 )
 from f2lnk.utils.split_upload import upload_file_or_split
+from f2lnk.utils.adaptive_download import downloader
+from f2lnk.utils.tg_downloader import download_file
+from f2lnk.utils.stream_input import STREAM_TOOLS, stream_url_for, is_stream_url
+from f2lnk.utils.bin_index import known_bin_copy, remember_bin_copy
+from f2lnk.utils.disk_budget import disk_budget, estimate_footprint, wait_notifier, DiskBudgetError
 
 logger = logging.getLogger(__name__)
 
-STAGGER_DELAY = 5
-
-
 # ═══════════════════════════════════════════════════════════════
 #  HELPERS
 # ═══════════════════════════════════════════════════════════════
@@ -82,7 +91,7 @@ FLAG_TO_TOOL = {
 
 
 def _parse_leech_args(text: str):
-    """Parse /leech flags. Returns (file_count, output_name, suggested_tool, start_time, end_time)."""
+    """Parse /leech flags. Returns (file_count, output_name, suggested_tool, start_time, end_time, stream)."""
     file_count = None
     output_name = None
     suggested_tool = DEFAULT_TOOL
@@ -111,12 +120,23 @@ def _parse_leech_args(text: str):
             suggested_tool = tool_key
             break
 
+    stream = bool(re.search(r"(?:^|\s)-stream\b", text))
+
     if not file_count or file_count < 1:
         raise ValueError("File count (-i) must be at least 1.")
     if not output_name:
         raise ValueError("Output name (-m) is required.")
 
-    return file_count, output_name, suggested_tool, start_time, end_time
+    return file_count, output_name, suggested_tool, start_time, end_time, stream
+
+
+def _use_batch_upload(tool: str, file_count: int) -> bool:
+    """RV always uses batch upload (multi-audio → multiple outputs from 1 file)."""
+    return (tool in ("cv", "wv", "ev", "cut") and file_count > 1) or tool == "rv"
+
+
+async def _already_done(index: int, file_msg):
+    return index, "", file_msg
 
 
 def _is_media_message(msg: Message) -> bool:
@@ -300,7 +320,8 @@ async def leech_command(client: Client, m: Message):
             "`-aa` Audio+Audio  `-vs` Video+Subtitle\n"
             "`-cv` Compress     `-wv` Watermark\n"
             "`-tv` Trim         `-cut` Cut\n"
-            "`-rv` Extract Audio `-ev` Extract Video",
+            "`-rv` Extract Audio `-ev` Extract Video\n\n"
+            "Add `-stream` to `-cv`/`-wv`/`-rv`/`-ev` to process while downloading.",
             quote=True,
         )
         return
@@ -312,7 +333,7 @@ async def leech_command(client: Client, m: Message):
 
     # ── Parse command ──
     try:
-        file_count, output_name, suggested_tool, start_time, end_time = _parse_leech_args(m.text)
+        file_count, output_name, suggested_tool, start_time, end_time, stream = _parse_leech_args(m.text)
     except ValueError as e:
         await m.reply_text(
             f"❌ **Invalid command.**\n`{e}`\n\n"
@@ -346,6 +367,7 @@ async def leech_command(client: Client, m: Message):
         suggested_tool=suggested_tool,
     )
     task.file_messages = file_messages
+    task.stream_input = stream
     if start_time:
         task.start_time = start_time
     if end_time:
@@ -424,16 +446,63 @@ async def leech_command(client: Client, m: Message):
     if task.status == TaskStatus.CANCELLED:
         return
 
+    await _execute_task(client, task)
+
+
+async def _execute_task(client: Client, task: LeechTask):
+    """
+    Run a confirmed task once its disk footprint fits (queued otherwise).
+    Also the entry point for tasks resumed after a restart.
+    """
+    tool = (task.selected_tool or "").strip()
+    input_bytes = sum(get_media_file_size(msg) for msg in task.file_messages)
+    needed = estimate_footprint(
+        input_bytes, tool, inputs_on_disk=not (task.stream_input and tool in STREAM_TOOLS)
+    )
+
+    on_wait = wait_notifier(
+        lambda text: client.send_message(task.chat_id, text), f"Task: `{task.task_id}`"
+    )
+    # Confirmed tasks survive a restart even while queued for disk space.
+    save_task_state(task)
+    try:
+        async with disk_budget.reserve(
+            needed, f"/l {task.task_id} ({tool})", task.work_dir,
+            on_wait=on_wait, cancel_event=task.cancel_event,
+        ) as reservation:
+            if reservation is None:
+                return
+            await _execute_stages(client, task)
+    except DiskBudgetError as e:
+        task.status = TaskStatus.FAILED
+        await client.send_message(task.chat_id, f"❌ Task `{task.task_id}` can't run: {e}")
+        cleanup_task_files(task)
+        remove_task(task.task_id)
+
+
+async def _execute_stages(client: Client, task: LeechTask):
+    """
+    Download, process and upload a task. Files and uploads recorded in the
+    task state (see resume_leech_tasks) are skipped.
+    """
+    task_id = task.task_id
+    file_count = task.file_count
 
-    # ── Staggered parallel downloads ──
-    task.status = TaskStatus.DOWNLOADING
+    # ── Parallel downloads (concurrency tuned by the adaptive downloader) ──
+    resuming_upload = task.status == TaskStatus.UPLOADING
+    if not resuming_upload:
+        task.status = TaskStatus.DOWNLOADING
+    save_task_state(task)
     status_msg = await client.send_message(
-        m.chat.id,
-        f"⬇️ **Downloading {file_count} files** ({STAGGER_DELAY}s apart)...\n"
+        task.chat_id,
+        f"⬇️ **Downloading {file_count} files**...\n"
         f"Task: `{task_id}`",
     )
 
     async def _download_one(index, file_msg):
+        done_path = task.completed_downloads.get(str(index))
+        if done_path and os.path.isfile(done_path):
+            return index, done_path, file_msg
         orig_name = ""
         if file_msg.video and file_msg.video.file_name:
             orig_name = file_msg.video.file_name
@@ -443,28 +512,53 @@ async def leech_command(client: Client, m: Message):
             orig_name = file_msg.document.file_name
         else:
             orig_name = f"file_{index}"
+        if stream_input:
+            # ffmpeg reads the loopback stream; nothing is written here.
+            return index, await stream_url_for(file_msg), file_msg
         unique_name = f"{index:03d}_{orig_name}"
         save_path = os.path.join(task.work_dir, unique_name)
-        path = await client.download_media(file_msg, file_name=save_path)
+        path = await downloader.download(client, file_msg, save_path)
+        if path:
+            task.completed_downloads[str(index)] = path
+            save_task_state(task)
         return index, path, file_msg
 
+    # Per-file tools on several files: process and upload each file as soon
+    # as it lands instead of waiting for the whole batch.
+    tool = (task.selected_tool or "").strip()
+    stream_input = task.stream_input and tool in STREAM_TOOLS
+    pipeline = None
+    if tool in PER_FILE_TOOLS and file_count > 1:
+        pipeline = FilePipeline(client, task, status_msg, PER_FILE_TOOLS[tool], file_count)
+
     for i, fmsg in enumerate(task.file_messages):
         if task.cancel_event.is_set():
             break
+        if pipeline is not None and i in task.uploaded_indices:
+            # Finished before a restart — keep its place in the upload order.
+            pipeline.add(i, _already_done(i, fmsg))
+            continue
         dl_task = asyncio.create_task(_download_one(i, fmsg))
         task.download_tasks.append(dl_task)
-        try:
+        if pipeline is not None:
+            pipeline.add(i, dl_task)
+            task.status = TaskStatus.PROCESSING
+
+    if pipeline is not None:
+        ok = await pipeline.wait()
+        if task.cancel_event.is_set():
+            return
+        if ok:
+            task.status = TaskStatus.COMPLETED
             await status_msg.edit_text(
-                f"⬇️ **Downloading** — Task: `{task_id}`\n"
-                f"📥 Started: {i + 1}/{file_count}"
+                f"🎉 **Task `{task_id}` completed!**\n📁 Uploaded successfully."
             )
-        except Exception:
-            pass
-        if i < file_count - 1:
-            for _ in range(STAGGER_DELAY):
-                if task.cancel_event.is_set():
-                    break
-                await asyncio.sleep(1)
+            await _dump_task_log(client, task, sorted(pipeline.downloaded, key=lambda x: x[0]))
+            cleanup_task_files(task)
+        else:
+            cleanup_task_files(task)
+            remove_task(task_id)
+        return
 
     if task.cancel_event.is_set():
         return
@@ -504,7 +598,6 @@ async def leech_command(client: Client, m: Message):
 
     # ── Route to tool processor ──
     task.status = TaskStatus.PROCESSING
-    tool = (task.selected_tool or "").strip()
     logger.info("Task %s: routing to tool '%s' (repr=%r)", task_id, tool, tool)
 
     # Dict dispatch — more robust than elif chain
@@ -532,15 +625,20 @@ async def leech_command(client: Client, m: Message):
         remove_task(task_id)
         return
 
-    ok = await handler()
+    single_output = os.path.join(task.work_dir, task.output_name)
+    if resuming_upload and (_use_batch_upload(tool, file_count) or os.path.isfile(single_output)):
+        # Processing finished before the restart; only the upload is left.
+        ok = True
+    else:
+        ok = await handler()
 
     if not ok or task.cancel_event.is_set():
         return
+    task.status = TaskStatus.UPLOADING
+    save_task_state(task)
 
     # ── Upload ──
-    # RV always uses batch upload (multi-audio → multiple outputs from 1 file)
-    use_batch = (tool in ("cv", "wv", "ev", "cut") and file_count > 1) or tool == "rv"
-    if use_batch:
+    if _use_batch_upload(tool, file_count):
         # Batch tools produce multiple files
         upload_ok = await upload_batch_results(client, task, status_msg)
     else:
@@ -557,10 +655,11 @@ async def leech_command(client: Client, m: Message):
                 f"📦 Size: `{humanbytes(file_size)}`\n"
                 f"🆔 Task: `{task_id}`"
             )
-            await upload_file_or_split(
+            sent = await upload_file_or_split(
                 client, task.chat_id, output_path,
                 caption=caption, file_name=task.output_name,
             )
+            task.uploaded_messages.extend(sent)
             upload_ok = True
         except Exception as e:
             task.status = TaskStatus.FAILED
@@ -681,8 +780,8 @@ async def _config_watermark(client, m, task):
 
     if wm_msg.photo:
         task.watermark_type = "image"
-        img_path = await client.download_media(
-            wm_msg, file_name=os.path.join(task.work_dir, "watermark.png")
+        img_path = await download_file(
+            client, wm_msg, file_name=os.path.join(task.work_dir, "watermark.png")
         )
         task.watermark_image_path = img_path
         await client.send_message(m.chat.id, "✅ Image watermark received!")
@@ -1093,7 +1192,13 @@ async def _handle_inline_cancel(client, msg, task):
 # ═══════════════════════════════════════════════════════════════
 
 async def _dump_task_log(client: Client, task: LeechTask, downloaded_files: list):
-    """Forward task completion log + input/output files to BIN_CHANNEL."""
+    """
+    Post the task log to BIN_CHANNEL, then forward the input files and the
+    output messages the user already received in one batched call —
+    nothing is uploaded a second time. Media already stored in the channel
+    (split parts staged there, earlier forwards) is referenced by message
+    id instead of being forwarded again.
+    """
     try:
         duration = int(time.time() - task.created_at)
         job_hash = hashlib.md5(f"{task.task_id}{task.created_at}".encode()).hexdigest()[:8]
@@ -1104,11 +1209,14 @@ async def _dump_task_log(client: Client, task: LeechTask, downloaded_files: list
         input_names = []
         input_sizes = []
         for idx, path, msg in downloaded_files:
-            fname = os.path.basename(path)
-            try:
-                fsize = os.path.getsize(path)
-            except Exception:
-                fsize = 0
+            if not path or is_stream_url(path):
+                fname, fsize = get_name(msg), get_media_file_size(msg)
+            else:
+                fname = os.path.basename(path)
+                try:
+                    fsize = os.path.getsize(path)
+                except Exception:
+                    fsize = 0
             input_names.append(fname)
             input_sizes.append(fsize)
 
@@ -1117,19 +1225,10 @@ async def _dump_task_log(client: Client, task: LeechTask, downloaded_files: list
         if len(input_names) > 3:
             input_display += f" (+{len(input_names) - 3} more)"
 
-        # Output files info
-        output_files = []
-        total_output_size = 0
-        if os.path.exists(task.work_dir):
-            for f in os.listdir(task.work_dir):
-                fp = os.path.join(task.work_dir, f)
-                if os.path.isfile(fp) and not f.startswith("."):
-                    try:
-                        sz = os.path.getsize(fp)
-                    except Exception:
-                        sz = 0
-                    output_files.append((f, fp, sz))
-                    total_output_size += sz
+        # Output info comes from the messages sent to the user
+        total_output_size = sum(
+            get_media_file_size(msg) for msg in task.uploaded_messages if msg
+        )
 
         log_text = (
             f"🆔 **Task:** `{task.task_id}`\n"
@@ -1144,29 +1243,90 @@ async def _dump_task_log(client: Client, task: LeechTask, downloaded_files: list
             f"#{task.selected_tool} #completed #task_{task.task_id} #uid_{task.user_id}"
         )
 
+        # Forward inputs + outputs server-side, batched per source chat,
+        # skipping media the channel already holds
+        by_chat = {}
+        stored = []
+        for msg in [m for _, _, m in downloaded_files] + task.uploaded_messages:
+            if msg is None or msg.chat is None:
+                continue
+            bin_msg_id = await known_bin_copy(msg)
+            if bin_msg_id:
+                stored.append(bin_msg_id)
+                continue
+            by_chat.setdefault(msg.chat.id, []).append(msg.id)
+        if stored:
+            log_text += "\n🗂 **Stored as:** " + ", ".join(f"`{i}`" for i in stored)
+
         # Send log text to BIN_CHANNEL
-        log_msg = await client.send_message(Var.BIN_CHANNEL, log_text)
+        await client.send_message(Var.BIN_CHANNEL, log_text)
+
+        for chat_id, msg_ids in by_chat.items():
+            for i in range(0, len(msg_ids), 100):  # API limit per call
+                try:
+                    forwarded = await client.forward_messages(
+                        Var.BIN_CHANNEL, chat_id, msg_ids[i:i + 100],
+                    )
+                except Exception as e:
+                    logger.warning("Failed to forward task files to BIN_CHANNEL: %s", e)
+                    continue
+                if not isinstance(forwarded, list):
+                    forwarded = [forwarded]
+                for fwd in forwarded:
+                    await remember_bin_copy(fwd)
+
+    except Exception as e:
+        logger.error("Task dump log failed for %s: %s", task.task_id, e)
 
-        # Forward input files to BIN_CHANNEL
-        for idx, path, msg in downloaded_files:
-            try:
-                await msg.forward(chat_id=Var.BIN_CHANNEL)
-            except Exception as e:
-                logger.warning("Failed to forward input file: %s", e)
 
-        # Upload output files to BIN_CHANNEL
-        for fname, fp, sz in output_files:
+# ═══════════════════════════════════════════════════════════════
+#  RESUME AFTER RESTART
+# ═══════════════════════════════════════════════════════════════
+
+async def resume_leech_tasks(client: Client):
+    """
+    Restart tasks saved by the previous run (called once at startup).
+    Downloads already on disk, pipeline files already sent and finished
+    processing are skipped; half-downloaded files continue from their
+    .resume sidecar.
+    """
+    for task, file_ids, uploaded_refs in load_task_states():
+        if task.status not in RESUMABLE_STATES:
+            delete_task_state(task.task_id)
+            continue
+        try:
+            messages = await client.get_messages(task.chat_id, file_ids)
+            if any(msg is None or msg.empty for msg in messages):
+                raise ValueError("some input files were deleted")
+            task.file_messages = list(messages)
+
+            by_chat = {}
+            for chat_id, msg_id in uploaded_refs:
+                by_chat.setdefault(chat_id, []).append(msg_id)
+            for chat_id, msg_ids in by_chat.items():
+                sent = await client.get_messages(chat_id, msg_ids)
+                task.uploaded_messages.extend(msg for msg in sent if msg and not msg.empty)
+        except Exception as e:
+            logger.warning("Task %s can't be resumed: %s", task.task_id, e)
+            cleanup_task_files(task)
             try:
-                ext = os.path.splitext(fname)[1].lower()
-                caption = f"📤 **Output** | Task: `{task.task_id}`\n📁 `{fname}` ({humanbytes(sz)})"
-                if ext in (".mp4", ".mkv", ".avi", ".webm", ".mov", ".flv", ".ts"):
-                    await client.send_video(Var.BIN_CHANNEL, fp, caption=caption, file_name=fname)
-                elif ext in (".mp3", ".aac", ".ogg", ".flac", ".wav", ".m4a", ".opus", ".mka"):
-                    await client.send_audio(Var.BIN_CHANNEL, fp, caption=caption, file_name=fname)
-                else:
-                    await client.send_document(Var.BIN_CHANNEL, fp, caption=caption, file_name=fname)
-            except Exception as e:
-                logger.warning("Failed to upload output %s to BIN_CHANNEL: %s", fname, e)
+                await client.send_message(
+                    task.chat_id,
+                    f"❌ Task `{task.task_id}` was interrupted by a restart and "
+                    f"could not be resumed: `{e}`",
+                )
+            except Exception:
+                pass
+            continue
 
-    except Exception as e:
-        logger.error("Task dump log failed for %s: %s", task.task_id, e)
+        register_task(task)
+        logger.info("Resuming task %s at %s", task.task_id, task.status.value)
+        try:
+            await client.send_message(
+                task.chat_id,
+                f"♻️ **Resuming task `{task.task_id}`** after a restart...\n"
+                f"Use `/cancel {task.task_id}` to stop it.",
+            )
+        except Exception:
+            pass
+        asyncio.create_task(_execute_task(client, task))
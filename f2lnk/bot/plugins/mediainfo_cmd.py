@@ -10,9 +10,13 @@ from pyrogram import filters, Client
 from pyrogram.types import Message
 
 from f2lnk.bot import StreamBot
+from f2lnk.utils.tg_downloader import download_file
+from f2lnk.utils.file_properties import get_media_file_size
+from f2lnk.utils.disk_budget import disk_budget, estimate_footprint, wait_notifier
 
 
 TEMP_DIR = "./mediainfo_temp"
+URL_PROBE_BYTES = 50 * 1024 * 1024     # enough for mediainfo header analysis
 
 
 def _work_dir(user_id: int) -> str:
@@ -34,7 +38,15 @@ async def _run_mediainfo(file_path: str) -> str:
     return stdout.decode("utf-8", errors="replace")
 
 
-async def _download_url_partial(url: str, dest_dir: str, max_bytes: int = 50 * 1024 * 1024) -> str:
+async def _hold(work_dir: str, nbytes: int, status: Message):
+    # Held until the handler's finally releases work_dir (also keeps the janitor out).
+    await disk_budget.hold(
+        work_dir, estimate_footprint(nbytes, "probe"), "/mediainfo",
+        path=work_dir, on_wait=wait_notifier(status.edit_text, "/mediainfo"),
+    )
+
+
+async def _download_url_partial(url: str, dest_dir: str, max_bytes: int = URL_PROBE_BYTES) -> str:
     """Download up to max_bytes from URL (enough for mediainfo header analysis)."""
     async with aiohttp.ClientSession() as session:
         async with session.get(url, timeout=aiohttp.ClientTimeout(total=120)) as resp:
@@ -75,8 +87,10 @@ async def mediainfo_cmd(client: Client, m: Message):
             or m.reply_to_message.audio
             or m.reply_to_message.photo
         ):
+            await _hold(work_dir, get_media_file_size(m.reply_to_message) or 0, status)
             await status.edit_text("⬇️ Downloading file for analysis...")
-            file_path = await client.download_media(
+            file_path = await download_file(
+                client,
                 m.reply_to_message,
                 file_name=os.path.join(work_dir, ""),
             )
@@ -87,6 +101,7 @@ async def mediainfo_cmd(client: Client, m: Message):
             if not url.startswith(("http://", "https://")):
                 await status.edit_text("❌ Invalid URL. Please provide a valid HTTP/HTTPS link.")
                 return
+            await _hold(work_dir, URL_PROBE_BYTES, status)
             await status.edit_text("⬇️ Downloading from URL for analysis...")
             file_path = await _download_url_partial(url, work_dir)
 
@@ -96,6 +111,7 @@ async def mediainfo_cmd(client: Client, m: Message):
             if not url.startswith(("http://", "https://")):
                 await status.edit_text("❌ Replied message is not a valid URL. Please reply to a file or provide a URL.")
                 return
+            await _hold(work_dir, URL_PROBE_BYTES, status)
             await status.edit_text("⬇️ Downloading from URL for analysis...")
             file_path = await _download_url_partial(url, work_dir)
 
@@ -140,3 +156,4 @@ async def mediainfo_cmd(client: Client, m: Message):
     finally:
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
+        await disk_budget.release(work_dir)
@@ -13,7 +13,9 @@ from pyrogram.types import Message
 from f2lnk.bot import StreamBot
 from f2lnk.vars import Var
 from f2lnk.utils.human_readable import humanbytes
-from f2lnk.utils.split_upload import upload_file_or_split
+from f2lnk.utils.split_upload import upload_files_ordered
+from f2lnk.utils.tg_downloader import download_file
+from f2lnk.utils.disk_budget import disk_budget, estimate_footprint, wait_notifier
 
 logger = logging.getLogger(__name__)
 
@@ -72,7 +74,8 @@ async def qbl_command(client: Client, m: Message):
             if doc.file_name and doc.file_name.lower().endswith(".torrent"):
                 work_dir = os.path.join(DOWNLOAD_DIR, f"torrent_{user_id}_{int(time.time())}")
                 os.makedirs(work_dir, exist_ok=True)
-                torrent_file_path = await client.download_media(
+                torrent_file_path = await download_file(
+                    client,
                     m.reply_to_message,
                     file_name=os.path.join(work_dir, doc.file_name),
                 )
@@ -181,6 +184,7 @@ async def qbl_command(client: Client, m: Message):
 
         # Poll download progress
         last_update = 0
+        reserved = False
         while True:
             await asyncio.sleep(5)
 
@@ -197,6 +201,25 @@ async def qbl_command(client: Client, m: Message):
             eta = t.eta
             state = t.state
 
+            # The size is known once the metadata is in: reserve it, pausing while queued.
+            if not reserved and size > 0:
+                reserved = True
+                notify = wait_notifier(status_msg.edit_text, f"`{torrent_name}`")
+
+                async def _pause_and_notify(needed, free):
+                    if not admitted:
+                        qb.torrents_pause(torrent_hashes=torrent_hash)
+                    await notify(needed, free)
+
+                admitted = False
+                await disk_budget.hold(
+                    f"qbl:{user_id}", estimate_footprint(size, "torrent"), f"/qbl {torrent_name}",
+                    path=save_path, on_wait=_pause_and_notify,
+                )
+                admitted = True
+                qb.torrents_resume(torrent_hashes=torrent_hash)
+                continue
+
             # Check if done
             if progress >= 100 or state in ("uploading", "pausedUP", "stalledUP", "queuedUP"):
                 break
@@ -267,8 +290,10 @@ async def qbl_command(client: Client, m: Message):
             qb.torrents_delete(delete_files=True, torrent_hashes=torrent_hash)
             return
 
-        # Upload each file (auto-split if >1.95GB)
+        # Upload all files concurrently across clients (auto-split if >1.95GB);
+        # they still land in the chat in order.
         total_files = len(files_to_upload)
+        uploads = []
         for i, fp in enumerate(files_to_upload):
             fname = os.path.basename(fp)
             fsize = os.path.getsize(fp)
@@ -279,19 +304,17 @@ async def qbl_command(client: Client, m: Message):
             )
             if total_files > 1:
                 caption += f"\n📂 File {i + 1}/{total_files}"
+            uploads.append((fp, caption, fname))
 
-            try:
-                await status_msg.edit_text(f"⬆️ Uploading {i + 1}/{total_files}: `{fname}`...")
-            except Exception:
-                pass
+        try:
+            await status_msg.edit_text(f"⬆️ Uploading {total_files} file(s)...")
+        except Exception:
+            pass
 
-            try:
-                await upload_file_or_split(
-                    client, m.chat.id, fp,
-                    caption=caption, file_name=fname,
-                )
-            except Exception as e:
-                await m.reply_text(f"❌ Upload failed for `{fname}`: `{e}`")
+        results = await upload_files_ordered(client, m.chat.id, uploads)
+        for (_fp, _caption, fname), result in zip(uploads, results):
+            if isinstance(result, Exception):
+                await m.reply_text(f"❌ Upload failed for `{fname}`: `{result}`")
 
         # Done
         await status_msg.edit_text(
@@ -315,6 +338,7 @@ async def qbl_command(client: Client, m: Message):
 
     finally:
         _active_qbl.pop(user_id, None)
+        await disk_budget.release(f"qbl:{user_id}")
         # Clean up save directory
         if 'save_path' in dir() and save_path and os.path.exists(save_path):
             shutil.rmtree(save_path, ignore_errors=True)
@@ -13,7 +13,7 @@ from pyrogram.types import Message
 
 from f2lnk.bot import StreamBot
 from f2lnk.vars import Var
-from f2lnk.bot.task_manager import ACTIVE_LEECH_TASKS
+from f2lnk.bot.task_manager import ACTIVE_LEECH_TASKS, orphan_task_dirs
 
 logger = logging.getLogger(__name__)
 
@@ -84,6 +84,10 @@ async def _do_restart(client: Client, reason: str, chat_id: int = None):
                 logger.info("Cleaned temp dir: %s", d)
             except Exception:
                 pass
+    # Leech task dirs go too, except those of tasks that resume after the restart
+    for d in orphan_task_dirs():
+        shutil.rmtree(d, ignore_errors=True)
+        logger.info("Cleaned task dir: %s", d)
 
     # ── 5. Exit process — start.sh loop will restart us ──
     logger.info("Exiting process for restart...")
@@ -13,7 +13,8 @@ from f2lnk.bot import StreamBot, last_file_for_test
 from f2lnk.utils.database import Database
 from f2lnk.utils.human_readable import humanbytes
 from f2lnk.vars import Var
-from f2lnk.utils.file_properties import get_name, get_hash, get_media_file_size
+from f2lnk.utils.file_properties import get_media_file_size
+from f2lnk.utils.bin_index import get_or_forward_to_bin
 
 db = Database(Var.DATABASE_URL, Var.name)
 MAINTENANCE_FILE = "maintenance.txt"
@@ -99,17 +100,15 @@ async def private_receive_handler(c: Client, m: Message):
             return
 
     try:
-        log_msg = await m.forward(chat_id=Var.BIN_CHANNEL)
-        file_name = get_name(log_msg)
-        file_hash = get_hash(log_msg)
+        log_msg_id, file_name, file_hash = await get_or_forward_to_bin(m)
         file_size = get_media_file_size(m)
         
-        save_last_file_details(log_msg.id, file_name, file_hash)
+        save_last_file_details(log_msg_id, file_name, file_hash)
         
         await db.update_user_stats(m.from_user.id, file_size)
 
-        stream_link = f"{Var.URL.rstrip('/')}/watch/{log_msg.id}/{quote_plus(file_name)}?hash={file_hash}"
-        online_link = f"{Var.URL.rstrip('/')}/{log_msg.id}/{quote_plus(file_name)}?hash={file_hash}"
+        stream_link = f"{Var.URL.rstrip('/')}/watch/{log_msg_id}/{quote_plus(file_name)}?hash={file_hash}"
+        online_link = f"{Var.URL.rstrip('/')}/{log_msg_id}/{quote_plus(file_name)}?hash={file_hash}"
         
         user_info = await db.get_user_info(m.from_user.id)
         footer = user_info.get("footer", "")
@@ -142,13 +141,11 @@ async def channel_receive_handler(bot, broadcast):
         await bot.leave_chat(broadcast.chat.id)
         return
     try:
-        log_msg = await broadcast.forward(chat_id=Var.BIN_CHANNEL)
-        file_name = get_name(log_msg)
+        log_msg_id, file_name, file_hash = await get_or_forward_to_bin(broadcast)
         file_size = get_media_file_size(broadcast)
-        file_hash = get_hash(log_msg)
-        save_last_file_details(log_msg.id, file_name, file_hash)
-        stream_link = f"{Var.URL.rstrip('/')}/watch/{log_msg.id}/{quote_plus(file_name)}?hash={file_hash}"
-        online_link = f"{Var.URL.rstrip('/')}/{log_msg.id}/{quote_plus(file_name)}?hash={file_hash}"
+        save_last_file_details(log_msg_id, file_name, file_hash)
+        stream_link = f"{Var.URL.rstrip('/')}/watch/{log_msg_id}/{quote_plus(file_name)}?hash={file_hash}"
+        online_link = f"{Var.URL.rstrip('/')}/{log_msg_id}/{quote_plus(file_name)}?hash={file_hash}"
         
         footer = "" # No user-specific footer in channels
         
@@ -201,12 +198,10 @@ async def group_receive_handler(bot: Client, m: Message):
             return
 
     try:
-        log_msg = await m.forward(chat_id=Var.BIN_CHANNEL)
-        file_name = get_name(log_msg)
-        file_hash = get_hash(log_msg)
+        log_msg_id, file_name, file_hash = await get_or_forward_to_bin(m)
         file_size = get_media_file_size(m)
         
-        save_last_file_details(log_msg.id, file_name, file_hash)
+        save_last_file_details(log_msg_id, file_name, file_hash)
         
         footer = ""
         if m.from_user:
@@ -216,8 +211,8 @@ async def group_receive_handler(bot: Client, m: Message):
             if footer:
                 footer = f"‣ Fᴏᴏᴛᴇʀ : {footer}"
 
-        stream_link = f"{Var.URL.rstrip('/')}/watch/{log_msg.id}/{quote_plus(file_name)}?hash={file_hash}"
-        online_link = f"{Var.URL.rstrip('/')}/{log_msg.id}/{quote_plus(file_name)}?hash={file_hash}"
+        stream_link = f"{Var.URL.rstrip('/')}/watch/{log_msg_id}/{quote_plus(file_name)}?hash={file_hash}"
+        online_link = f"{Var.URL.rstrip('/')}/{log_msg_id}/{quote_plus(file_name)}?hash={file_hash}"
         
         await m.reply_text(text=msg_text.format(file_name, footer, humanbytes(file_size), online_link, stream_link), quote=True, disable_web_page_preview=True, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("STREAM 🔺", url=stream_link), InlineKeyboardButton('DOWNLOAD 🔻', url=online_link)]]))
 
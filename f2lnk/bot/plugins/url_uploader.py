@@ -20,6 +20,8 @@ from f2lnk.utils.database import Database
 from f2lnk.utils.human_readable import humanbytes
 from f2lnk.utils.file_properties import get_name, get_hash
 from f2lnk.utils.split_upload import upload_file_or_split
+from f2lnk.utils.tg_downloader import download_file
+from f2lnk.utils.disk_budget import disk_budget, estimate_footprint, wait_notifier
 
 db = Database(Var.DATABASE_URL, Var.name)
 
@@ -85,6 +87,12 @@ async def _start_upload_process(c: Client, m: Message):
                                       "Please try again tomorrow or upgrade your plan.")
                 return
 
+        # Held (so the janitor leaves file_path alone) until the finally below.
+        await disk_budget.hold(
+            file_path, estimate_footprint(total_size, "upload"), "/upload",
+            path=file_path, on_wait=wait_notifier(status_msg.edit_text, "/upload"),
+        )
+
         # --- Interactive Conversation ---
         try:
             default_filename = os.path.basename(urlparse(url).path) or f"Untitled_{int(time.time())}"
@@ -108,7 +116,7 @@ async def _start_upload_process(c: Client, m: Message):
             )
             if ask_thumb.photo:
                 os.makedirs(file_path, exist_ok=True)
-                thumb_path = await c.download_media(ask_thumb, file_name=os.path.join(file_path, f"thumb_{m.from_user.id}.jpg"))
+                thumb_path = await download_file(c, ask_thumb, file_name=os.path.join(file_path, f"thumb_{m.from_user.id}.jpg"))
 
 
         except ListenerTimeout:
@@ -222,6 +230,7 @@ async def _start_upload_process(c: Client, m: Message):
         if os.path.exists(file_path):
             import shutil
             shutil.rmtree(file_path, ignore_errors=True)
+        await disk_budget.release(file_path)
 
 @StreamBot.on_message(filters.command("upload") & filters.private)
 async def url_upload_handler(c: Client, m: Message):
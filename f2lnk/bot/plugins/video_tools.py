@@ -1,7 +1,6 @@
 # f2lnk/bot/plugins/video_tools.py
 
 import os
-import asyncio
 import shutil
 import time
 
@@ -18,6 +17,13 @@ from f2lnk.bot import StreamBot
 from f2lnk.vars import Var
 from f2lnk.utils.human_readable import humanbytes
 from f2lnk.utils.split_upload import upload_file_or_split
+from f2lnk.utils.ffmpeg_runner import run_ffmpeg
+from f2lnk.utils.smartcut import smart_trim
+from f2lnk.utils.chunked_encode import chunk_count, chunked_encode, stream_maps
+from f2lnk.utils.probe_cache import probe_duration
+from f2lnk.utils.tg_downloader import download_file
+from f2lnk.utils.file_properties import get_media_file_size
+from f2lnk.utils.disk_budget import disk_budget, estimate_footprint, wait_notifier
 
 # ─────────────────────── helpers ───────────────────────
 
@@ -31,26 +37,29 @@ def _user_dir(user_id: int) -> str:
     return d
 
 
-async def _run_cmd(cmd: list, timeout: int = 600) -> tuple:
-    """Run a subprocess command and return (returncode, stdout, stderr)."""
-    proc = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
+async def _run_cmd(cmd: list, timeout: int = 600, user_id: int = None, status: Message = None) -> tuple:
+    """
+    Run a subprocess command and return (returncode, stdout, stderr).
+    Goes through the shared ffmpeg runner: queued in the scheduler, progress
+    shown on `status`, and stderr trimmed to its last lines. The timeout only
+    counts once the command is actually running.
+    """
+    rc, stderr_tail = await run_ffmpeg(
+        cmd, user_id=user_id, status_msg=status, label="video tool", timeout=timeout,
     )
-    try:
-        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
-    except asyncio.TimeoutError:
-        proc.kill()
-        return -1, b"", b"Process timed out."
-    return proc.returncode, stdout, stderr
+    return rc, b"", stderr_tail.encode("utf-8")
 
 
 async def _download_replied_media(client: Client, msg: Message, dest_dir: str, label: str = "file") -> str:
     """Download the media from a replied message and return the local path."""
     if not msg or not (msg.video or msg.document or msg.audio or msg.photo):
         return None
-    path = await client.download_media(msg, file_name=os.path.join(dest_dir, ""))
+    # Held until the handler's finally releases work_dir.
+    await disk_budget.hold(
+        dest_dir, estimate_footprint(get_media_file_size(msg) or 0, "video"), f"/vt {label}",
+        path=dest_dir, on_wait=wait_notifier(msg.reply_text, f"/vt {label}"),
+    )
+    path = await download_file(client, msg, file_name=os.path.join(dest_dir, ""))
     return path
 
 
@@ -168,7 +177,7 @@ async def _merge_video_video(client: Client, cb: CallbackQuery):
             "ffmpeg", "-y", "-f", "concat", "-safe", "0",
             "-i", concat_file, "-c", "copy", output_path
         ]
-        rc, _, stderr = await _run_cmd(cmd)
+        rc, _, stderr = await _run_cmd(cmd, user_id=cb.from_user.id, status=status)
         if rc != 0:
             await status.edit_text(f"❌ FFmpeg error:\n`{stderr.decode('utf-8', errors='replace')[:1000]}`")
             return
@@ -182,6 +191,7 @@ async def _merge_video_video(client: Client, cb: CallbackQuery):
     except Exception as e:
         await status.edit_text(f"❌ Error: `{e}`")
     finally:
+        await disk_budget.release(work_dir)
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
 
@@ -215,7 +225,7 @@ async def _merge_video_audio(client: Client, cb: CallbackQuery):
             "-map", "0:v:0", "-map", "1:a:0",
             output_path
         ]
-        rc, _, stderr = await _run_cmd(cmd)
+        rc, _, stderr = await _run_cmd(cmd, user_id=cb.from_user.id, status=status)
         if rc != 0:
             await status.edit_text(f"❌ FFmpeg error:\n`{stderr.decode('utf-8', errors='replace')[:1000]}`")
             return
@@ -229,6 +239,7 @@ async def _merge_video_audio(client: Client, cb: CallbackQuery):
     except Exception as e:
         await status.edit_text(f"❌ Error: `{e}`")
     finally:
+        await disk_budget.release(work_dir)
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
 
@@ -262,7 +273,7 @@ async def _merge_video_subtitle(client: Client, cb: CallbackQuery):
             "-map", "0:v", "-map", "0:a?", "-map", "1:s",
             output_path
         ]
-        rc, _, stderr = await _run_cmd(cmd)
+        rc, _, stderr = await _run_cmd(cmd, user_id=cb.from_user.id, status=status)
         if rc != 0:
             await status.edit_text(f"❌ FFmpeg error:\n`{stderr.decode('utf-8', errors='replace')[:1000]}`")
             return
@@ -276,6 +287,7 @@ async def _merge_video_subtitle(client: Client, cb: CallbackQuery):
     except Exception as e:
         await status.edit_text(f"❌ Error: `{e}`")
     finally:
+        await disk_budget.release(work_dir)
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
 
@@ -310,7 +322,7 @@ async def _hardsub(client: Client, cb: CallbackQuery):
             "-c:a", "copy",
             output_path
         ]
-        rc, _, stderr = await _run_cmd(cmd, timeout=1800)
+        rc, _, stderr = await _run_cmd(cmd, timeout=1800, user_id=cb.from_user.id, status=status)
         if rc != 0:
             await status.edit_text(f"❌ FFmpeg error:\n`{stderr.decode('utf-8', errors='replace')[:1000]}`")
             return
@@ -324,6 +336,7 @@ async def _hardsub(client: Client, cb: CallbackQuery):
     except Exception as e:
         await status.edit_text(f"❌ Error: `{e}`")
     finally:
+        await disk_budget.release(work_dir)
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
 
@@ -355,7 +368,7 @@ async def _subsync(client: Client, cb: CallbackQuery):
             "-i", sub_path,
             "-o", output_path,
         ]
-        rc, _, stderr = await _run_cmd(cmd, timeout=600)
+        rc, _, stderr = await _run_cmd(cmd, timeout=600, user_id=cb.from_user.id, status=status)
         if rc != 0:
             await status.edit_text(f"❌ ffsubsync error:\n`{stderr.decode('utf-8', errors='replace')[:1000]}`")
             return
@@ -369,6 +382,7 @@ async def _subsync(client: Client, cb: CallbackQuery):
     except Exception as e:
         await status.edit_text(f"❌ Error: `{e}`")
     finally:
+        await disk_budget.release(work_dir)
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
 
@@ -410,14 +424,21 @@ async def _compress(client: Client, cb: CallbackQuery):
         await status.edit_text(f"⏳ Compressing video with CRF={crf}... This may take a while.")
 
         output_path = os.path.join(work_dir, "compressed_output.mp4")
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", vid_path,
-            "-c:v", "libx264", "-crf", crf, "-preset", "faster",
-            "-c:a", "aac", "-b:a", "128k",
-            output_path
-        ]
-        rc, _, stderr = await _run_cmd(cmd, timeout=3600)
+        video_args = ["-c:v", "libx264", "-crf", crf, "-preset", "faster"]
+        audio_args = ["-c:a", "aac", "-b:a", "128k"]
+
+        chunked_ok = False
+        chunks = chunk_count(await probe_duration(vid_path))
+        if chunks > 1:
+            # Long input: encode keyframe-aligned segments in parallel
+            chunked_ok, _ = await chunked_encode(
+                vid_path, output_path, video_args, audio_args, chunks,
+                user_id=cb.from_user.id, status_msg=status, label="video tool",
+            )
+        rc, stderr = 0, b""
+        if not chunked_ok:
+            cmd = ["ffmpeg", "-y", "-i", vid_path, *stream_maps(), *video_args, *audio_args, output_path]
+            rc, _, stderr = await _run_cmd(cmd, timeout=3600, user_id=cb.from_user.id, status=status)
         if rc != 0:
             await status.edit_text(f"❌ FFmpeg error:\n`{stderr.decode('utf-8', errors='replace')[:1000]}`")
             return
@@ -438,6 +459,7 @@ async def _compress(client: Client, cb: CallbackQuery):
     except Exception as e:
         await status.edit_text(f"❌ Error: `{e}`")
     finally:
+        await disk_budget.release(work_dir)
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
 
@@ -474,15 +496,24 @@ async def _trim(client: Client, cb: CallbackQuery):
         await status.edit_text(f"⏳ Trimming video from `{start_time}` to `{end_time}`...")
 
         output_path = os.path.join(work_dir, "trimmed_output.mp4")
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", vid_path,
-            "-ss", start_time,
-            "-to", end_time,
-            "-c", "copy",
-            output_path
-        ]
-        rc, _, stderr = await _run_cmd(cmd)
+        smart_ok = False
+        if Var.TRIM_MODE == "smart":
+            # Frame-accurate: re-encode only the boundary GOPs, copy the rest
+            smart_ok, _ = await smart_trim(
+                vid_path, start_time, end_time, output_path,
+                user_id=cb.from_user.id, status_msg=status, label="video tool",
+            )
+        rc, stderr = 0, b""
+        if not smart_ok:
+            cmd = [
+                "ffmpeg", "-y",
+                "-i", vid_path,
+                "-ss", start_time,
+                "-to", end_time,
+                "-c", "copy",
+                output_path
+            ]
+            rc, _, stderr = await _run_cmd(cmd, user_id=cb.from_user.id, status=status)
         if rc != 0:
             await status.edit_text(f"❌ FFmpeg error:\n`{stderr.decode('utf-8', errors='replace')[:1000]}`")
             return
@@ -499,6 +530,7 @@ async def _trim(client: Client, cb: CallbackQuery):
     except Exception as e:
         await status.edit_text(f"❌ Error: `{e}`")
     finally:
+        await disk_budget.release(work_dir)
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
 
@@ -604,7 +636,7 @@ async def _watermark(client: Client, cb: CallbackQuery):
                 output_path
             ]
 
-        rc, _, stderr = await _run_cmd(cmd, timeout=1800)
+        rc, _, stderr = await _run_cmd(cmd, timeout=1800, user_id=cb.from_user.id, status=status)
         if rc != 0:
             await status.edit_text(f"❌ FFmpeg error:\n`{stderr.decode('utf-8', errors='replace')[:1000]}`")
             return
@@ -618,6 +650,7 @@ async def _watermark(client: Client, cb: CallbackQuery):
     except Exception as e:
         await status.edit_text(f"❌ Error: `{e}`")
     finally:
+        await disk_budget.release(work_dir)
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
 
@@ -643,7 +676,7 @@ async def _remove_video_stream(client: Client, cb: CallbackQuery):
             "-vn", "-c:a", "copy",
             output_path
         ]
-        rc, _, stderr = await _run_cmd(cmd)
+        rc, _, stderr = await _run_cmd(cmd, user_id=cb.from_user.id, status=status)
         if rc != 0:
             await status.edit_text(f"❌ FFmpeg error:\n`{stderr.decode('utf-8', errors='replace')[:1000]}`")
             return
@@ -657,6 +690,7 @@ async def _remove_video_stream(client: Client, cb: CallbackQuery):
     except Exception as e:
         await status.edit_text(f"❌ Error: `{e}`")
     finally:
+        await disk_budget.release(work_dir)
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
 
@@ -682,7 +716,7 @@ async def _extract_video_stream(client: Client, cb: CallbackQuery):
             "-an", "-c:v", "copy",
             output_path
         ]
-        rc, _, stderr = await _run_cmd(cmd)
+        rc, _, stderr = await _run_cmd(cmd, user_id=cb.from_user.id, status=status)
         if rc != 0:
             await status.edit_text(f"❌ FFmpeg error:\n`{stderr.decode('utf-8', errors='replace')[:1000]}`")
             return
@@ -696,5 +730,6 @@ async def _extract_video_stream(client: Client, cb: CallbackQuery):
     except Exception as e:
         await status.edit_text(f"❌ Error: `{e}`")
     finally:
+        await disk_budget.release(work_dir)
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
@@ -14,6 +14,9 @@ from pyromod.exceptions import ListenerTimeout
 from f2lnk.bot import StreamBot
 from f2lnk.vars import Var
 from f2lnk.utils.human_readable import humanbytes
+from f2lnk.utils.tg_downloader import download_file
+from f2lnk.utils.file_properties import get_media_file_size
+from f2lnk.utils.disk_budget import disk_budget, estimate_footprint, wait_notifier
 
 TEMP_DIR = "./zip_temp"
 
@@ -61,8 +64,13 @@ async def zip_cmd(client: Client, m: Message):
 
             # Download the file if it has media
             if file_msg.video or file_msg.document or file_msg.audio or file_msg.photo:
-                dl_path = await client.download_media(
-                    file_msg, file_name=os.path.join(input_dir, "")
+                # Each file reserves room for itself and its share of the archive.
+                await disk_budget.hold(
+                    work_dir, estimate_footprint(get_media_file_size(file_msg) or 0, "zip"), "/zip",
+                    path=work_dir, on_wait=wait_notifier(status.edit_text, "/zip"),
+                )
+                dl_path = await download_file(
+                    client, file_msg, file_name=os.path.join(input_dir, "")
                 )
                 if dl_path:
                     collected_files.append(dl_path)
@@ -118,6 +126,7 @@ async def zip_cmd(client: Client, m: Message):
     except Exception as e:
         await status.edit_text(f"❌ Error: `{e}`")
     finally:
+        await disk_budget.release(work_dir)
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
 
@@ -156,12 +165,19 @@ async def unzip_cmd(client: Client, m: Message):
 
     status = await m.reply_text("⏳ Processing...", quote=True)
     archive_path = None
+    reserved = False
 
     try:
         # Case 1: Reply to a file
         if m.reply_to_message and (m.reply_to_message.document or m.reply_to_message.video or m.reply_to_message.audio):
+            await disk_budget.hold(
+                work_dir, estimate_footprint(get_media_file_size(m.reply_to_message) or 0, "unzip"),
+                "/unzip", path=work_dir, on_wait=wait_notifier(status.edit_text, "/unzip"),
+            )
+            reserved = True
             await status.edit_text("⬇️ Downloading archive...")
-            archive_path = await client.download_media(
+            archive_path = await download_file(
+                client,
                 m.reply_to_message,
                 file_name=os.path.join(archive_dir, ""),
             )
@@ -196,6 +212,14 @@ async def unzip_cmd(client: Client, m: Message):
             await status.edit_text("❌ Failed to download the archive.")
             return
 
+        if not reserved:
+            # URL archive: its size is only known now; the part already on
+            # disk under work_dir is not counted again.
+            await disk_budget.hold(
+                work_dir, estimate_footprint(os.path.getsize(archive_path), "unzip"),
+                "/unzip", path=work_dir, on_wait=wait_notifier(status.edit_text, "/unzip"),
+            )
+
         await status.edit_text("📂 Extracting archive...")
 
         ext = os.path.splitext(archive_path)[1].lower()
@@ -287,5 +311,6 @@ async def unzip_cmd(client: Client, m: Message):
         await status.edit_text(f"❌ Error: `{e}`")
 
     finally:
+        await disk_budget.release(work_dir)
         if os.path.exists(work_dir):
             shutil.rmtree(work_dir, ignore_errors=True)
@@ -2,6 +2,7 @@
 # Central task state management for the /leech workflow.
 
 import os
+import json
 import time
 import string
 import random
@@ -9,7 +10,7 @@ import shutil
 import asyncio
 import logging
 from enum import Enum
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from typing import Dict, Optional
 
 logger = logging.getLogger(__name__)
@@ -87,6 +88,7 @@ class LeechTask:
     # ── File tracking ──
     file_messages: list = field(default_factory=list)
     download_paths: list = field(default_factory=list)
+    uploaded_messages: list = field(default_factory=list)   # results sent to the user
 
     # ── Worker tracking ──
     download_tasks: list = field(default_factory=list)
@@ -118,6 +120,14 @@ class LeechTask:
     # ── RV tool ──
     audio_format: Optional[str] = None            # mp3/aac/wav/copy
 
+    # ── Input ──
+    stream_input: bool = False                    # -stream: ffmpeg reads the loopback stream URL
+
+    # ── Resume progress (persisted, see save_task_state) ──
+    completed_downloads: dict = field(default_factory=dict)  # str(index) → local path
+    uploaded_indices: list = field(default_factory=list)     # pipeline: files fully sent
+    uploaded_outputs: list = field(default_factory=list)     # output names already sent
+
     # ── Internal ──
     work_dir: str = ""
     created_at: float = field(default_factory=time.time)
@@ -170,6 +180,7 @@ def register_task(task: LeechTask) -> None:
 
 def remove_task(task_id: str) -> None:
     ACTIVE_LEECH_TASKS.pop(task_id.lower(), None)
+    delete_task_state(task_id.lower())
 
 
 async def cancel_task(task: LeechTask) -> bool:
@@ -199,6 +210,7 @@ async def cancel_task(task: LeechTask) -> bool:
 
 
 def cleanup_task_files(task: LeechTask) -> None:
+    delete_task_state(task.task_id)
     if task.work_dir and os.path.exists(task.work_dir):
         try:
             shutil.rmtree(task.work_dir, ignore_errors=True)
@@ -206,3 +218,102 @@ def cleanup_task_files(task: LeechTask) -> None:
         except Exception as e:
             logger.warning("Cleanup error for task %s: %s", task.task_id, e)
             
+
+
+# ──────────────────── Persistence ────────────────────
+# Once a task is confirmed (Done pressed) its state is kept in STATE_ROOT as
+# one JSON file, rewritten atomically at every stage change, so a restart or
+# crash can pick it up again. Messages are stored by id and re-fetched.
+
+STATE_ROOT = "./task_state"
+
+# Live objects that can't be serialised; messages are stored by id instead
+_RUNTIME_FIELDS = {"file_messages", "uploaded_messages", "download_tasks", "merge_process", "cancel_event"}
+RESUMABLE_STATES = {
+    TaskStatus.DOWNLOADING,
+    TaskStatus.MERGING,
+    TaskStatus.PROCESSING,
+    TaskStatus.UPLOADING,
+}
+
+
+def _state_path(task_id: str) -> str:
+    return os.path.join(STATE_ROOT, f"{task_id}.json")
+
+
+def save_task_state(task: LeechTask) -> None:
+    """
+    Write the task's durable state (fsync + rename, never half-written).
+    Tasks that finished, failed or were cancelled get their state removed
+    instead: stage code may still call this after /cancel or cleanup ran.
+    A cancel_event alone (a restart stopping the task) keeps the state.
+    """
+    path = _state_path(task.task_id)
+    if task.status not in RESUMABLE_STATES or (
+        task.cancel_event.is_set() and not os.path.isfile(path)
+    ):
+        delete_task_state(task.task_id)
+        return
+    data = {f.name: getattr(task, f.name) for f in fields(task) if f.name not in _RUNTIME_FIELDS}
+    data["status"] = task.status.value
+    data["file_message_ids"] = [msg.id for msg in task.file_messages]
+    data["uploaded_message_refs"] = [
+        [msg.chat.id, msg.id] for msg in task.uploaded_messages if msg
+    ]
+    os.makedirs(STATE_ROOT, exist_ok=True)
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning("Could not save state for task %s: %s", task.task_id, e)
+
+
+def delete_task_state(task_id: str) -> None:
+    try:
+        os.remove(_state_path(task_id))
+    except OSError:
+        pass
+
+
+def load_task_states() -> list:
+    """
+    Tasks saved by a previous run, as (task, file_message_ids, uploaded_message_refs).
+    Unreadable state files are dropped.
+    """
+    if not os.path.isdir(STATE_ROOT):
+        return []
+    known = {f.name for f in fields(LeechTask)} - _RUNTIME_FIELDS
+    restored = []
+    for name in sorted(os.listdir(STATE_ROOT)):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(STATE_ROOT, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            kwargs = {k: v for k, v in data.items() if k in known and k != "work_dir"}
+            kwargs["status"] = TaskStatus(kwargs.get("status", TaskStatus.FAILED))
+            task = LeechTask(**kwargs)
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("Dropping unreadable task state %s: %s", name, e)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        restored.append((task, data.get("file_message_ids", []), data.get("uploaded_message_refs", [])))
+    return restored
+
+
+def orphan_task_dirs() -> list:
+    """Work dirs in TASKS_ROOT with no saved state (nothing will resume them)."""
+    if not os.path.isdir(TASKS_ROOT):
+        return []
+    return [
+        os.path.join(TASKS_ROOT, name) for name in os.listdir(TASKS_ROOT)
+        if not os.path.isfile(_state_path(name))
+    ]
@@ -0,0 +1,279 @@
+# f2lnk/server/static_assets.py
+# Self-hosted copies of the third-party CSS/JS/fonts used by the watch pages.
+#
+# The CDN assets are mirrored into STATIC_ROOT at build time
+# (`python3 -m f2lnk.server.static_assets`, run by the Dockerfile): CSS is
+# minified and its url() references (fonts) are pulled in too, and each file
+# is stored under a content-hashed name with gzip/brotli variants next to it.
+# Files shipped with the code (the prebuilt Tailwind CSS) are added the same
+# way. At startup the bundle is only loaded from disk — nothing is fetched.
+# Templates call static_url(key), which falls back to the CDN URL for an
+# asset the build could not mirror, so a failed mirror never breaks a page.
+
+import os
+import re
+import json
+import gzip
+import hashlib
+import asyncio
+import logging
+import mimetypes
+import urllib.parse
+
+import aiohttp
+
+try:
+    import brotli
+except ImportError:  # optional — gzip alone is still served
+    brotli = None
+
+from f2lnk.vars import Var
+
+logger = logging.getLogger(__name__)
+
+STATIC_ROOT = "./static_cache"
+MANIFEST_NAME = "manifest.json"
+SHIPPED_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# Google Fonts tailors its CSS to the User-Agent; ask for woff2.
+FETCH_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+    )
+}
+
+# key → upstream URL
+ASSETS = {
+    # req.html
+    "shery_css": "https://unpkg.com/sheryjs/dist/Shery.css",
+    "stream_css": "https://biisal.github.io/Resources/StreamCSS.css",
+    "player_css": "https://biisal.github.io/Resources/playerCss.css",
+    "josefin_css": "https://fonts.googleapis.com/css2?family=Josefin+Sans:wght@500;700&display=swap",
+    "fontawesome_css": "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/css/all.min.css",
+    "gsap_js": "https://cdnjs.cloudflare.com/ajax/libs/gsap/3.12.2/gsap.min.js",
+    "scrolltrigger_js": "https://cdnjs.cloudflare.com/ajax/libs/gsap/3.12.2/ScrollTrigger.min.js",
+    "three_js": "https://cdnjs.cloudflare.com/ajax/libs/three.js/0.155.0/three.min.js",
+    "controlkit_js": "https://cdn.jsdelivr.net/gh/automat/controlkit.js@master/bin/controlKit.min.js",
+    "shery_js": "https://cdn.jsdelivr.net/npm/sheryjs/dist/Shery.js",
+    "plyr_js": "https://cdn.plyr.io/3.6.9/plyr.js",
+    "stream_js": "https://biisal.github.io/Resources/StreamJs.js",
+    # dl.html
+    "dl_style_css": "https://adarsh-goel.github.io/resources/style.css",
+    "raleway_css": "https://fonts.googleapis.com/css?family=Raleway",
+    "delius_css": "https://fonts.googleapis.com/css?family=Delius",
+    "plyr_dl_js": "https://cdn.plyr.io/3.6.12/plyr.js",
+}
+
+# key → file in SHIPPED_ROOT, always served locally
+SHIPPED_ASSETS = {
+    # Tailwind built from the templates, instead of the in-browser JIT script
+    "tailwind_css": "tailwind.css",
+}
+
+# key → hashed file name (e.g. "plyr_js.3f2a9c1d.js")
+_manifest = {}
+# hashed file name → {"type": ..., "identity": bytes, "gzip": bytes, "br": bytes}
+_files = {}
+
+_CSS_URL_RE = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+_COMPRESSIBLE = ("text/", "application/javascript", "image/svg+xml", "application/json")
+
+
+def static_url(key: str) -> str:
+    """URL to use in templates — the local copy if mirrored, else the CDN."""
+    name = _manifest.get(key)
+    if name and name in _files:
+        return urllib.parse.urljoin(Var.URL, f"static/{name}")
+    # Shipped files are loaded before the web server starts.
+    return ASSETS.get(key, "")
+
+
+def is_mirrored(key: str) -> bool:
+    name = _manifest.get(key)
+    return bool(name and name in _files)
+
+
+def get_file(name: str, accept_encoding: str):
+    """
+    Pick the best precompressed variant for a request.
+    Returns (body, content_type, content_encoding or None), or None if unknown.
+    """
+    entry = _files.get(name)
+    if entry is None:
+        return None
+    if "br" in accept_encoding and entry.get("br"):
+        return entry["br"], entry["type"], "br"
+    if "gzip" in accept_encoding and entry.get("gzip"):
+        return entry["gzip"], entry["type"], "gzip"
+    return entry["identity"], entry["type"], None
+
+
+def _minify_css(text: str) -> str:
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = text.replace(";}", "}")
+    return text.strip()
+
+
+def _guess_ext(url: str, content_type: str) -> str:
+    path = urllib.parse.urlparse(url).path
+    ext = os.path.splitext(path)[1].lower()
+    if ext:
+        return ext
+    return mimetypes.guess_extension((content_type or "").split(";")[0].strip()) or ".bin"
+
+
+def _store(stem: str, ext: str, data: bytes) -> str:
+    """Write data + compressed variants under a content-hashed name."""
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    name = f"{stem}.{digest}{ext}"
+    path = os.path.join(STATIC_ROOT, name)
+    if not os.path.isfile(path):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    entry = {"type": content_type, "identity": data, "gzip": None, "br": None}
+    if content_type.startswith(_COMPRESSIBLE):
+        entry["gzip"] = _load_or_compress(path + ".gz", lambda: gzip.compress(data, 9))
+        if brotli is not None:
+            entry["br"] = _load_or_compress(path + ".br", lambda: brotli.compress(data, quality=11))
+    _files[name] = entry
+    return name
+
+
+def _load_or_compress(path: str, compress) -> bytes:
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            return f.read()
+    data = compress()
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return data
+
+
+async def _fetch(session, url: str):
+    async with session.get(url, headers=FETCH_HEADERS) as resp:
+        if resp.status != 200:
+            raise ValueError(f"HTTP {resp.status}")
+        return await resp.read(), resp.headers.get("Content-Type", "")
+
+
+async def _mirror_asset(session, key: str, url: str) -> str:
+    data, content_type = await _fetch(session, url)
+    ext = _guess_ext(url, content_type)
+    loop = asyncio.get_running_loop()
+
+    if ext == ".css" or "text/css" in content_type:
+        ext = ".css"
+        css = data.decode("utf-8", errors="replace")
+
+        # Pull referenced fonts/images in and point the CSS at our copies.
+        # Hashed names sit next to the CSS, so the rewritten url() is relative.
+        refs = {}
+        for _, ref in _CSS_URL_RE.findall(css):
+            if ref.startswith("data:") or ref in refs:
+                continue
+            abs_url = urllib.parse.urljoin(url, ref)
+            try:
+                ref_data, ref_type = await _fetch(session, abs_url)
+            except Exception as e:
+                logger.warning("Static: could not mirror %s: %s", abs_url, e)
+                refs[ref] = abs_url
+                continue
+            ref_ext = _guess_ext(abs_url, ref_type)
+            stem = os.path.splitext(os.path.basename(urllib.parse.urlparse(abs_url).path))[0] or key
+            refs[ref] = await loop.run_in_executor(None, _store, stem, ref_ext, ref_data)
+
+        css = _CSS_URL_RE.sub(lambda m: f"url({refs.get(m.group(2), m.group(2))})", css)
+        data = _minify_css(css).encode("utf-8")
+
+    return await loop.run_in_executor(None, _store, key, ext, data)
+
+
+def _load_manifest():
+    path = os.path.join(STATIC_ROOT, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        return
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return
+    for fname in os.listdir(STATIC_ROOT):
+        if fname.endswith((".gz", ".br", ".tmp")) or fname == MANIFEST_NAME:
+            continue
+        with open(os.path.join(STATIC_ROOT, fname), "rb") as f:
+            data = f.read()
+        stem, ext = os.path.splitext(fname)
+        _store(stem.rsplit(".", 1)[0], ext, data)
+    for key, name in saved.items():
+        if key in ASSETS and name in _files:
+            _manifest[key] = name
+
+
+def _load_shipped():
+    for key, fname in SHIPPED_ASSETS.items():
+        with open(os.path.join(SHIPPED_ROOT, fname), "rb") as f:
+            data = f.read()
+        stem, ext = os.path.splitext(fname)
+        if ext == ".css":
+            data = _minify_css(data.decode("utf-8")).encode("utf-8")
+        _manifest[key] = _store(stem, ext, data)
+
+
+def _save_manifest():
+    path = os.path.join(STATIC_ROOT, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    saved = {k: v for k, v in _manifest.items() if k in ASSETS}
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(saved, f, indent=2)
+    os.replace(tmp, path)
+
+
+async def load_static_assets():
+    """
+    Load the mirrored bundle and the shipped files from disk (no network).
+    Called from __main__.py before the web server starts.
+    """
+    os.makedirs(STATIC_ROOT, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _load_manifest)
+    await loop.run_in_executor(None, _load_shipped)
+    missing = [k for k in ASSETS if k not in _manifest]
+    if missing:
+        logger.warning(
+            "Static: %d asset(s) not mirrored, served from their CDN: %s "
+            "(run `python3 -m f2lnk.server.static_assets`)", len(missing), ", ".join(missing),
+        )
+    logger.info("Static: %d assets served locally", len(_manifest))
+
+
+async def mirror_static_assets():
+    """Build step: fetch every CDN asset not mirrored yet into STATIC_ROOT."""
+    os.makedirs(STATIC_ROOT, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _load_manifest)
+
+    missing = {k: u for k, u in ASSETS.items() if k not in _manifest}
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        for key, url in missing.items():
+            try:
+                _manifest[key] = await _mirror_asset(session, key, url)
+            except Exception as e:
+                logger.warning("Static: could not mirror %s (%s): %s", key, url, e)
+
+    await loop.run_in_executor(None, _save_manifest)
+    logger.info("Static: %d/%d assets mirrored", len(_manifest), len(ASSETS))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(mirror_static_assets())
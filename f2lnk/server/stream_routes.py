@@ -11,6 +11,8 @@ from f2lnk.server.exceptions import FIleNotFound, InvalidHash
 from f2lnk import StartTime, __version__
 from ..utils.time_format import get_readable_time
 from ..utils.custom_dl import ByteStreamer
+from ..utils.thumbnails import get_thumbnails, SPRITE_NAME, VTT_NAME
+from .static_assets import get_file as get_static_file
 from f2lnk.utils.render_template import render_page
 from f2lnk.vars import Var
 
@@ -58,6 +60,70 @@ async def stream_handler(request: web.Request):
         logging.critical(e.with_traceback(None))
         raise web.HTTPInternalServerError(text=str(e))
 
+@routes.get(r"/static/{name}", allow_head=True)
+async def static_handler(request: web.Request):
+    found = get_static_file(
+        request.match_info["name"], request.headers.get("Accept-Encoding", "")
+    )
+    if found is None:
+        raise web.HTTPNotFound()
+    body, content_type, encoding = found
+    headers = {
+        # Names carry a content hash, so a given URL never changes.
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept-Encoding",
+        "Access-Control-Allow-Origin": "*",
+    }
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return web.Response(body=body, content_type=content_type, headers=headers)
+
+# Plyr fetches the track with XHR; allow it when the page is served from
+# another origin than Var.URL (reverse proxy, alternate hostname).
+_THUMB_HEADERS = {"Cache-Control": "public, max-age=86400", "Access-Control-Allow-Origin": "*"}
+
+@routes.get(r"/thumbs/{id:\d+}/{name}", allow_head=True)
+async def thumbs_handler(request: web.Request):
+    try:
+        id = int(request.match_info["id"])
+        name = request.match_info["name"]
+        secure_hash = request.rel_url.query.get("hash")
+        if name not in (SPRITE_NAME, VTT_NAME):
+            raise web.HTTPNotFound()
+
+        _, tg_connect = _get_streamer()
+        file_id = await tg_connect.get_file_properties(id)
+        if file_id.unique_id[:6] != secure_hash:
+            raise InvalidHash
+
+        paths = await get_thumbnails(file_id.unique_id, id, secure_hash)
+        if not paths:
+            # Still rendering (or failed) — let the player retry later.
+            raise web.HTTPServiceUnavailable(
+                text="Thumbnails are being generated", headers={"Retry-After": "15"}
+            )
+        sprite_path, vtt_path = paths
+        if name == VTT_NAME:
+            return web.FileResponse(
+                vtt_path,
+                headers={"Content-Type": "text/vtt", **_THUMB_HEADERS},
+            )
+        return web.FileResponse(
+            sprite_path,
+            headers={"Content-Type": "image/jpeg", **_THUMB_HEADERS},
+        )
+    except InvalidHash as e:
+        raise web.HTTPForbidden(text=e.message)
+    except FIleNotFound as e:
+        raise web.HTTPNotFound(text=e.message)
+    except web.HTTPException:
+        raise
+    except (AttributeError, BadStatusLine, ConnectionResetError):
+        pass
+    except Exception as e:
+        logging.critical(e.with_traceback(None))
+        raise web.HTTPInternalServerError(text=str(e))
+
 @routes.get(r"/{path:\S+}", allow_head=True)
 async def stream_handler(request: web.Request):
     try:
@@ -82,15 +148,11 @@ async def stream_handler(request: web.Request):
 
 class_cache = {}
 
-async def media_streamer(request: web.Request, id: int, secure_hash: str):
-    range_header = request.headers.get("Range", 0)
-
+def _get_streamer():
+    """Pick the least-loaded client and return (index, its cached ByteStreamer)."""
     index = min(work_loads, key=work_loads.get)
     faster_client = multi_clients[index]
 
-    if Var.MULTI_CLIENT:
-        logging.info(f"Client {index} is now serving {request.remote}")
-
     if faster_client in class_cache:
         tg_connect = class_cache[faster_client]
         logging.debug(f"Using cached ByteStreamer object for client {index}")
@@ -98,6 +160,15 @@ async def media_streamer(request: web.Request, id: int, secure_hash: str):
         logging.debug(f"Creating new ByteStreamer object for client {index}")
         tg_connect = ByteStreamer(faster_client)
         class_cache[faster_client] = tg_connect
+    return index, tg_connect
+
+async def media_streamer(request: web.Request, id: int, secure_hash: str):
+    range_header = request.headers.get("Range", 0)
+
+    index, tg_connect = _get_streamer()
+
+    if Var.MULTI_CLIENT:
+        logging.info(f"Client {index} is now serving {request.remote}")
     logging.debug("before calling get_file_properties")
     file_id = await tg_connect.get_file_properties(id)
     logging.debug("after calling get_file_properties")
@@ -135,9 +206,6 @@ async def media_streamer(request: web.Request, id: int, secure_hash: str):
 
     req_length = until_bytes - from_bytes + 1
     part_count = math.ceil(until_bytes / chunk_size) - math.floor(offset / chunk_size)
-    body = tg_connect.yield_file(
-        file_id, index, offset, first_part_cut, last_part_cut, part_count, chunk_size
-    )
 
     mime_type = file_id.mime_type
     file_name = file_id.file_name
@@ -156,14 +224,38 @@ async def media_streamer(request: web.Request, id: int, secure_hash: str):
             mime_type = "application/octet-stream"
             file_name = f"{secrets.token_hex(2)}.unknown"
 
-    return web.Response(
+    # Write chunks straight to the transport instead of handing an async
+    # generator to web.Response, which buffers each chunk once more.
+    resp = web.StreamResponse(
         status=206 if range_header else 200,
-        body=body,
         headers={
             "Content-Type": f"{mime_type}",
             "Content-Range": f"bytes {from_bytes}-{until_bytes}/{file_size}",
-            "Content-Length": str(req_length),
             "Content-Disposition": f'{disposition}; filename="{file_name}"',
             "Accept-Ranges": "bytes",
         },
     )
+    resp.content_length = req_length
+    await resp.prepare(request)
+
+    if request.method == "HEAD":
+        return resp
+
+    body = tg_connect.yield_file(
+        file_id, index, offset, first_part_cut, last_part_cut, part_count, chunk_size
+    )
+    try:
+        async for chunk in body:
+            # write() drains the transport once its buffer fills up, so a
+            # slow client applies backpressure to the Telegram fetches.
+            await resp.write(chunk)
+    except ConnectionResetError:
+        # Client went away mid-stream (seek, closed player): headers are
+        # already out, so just end the response. aiohttp's
+        # ClientConnectionResetError subclasses it; cancellation propagates.
+        logging.debug("Client disconnected while streaming message %s", id)
+        return resp
+    finally:
+        await body.aclose()
+    await resp.write_eof()
+    return resp
@@ -0,0 +1,168 @@
+# f2lnk/utils/adaptive_download.py
+# Adaptive download scheduler for leech tasks.
+#
+# Downloads are spread over multi_clients: the main bot fetches the user's
+# message directly, helper bots fetch its BIN_CHANNEL copy when bin_index
+# already holds one (files without one stay on the main bot). How many downloads run at once is tuned like a TCP
+# window: every TUNE_INTERVAL seconds the aggregate throughput is compared
+# with the previous interval — the limit grows by one while throughput keeps
+# improving, steps back when the last increase didn't pay off, and is halved
+# on FloodWait (that client then sits out the wait).
+
+import time
+import asyncio
+import logging
+
+from pyrogram.errors import FloodWait, RPCError
+
+from f2lnk.vars import Var
+from f2lnk.bot import multi_clients, work_loads
+from f2lnk.utils.bin_index import known_bin_copy, forget_bin_copy
+from f2lnk.utils.file_properties import get_media_from_message
+from f2lnk.utils.tg_downloader import download_file
+
+logger = logging.getLogger(__name__)
+
+TUNE_INTERVAL = 5             # seconds between concurrency adjustments
+MIN_GAIN = 1.10               # throughput ratio that justifies one more slot
+
+
+class AdaptiveDownloader:
+    def __init__(self, start: int = 2, ceiling: int = None):
+        self.ceiling = max(1, ceiling or Var.LEECH_MAX_DOWNLOADS)
+        self.limit = min(start, self.ceiling)
+        self.running = 0
+        self.waiting = 0
+        self._cond = None             # created on first use, inside the running loop
+        self._bytes = 0
+        self._last_rate = 0.0
+        self._raised = False          # did the last adjustment add a slot?
+        self._tuner = None
+        self._cooldown = {}           # client index → monotonic time it may be used again
+
+    # ── concurrency window ──
+
+    async def _acquire(self):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            self.waiting += 1
+            try:
+                await self._cond.wait_for(lambda: self.running < self.limit)
+            finally:
+                self.waiting -= 1
+            self.running += 1
+        if self._tuner is None or self._tuner.done():
+            self._tuner = asyncio.ensure_future(self._tune())
+
+    async def _release(self):
+        async with self._cond:
+            self.running -= 1
+            self._cond.notify_all()
+
+    async def _set_limit(self, limit: int, reason: str):
+        limit = max(1, min(limit, self.ceiling))
+        if limit == self.limit:
+            return
+        logger.info("Downloads: concurrency %d → %d (%s)", self.limit, limit, reason)
+        async with self._cond:
+            self.limit = limit
+            self._cond.notify_all()
+
+    async def _tune(self):
+        """Hill-climb the limit on measured throughput while there is work."""
+        self._bytes, self._last_rate, self._raised = 0, 0.0, False
+        while self.running or self.waiting:
+            await asyncio.sleep(TUNE_INTERVAL)
+            rate, self._bytes = self._bytes / TUNE_INTERVAL, 0
+            saturated = self.running >= self.limit and self.waiting > 0
+            if self._raised and rate < self._last_rate * MIN_GAIN:
+                # The extra slot didn't buy anything — give it back and hold.
+                await self._set_limit(self.limit - 1, "no throughput gain")
+                self._raised = False
+            elif saturated and (not self._last_rate or rate >= self._last_rate * MIN_GAIN):
+                await self._set_limit(self.limit + 1, f"{rate / 1048576:.1f} MiB/s")
+                self._raised = True
+            else:
+                self._raised = False
+            self._last_rate = rate
+
+    def _fetched(self, nbytes: int):
+        # Only bytes fetched now: parts resumed from disk say nothing about throughput.
+        self._bytes += nbytes
+
+    async def _flood_wait(self, index, wait: int):
+        """
+        Park the client for the wait and halve the window — once per cooldown:
+        the parallel part workers of one download all hit the same FloodWait.
+        """
+        already_parked = self._cooldown.get(index, 0) > time.monotonic()
+        self._cooldown[index] = max(self._cooldown.get(index, 0), time.monotonic() + wait)
+        if already_parked:
+            return
+        logger.warning("Downloads: FloodWait %ss on client %s", wait, index)
+        await self._set_limit(self.limit // 2, f"FloodWait {wait}s")
+
+    # ── client selection ──
+
+    async def _pick_client(self, main_client, helpers: bool = True):
+        """
+        Least-loaded client that is not sitting out a FloodWait. download_file
+        keeps work_loads for the clients it actually uses.
+        """
+        if not multi_clients or not helpers:
+            key = 0 if multi_clients else None
+            wait = self._cooldown.get(key, 0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            return key, main_client
+        while True:
+            now = time.monotonic()
+            ready = [i for i in multi_clients if self._cooldown.get(i, 0) <= now]
+            if ready:
+                index = min(ready, key=lambda i: work_loads.get(i, 0))
+                return index, multi_clients[index]
+            await asyncio.sleep(min(self._cooldown[i] for i in multi_clients) - now)
+
+    async def _fetch(self, main_client, index, client, file_msg, file_name, bin_msg_id):
+        if client is main_client or index == 0:
+            return await download_file(
+                main_client, file_msg, file_name, on_fetched=self._fetched, use_helpers=False,
+                on_flood_wait=self._flood_wait,
+            )
+        # Helper bots can't see the user's chat, only BIN_CHANNEL.
+        bin_msg = await client.get_messages(Var.BIN_CHANNEL, bin_msg_id)
+        if not bin_msg or bin_msg.empty:
+            # Deleted since it was indexed: drop the entry, the main bot takes over.
+            await forget_bin_copy(get_media_from_message(file_msg).file_unique_id)
+            raise RPCError(f"BIN_CHANNEL message {bin_msg_id} is gone")
+        return await download_file(
+            client, bin_msg, file_name, on_fetched=self._fetched, use_helpers=False,
+            on_flood_wait=self._flood_wait,
+        )
+
+    async def download(self, main_client, file_msg, file_name: str):
+        """Download file_msg to file_name once a slot is free; returns the path."""
+        await self._acquire()
+        try:
+            # Only an already-indexed BIN copy is used; downloading never forwards one.
+            bin_msg_id = await known_bin_copy(file_msg) if len(multi_clients) > 1 else None
+            while True:
+                index, client = await self._pick_client(main_client, helpers=bool(bin_msg_id))
+                try:
+                    return await self._fetch(main_client, index, client, file_msg, file_name, bin_msg_id)
+                except FloodWait as e:
+                    await self._flood_wait(index, int(getattr(e, "value", 0) or 0) or 1)
+                except RPCError as e:
+                    if client is main_client or index == 0:
+                        raise
+                    logger.warning("Downloads: client %s failed (%s), using main client", index, e)
+                    return await download_file(
+                        main_client, file_msg, file_name, on_fetched=self._fetched, use_helpers=False,
+                        on_flood_wait=self._flood_wait,
+                    )
+        finally:
+            await self._release()
+
+
+downloader = AdaptiveDownloader()
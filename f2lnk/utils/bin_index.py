@@ -0,0 +1,92 @@
+# f2lnk/utils/bin_index.py
+# Reuse the BIN_CHANNEL copy of a file instead of forwarding it again.
+
+import logging
+
+from pyrogram.errors import RPCError, MessageIdInvalid, FileReferenceExpired
+from pyrogram.types import Message
+
+from f2lnk.vars import Var
+from f2lnk.utils.database import Database
+from f2lnk.utils.file_properties import get_media_from_message, get_name, get_hash
+
+logger = logging.getLogger(__name__)
+db = Database(Var.DATABASE_URL, Var.name)
+
+
+async def get_or_forward_to_bin(m: Message):
+    """
+    Return (bin_msg_id, file_name, file_hash) for the media in `m`.
+    If this file_unique_id was stored before and that BIN_CHANNEL message
+    still holds the media, it is reused and nothing is sent; otherwise `m`
+    is forwarded and the new message id is recorded.
+    """
+    media = get_media_from_message(m)
+    unique_id = getattr(media, "file_unique_id", None)
+
+    if unique_id:
+        try:
+            msg_id = await db.get_bin_msg_id(unique_id)
+        except Exception as e:
+            logger.debug("bin_index lookup failed: %s", e)
+            msg_id = None
+        if msg_id and await _bin_copy_alive(m._client, msg_id):
+            # Same file_unique_id → same name/hash as the stored copy
+            return msg_id, get_name(m), get_hash(m)
+        if msg_id:
+            logger.info("BIN_CHANNEL message %s is gone, forwarding %s again", msg_id, unique_id)
+            await forget_bin_copy(unique_id)
+
+    log_msg = await m.forward(chat_id=Var.BIN_CHANNEL)
+    if unique_id:
+        try:
+            await db.add_bin_msg_id(unique_id, log_msg.id)
+        except Exception as e:
+            logger.debug("bin_index record failed: %s", e)
+    return log_msg.id, get_name(log_msg), get_hash(log_msg)
+
+
+async def _bin_copy_alive(client, msg_id: int) -> bool:
+    """False only if the stored message is known to be deleted or unusable."""
+    try:
+        stored = await client.get_messages(Var.BIN_CHANNEL, msg_id)
+    except (MessageIdInvalid, FileReferenceExpired):
+        return False
+    except RPCError as e:
+        # FloodWait, network trouble: keep trusting the index.
+        logger.debug("Couldn't check BIN_CHANNEL message %s: %s", msg_id, e)
+        return True
+    return bool(stored and not stored.empty and get_media_from_message(stored))
+
+
+async def forget_bin_copy(file_unique_id: str):
+    """Drop an index entry whose BIN_CHANNEL message is gone."""
+    try:
+        await db.remove_bin_msg_id(file_unique_id)
+    except Exception as e:
+        logger.debug("bin_index removal failed: %s", e)
+
+
+async def known_bin_copy(m: Message):
+    """Message id of the stored BIN_CHANNEL copy of `m`'s media, or None."""
+    if m.chat is not None and m.chat.id == Var.BIN_CHANNEL:
+        return m.id
+    unique_id = getattr(get_media_from_message(m), "file_unique_id", None)
+    if not unique_id:
+        return None
+    try:
+        return await db.get_bin_msg_id(unique_id)
+    except Exception as e:
+        logger.debug("bin_index lookup failed: %s", e)
+        return None
+
+
+async def remember_bin_copy(bin_msg: Message):
+    """Index a message we posted to BIN_CHANNEL ourselves (uploads, forwards)."""
+    unique_id = getattr(get_media_from_message(bin_msg), "file_unique_id", None)
+    if not unique_id:
+        return
+    try:
+        await db.add_bin_msg_id(unique_id, bin_msg.id)
+    except Exception as e:
+        logger.debug("bin_index record failed: %s", e)
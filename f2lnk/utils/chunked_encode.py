@@ -0,0 +1,167 @@
+# f2lnk/utils/chunked_encode.py
+# Segment-parallel video encoding.
+#
+# One x264 process stops scaling long before a big box runs out of cores, so
+# long inputs are split (stream copy, segment muxer) at the first keyframe
+# after each of N evenly spaced times. Every segment is encoded on its own
+# through the shared scheduler — at most half the encode slots per file, so
+# other users' jobs still get slots — with the same video arguments, so CRF /
+# bitrate control is identical across segments. The encoded segments are
+# joined with the concat demuxer (stream copy) and muxed with the audio from
+# the source in a final pass. Both this and the one-pass fallback keep the
+# streams given by stream_maps(), so the output doesn't depend on the path.
+
+import os
+import time
+import shutil
+import asyncio
+import logging
+
+from f2lnk.vars import Var
+from f2lnk.utils import probe_cache
+from f2lnk.utils.ffmpeg_runner import run_ffmpeg, format_progress
+from f2lnk.utils.ffmpeg_scheduler import scheduler, ENCODE
+
+logger = logging.getLogger(__name__)
+
+MIN_SEGMENT_SECONDS = 60
+
+
+def stream_maps(video_input: int = 0, audio_input: int = 0) -> list:
+    """Streams a compress output keeps: the first video and every audio track."""
+    return ["-map", f"{video_input}:v:0", "-map", f"{audio_input}:a?"]
+
+
+def chunk_count(duration: float) -> int:
+    """How many segments to encode a file of this length in (1 = don't chunk)."""
+    if not Var.CHUNKED_ENCODE or duration < Var.CHUNKED_ENCODE_MIN_SECONDS:
+        return 1
+    share = max(1, scheduler.stats()[ENCODE]["slots"] // 2)
+    wanted = min(Var.ENCODE_CHUNKS or share, share)
+    return max(1, min(wanted, int(duration // MIN_SEGMENT_SECONDS)))
+
+
+async def chunked_encode(
+    src: str,
+    output_path: str,
+    video_args: list,
+    audio_args: list,
+    chunks: int,
+    user_id: int = None,
+    status_msg=None,
+    label: str = "FFmpeg job",
+    on_start=None,
+    cancel_event: asyncio.Event = None,
+) -> tuple:
+    """
+    Encode src in `chunks` keyframe-aligned segments concurrently.
+    video_args are the encoder options (e.g. ["-c:v", "libx264", "-crf", "23"]),
+    audio_args the audio options for the final mux (e.g. ["-c:a", "copy"]).
+    Returns (ok, error_text).
+    """
+    duration = await probe_cache.probe_duration(src)
+    work_dir = output_path + ".chunks"
+    os.makedirs(work_dir, exist_ok=True)
+    procs = []
+
+    def _track(proc):
+        procs.append(proc)
+        if on_start is not None:
+            on_start(proc)
+
+    async def _kill_on_cancel():
+        await cancel_event.wait()
+        for proc in procs:
+            if proc.returncode is None:
+                proc.kill()
+
+    watcher = asyncio.ensure_future(_kill_on_cancel()) if cancel_event else None
+    run_kwargs = {"user_id": user_id, "on_start": _track, "cancel_event": cancel_event}
+    try:
+        # 1) Split the video stream at keyframes (no decode).
+        split_times = ",".join(f"{duration * k / chunks:.3f}" for k in range(1, chunks))
+        src_pattern = os.path.join(work_dir, "src%03d.ts")
+        cmd = [
+            "ffmpeg", "-y", "-i", src,
+            "-map", "0:v:0", "-c", "copy",
+            "-f", "segment", "-segment_times", split_times,
+            "-segment_format", "mpegts", "-reset_timestamps", "1",
+            src_pattern,
+        ]
+        rc, err = await run_ffmpeg(cmd, status_msg=status_msg, label=label, **run_kwargs)
+        if rc != 0:
+            return False, err
+        segments = sorted(f for f in os.listdir(work_dir) if f.startswith("src"))
+        if not segments:
+            return False, "Segmenting produced no output"
+
+        # 2) Encode all segments concurrently; each waits for an encode slot.
+        threads = str(max(1, (os.cpu_count() or 2) // min(len(segments), scheduler.stats()[ENCODE]["slots"])))
+        done = [0.0] * len(segments)
+        last_edit = 0.0
+        started = time.time()
+
+        async def _report(n, seconds, _speed):
+            nonlocal last_edit
+            done[n] = seconds
+            now = time.time()
+            if status_msg is None or now - last_edit < 5:
+                return
+            last_edit = now
+            total_done = sum(done)
+            # Wall-clock speed over the whole job, not per segment.
+            speed = total_done / max(now - started, 0.001)
+            try:
+                await status_msg.edit_text(
+                    format_progress(f"{label} ({len(segments)} segments)", total_done, duration, speed)
+                )
+            except Exception:
+                pass
+
+        async def _encode(n, name):
+            out = os.path.join(work_dir, f"enc{n:03d}.ts")
+            seg_cmd = [
+                "ffmpeg", "-y", "-i", os.path.join(work_dir, name),
+                *video_args, "-threads", threads, "-an", "-sn",
+                "-f", "mpegts", out,
+            ]
+            rc, err = await run_ffmpeg(
+                seg_cmd, on_progress=lambda s, sp: _report(n, s, sp), **run_kwargs
+            )
+            if rc != 0:
+                raise RuntimeError(err or f"segment {n} failed")
+            return out
+
+        jobs = [asyncio.ensure_future(_encode(n, name)) for n, name in enumerate(segments)]
+        try:
+            encoded = await asyncio.gather(*jobs)
+        except RuntimeError as e:
+            # One segment failed — stop the rest (queued or running).
+            for job in jobs:
+                job.cancel()
+            await asyncio.gather(*jobs, return_exceptions=True)
+            return False, str(e)
+
+        # 3) Join losslessly and bring the audio back from the source.
+        list_path = os.path.join(work_dir, "encoded.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for out in encoded:
+                f.write(f"file '{os.path.abspath(out)}'\n")
+        cmd = [
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-i", src,
+            *stream_maps(0, 1),
+            "-c:v", "copy", *audio_args,
+            output_path,
+        ]
+        rc, err = await run_ffmpeg(
+            cmd, status_msg=status_msg, label=label, duration=duration, **run_kwargs
+        )
+        if rc != 0:
+            return False, err
+        return True, ""
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -105,12 +105,14 @@ class ByteStreamer:
                     chunk = r.bytes
                     if not chunk:
                         break
+                    # Slicing bytes copies the whole chunk; a memoryview slice
+                    # only moves the window, so edge parts cost nothing extra.
                     elif part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
+                        yield memoryview(chunk)[first_part_cut:last_part_cut]
                     elif current_part == 1:
-                        yield chunk[first_part_cut:]
+                        yield memoryview(chunk)[first_part_cut:]
                     elif current_part == part_count:
-                        yield chunk[:last_part_cut]
+                        yield memoryview(chunk)[:last_part_cut]
                     else:
                         yield chunk
 
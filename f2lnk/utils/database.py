@@ -11,6 +11,8 @@ class Database:
         self.col = self.db.users
         self.bannedList = self.db.bannedList
         self.auth_users = self.db.auth_users
+        self.media_index = self.db.media_index
+        self.bin_index = self.db.bin_index
 
     def new_user(self, id):
         today = datetime.date.today().isoformat()
@@ -173,3 +175,49 @@ class Database:
     async def has_authorized_users(self):
         count = await self.auth_users.count_documents({})
         return count > 0
+
+    async def ensure_indexes(self):
+        """Indexes for the lookup collections (idempotent, called at startup)."""
+        await self.media_index.create_index([('sha256', 1), ('size', 1)], unique=True)
+        await self.media_index.create_index([('quick', 1), ('size', 1)])
+        await self.bin_index.create_index('file_unique_id', unique=True)
+
+    # --- Upload dedup index: content hash + size → already-uploaded media ---
+    async def get_cached_media(self, sha256, size):
+        return await self.media_index.find_one({'sha256': sha256, 'size': int(size)})
+
+    async def find_cached_media_quick(self, quick, size):
+        """Candidates by cheap head/tail key; confirm with the full sha256."""
+        return await self.media_index.find({'quick': quick, 'size': int(size)}).to_list(length=10)
+
+    async def add_cached_media(self, sha256, size, name, file_id=None, bin_msg_id=None, quick=None):
+        fields = {'name': name, 'updated': datetime.datetime.utcnow()}
+        if quick:
+            fields['quick'] = quick
+        if file_id:
+            fields['file_id'] = file_id
+        if bin_msg_id:
+            fields['bin_msg_id'] = int(bin_msg_id)
+        await self.media_index.update_one(
+            {'sha256': sha256, 'size': int(size)},
+            {'$set': fields},
+            upsert=True
+        )
+
+    async def remove_cached_media(self, sha256, size):
+        await self.media_index.delete_one({'sha256': sha256, 'size': int(size)})
+
+    # --- BIN_CHANNEL index: file_unique_id → message id of our stored copy ---
+    async def get_bin_msg_id(self, file_unique_id):
+        doc = await self.bin_index.find_one({'file_unique_id': file_unique_id})
+        return doc['msg_id'] if doc else None
+
+    async def add_bin_msg_id(self, file_unique_id, msg_id):
+        await self.bin_index.update_one(
+            {'file_unique_id': file_unique_id},
+            {'$set': {'msg_id': int(msg_id), 'date': datetime.date.today().isoformat()}},
+            upsert=True
+        )
+
+    async def remove_bin_msg_id(self, file_unique_id):
+        await self.bin_index.delete_one({'file_unique_id': file_unique_id})
@@ -0,0 +1,318 @@
+# f2lnk/utils/disk_budget.py
+# Disk-space admission control for jobs that stage files locally.
+#
+# Every job reserves its estimated footprint (inputs + outputs + temp) before
+# it writes anything. A reservation is admitted when it fits next to the
+# outstanding part of every running reservation — its estimate minus what its
+# directory already holds, since that is already gone from the free space —
+# keeping DISK_FREE_MARGIN_MB spare, and, with DISK_BUDGET_GB set, within that
+# total. Jobs that don't fit wait in FIFO order instead of failing midway.
+
+import os
+import time
+import shutil
+import asyncio
+import logging
+import itertools
+from contextlib import asynccontextmanager
+
+from f2lnk.vars import Var
+from f2lnk.utils.human_readable import humanbytes
+
+logger = logging.getLogger(__name__)
+
+RECHECK_INTERVAL = 10         # seconds between free-space checks while jobs wait
+SIZE_CACHE_TTL = 2            # seconds a measured directory size is reused
+
+# Footprint as a multiple of the input size, per job kind
+FOOTPRINT_FACTORS = {
+    "vt": 2.2, "va": 2.2, "aa": 2.2, "vs": 2.2,   # merges: inputs + joined output
+    "cv": 2.5,                                    # + segment / two-pass temp files
+    "wv": 2.2, "tv": 2.0, "cut": 2.2,
+    "rv": 1.6, "ev": 2.0,
+    "zip": 2.1,                                   # files + archive
+    "unzip": 4.0,                                 # archive + extracted (ratio unknown)
+    "torrent": 1.1,
+    "upload": 1.0,                                # /upload: the fetched file, sent as is
+    "video": 2.5,                                 # video_tools single-file jobs
+    "probe": 1.0,
+}
+DEFAULT_FACTOR = 2.0
+# Kinds whose output is never media-split (archives are split as raw slices)
+NO_MEDIA_SPLIT = ("zip", "unzip", "probe")
+# split_upload.TG_MAX_SIZE (importing it here would pull in the database layer)
+MEDIA_SPLIT_MIN = int(1.95 * 1024 ** 3)
+
+
+class DiskBudgetError(Exception):
+    """The job can never fit (larger than the disk or the configured budget)."""
+
+
+def estimate_footprint(input_bytes: int, kind: str, inputs_on_disk: bool = True) -> int:
+    """Bytes a job of this kind is expected to need for input_bytes of input."""
+    factor = FOOTPRINT_FACTORS.get(kind, DEFAULT_FACTOR)
+    if not inputs_on_disk:
+        factor = max(factor - 1.0, 0.5)   # streamed input is never written locally
+    if Var.SPLIT_MODE == "media" and kind not in NO_MEDIA_SPLIT and input_bytes > MEDIA_SPLIT_MIN:
+        # All media-split parts are cut before the upload starts: one more
+        # copy of an output assumed as large as the input.
+        factor += 1.0
+    return int(input_bytes * factor)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _dir_sizes(paths) -> dict:
+    return {path: _dir_size(path) for path in paths}
+
+
+def wait_notifier(send, label: str):
+    """on_wait callback that posts a 'waiting for disk space' note via send(text)."""
+    async def on_wait(needed: int, free: int):
+        await send(
+            f"💾 **Waiting for disk space** — {label}\n"
+            f"Needs about `{humanbytes(needed)}`, `{humanbytes(free)}` free.\n"
+            f"It starts automatically when other jobs finish."
+        )
+    return on_wait
+
+
+async def _notify(on_wait, nbytes: int, free: int):
+    try:
+        await on_wait(nbytes, free)
+    except Exception as e:
+        logger.debug("Disk wait notification failed: %s", e)
+
+
+class _Reservation:
+    def __init__(self, rid: int, nbytes: int, label: str, path: str, key: str = None):
+        self.id = rid
+        self.nbytes = nbytes
+        self.label = label
+        self.path = path
+        self.key = key                # hold() key, for reservations grown by hold()
+        self.since = time.time()
+
+    def outstanding(self, dir_size=_dir_size) -> int:
+        """Reserved bytes not yet written to disk (so not yet out of free space)."""
+        if not self.path or not os.path.isdir(self.path):
+            return self.nbytes
+        return max(0, self.nbytes - dir_size(self.path))
+
+
+class DiskBudget:
+    def __init__(self, root: str = "."):
+        self.root = root
+        self._active = {}             # id → _Reservation
+        self._waiting = []            # _Reservation, FIFO
+        self._ids = itertools.count(1)
+        self._cond = None             # created inside the running loop
+        self._holds = {}              # key → the key's one _Reservation (in _active)
+        self._sizes = {}              # path → (monotonic time, bytes), see _measure
+        self._measuring = None        # the running _measure_paths task
+
+    def _budget(self) -> int:
+        return int(Var.DISK_BUDGET_GB * 1024 ** 3)
+
+    def _margin(self) -> int:
+        return Var.DISK_FREE_MARGIN_MB * 1024 ** 2
+
+    def _dir_size(self, path: str) -> int:
+        # Last measured size; an unmeasured directory counts as empty (its
+        # whole reservation is outstanding) until _measure gets to it.
+        return self._sizes.get(path, (0, 0))[1]
+
+    async def _measure(self):
+        """
+        Refresh the sizes of stale job directories in an executor, outside
+        the lock. Waiters that wake together share one walk.
+        """
+        paths = {r.path for r in list(self._active.values()) + self._waiting if r.path}
+        for path in set(self._sizes) - paths:
+            del self._sizes[path]
+        now = time.monotonic()
+        stale = [p for p in paths if p not in self._sizes or now - self._sizes[p][0] > SIZE_CACHE_TTL]
+        if not stale:
+            return
+        if self._measuring is None:
+            self._measuring = asyncio.ensure_future(self._measure_paths(stale))
+        await asyncio.shield(self._measuring)
+
+    async def _measure_paths(self, paths: list):
+        try:
+            sizes = await asyncio.get_running_loop().run_in_executor(None, _dir_sizes, paths)
+            now = time.monotonic()
+            for path, size in sizes.items():
+                self._sizes[path] = (now, size)
+        finally:
+            self._measuring = None
+
+    def _fits(self, res: _Reservation) -> bool:
+        free = shutil.disk_usage(self.root).free - self._margin()
+        # A resumed job's own files are already out of `free`, so count only the rest.
+        used = sum(r.outstanding(self._dir_size) for r in self._active.values())
+        if res.outstanding(self._dir_size) > free - used:
+            return False
+        budget = self._budget()
+        if budget and res.nbytes > budget - sum(r.nbytes for r in self._active.values()):
+            return False
+        return True
+
+    def _my_turn(self, res: _Reservation) -> bool:
+        """
+        FIFO, except that a hold() never queues behind its own key: growing an
+        admitted job must not wait for jobs that wait for it to finish.
+        """
+        if res.key is not None and res.key in self._holds:
+            return True
+        for r in self._waiting:
+            if r is res:
+                return True
+            if res.key is None or r.key != res.key:
+                return False
+        return True
+
+    def _check_possible(self, nbytes: int):
+        usage = shutil.disk_usage(self.root)
+        limit = min(usage.total - self._margin(), self._budget() or usage.total)
+        if nbytes > limit:
+            raise DiskBudgetError(
+                f"needs about {nbytes / 1024 ** 3:.1f} GB, more than this server can hold "
+                f"({limit / 1024 ** 3:.1f} GB)"
+            )
+
+    async def _wait_for_room(self, res: _Reservation, on_wait, cancel_event, admit) -> bool:
+        """
+        Queue res until it fits, then call admit() with self._cond held.
+        Directory sizes are measured before each check, without the lock.
+        False if cancelled.
+        """
+        self._waiting.append(res)
+        announced = False
+        try:
+            while True:
+                await self._measure()
+                async with self._cond:
+                    if cancel_event is not None and cancel_event.is_set():
+                        return False
+                    if self._my_turn(res) and self._fits(res):
+                        self._waiting.remove(res)
+                        admit()
+                        self._cond.notify_all()
+                        return True
+                    if not announced:
+                        announced = True
+                        free = shutil.disk_usage(self.root).free
+                        logger.info("Disk: %s waits for %d bytes (%d free)", res.label, res.nbytes, free)
+                        if on_wait is not None:
+                            # Not awaited here: it would hold the lock over a Telegram call.
+                            asyncio.ensure_future(_notify(on_wait, res.nbytes, free))
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), RECHECK_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            if res in self._waiting:
+                self._waiting.remove(res)
+                async with self._cond:
+                    self._cond.notify_all()
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int, label: str, path: str = None, on_wait=None,
+                      cancel_event: asyncio.Event = None):
+        """
+        Hold nbytes of disk for the duration of the block, waiting for room
+        first. path is the job's working directory (used to tell reserved
+        from already-written bytes). on_wait(needed, free) is awaited once
+        if the job has to queue. Yields the reservation, or None if
+        cancel_event was set while queued. Raises DiskBudgetError if it can
+        never fit.
+        """
+        self._check_possible(nbytes)
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        res = _Reservation(next(self._ids), nbytes, label, path)
+
+        def admit():
+            self._active[res.id] = res
+
+        if not await self._wait_for_room(res, on_wait, cancel_event, admit):
+            res = None
+        if res is None:
+            yield None
+            return
+        try:
+            yield res
+        finally:
+            async with self._cond:
+                self._active.pop(res.id, None)
+                self._cond.notify_all()
+
+    async def hold(self, key: str, nbytes: int, label: str, path: str = None, on_wait=None):
+        """
+        reserve() for jobs without one enclosing block (e.g. files collected
+        one by one): the space stays reserved until release(key). Holds on
+        the same key grow one reservation, so only the added bytes are
+        checked and files already written under path are not counted twice.
+        """
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        current = self._holds.get(key)
+        self._check_possible(nbytes + (current.nbytes if current else 0))
+        # Growth is checked on its own bytes; the key's reservation already
+        # accounts for what it has written.
+        res = _Reservation(next(self._ids), nbytes, label, None if current else path, key)
+
+        def admit():
+            current = self._holds.get(key)
+            if current is None:
+                res.path = path
+                self._active[res.id] = self._holds[key] = res
+            else:
+                current.nbytes += nbytes
+                current.path = current.path or path
+
+        await self._wait_for_room(res, on_wait, None, admit)
+
+    async def release(self, key: str):
+        res = self._holds.get(key)
+        if res is None:
+            return
+        async with self._cond:
+            self._holds.pop(key, None)
+            self._active.pop(res.id, None)
+            self._cond.notify_all()
+
+    def live_paths(self) -> set:
+        """Directories and hold keys of running or queued jobs."""
+        paths = {r.path for r in list(self._active.values()) + self._waiting if r.path}
+        return paths | set(self._holds)
+
+    def snapshot(self) -> dict:
+        """Current disk state, reservations and queue (for /disk)."""
+        usage = shutil.disk_usage(self.root)
+        now = time.time()
+
+        def describe(r):
+            return {"label": r.label, "bytes": r.nbytes, "age": int(now - r.since)}
+
+        return {
+            "total": usage.total,
+            "free": usage.free,
+            "budget": self._budget(),
+            "reserved": sum(r.nbytes for r in self._active.values()),
+            "active": [describe(r) for r in self._active.values()],
+            "waiting": [describe(r) for r in self._waiting],
+        }
+
+
+disk_budget = DiskBudget()
@@ -0,0 +1,212 @@
+# f2lnk/utils/ffmpeg_runner.py
+# Shared ffmpeg runner: waits for a scheduler slot, streams `-progress`
+# output into a live status message (percent / speed / ETA) and keeps only
+# the last few stderr lines instead of buffering hours of encoder logs.
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+from f2lnk.utils.time_format import get_readable_time
+from f2lnk.utils.ffmpeg_scheduler import ffmpeg_slot
+from f2lnk.utils.probe_cache import probe_duration
+
+logger = logging.getLogger(__name__)
+
+STDERR_TAIL_LINES = 60        # stderr lines kept for error reports
+PROGRESS_INTERVAL = 5         # seconds between status edits
+_MAX_PARTIAL_LINE = 4096      # longest unterminated line buffered from a pipe
+
+
+def _parse_seconds(value: str):
+    """'90', '90.5', '01:30' or '00:01:30.5' → seconds (None if unparsable)."""
+    try:
+        total = 0.0
+        for part in str(value).split(":"):
+            total = total * 60 + float(part)
+        return total
+    except ValueError:
+        return None
+
+
+def _concat_entries(list_path: str) -> list:
+    entries = []
+    try:
+        with open(list_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("file "):
+                    entries.append(line[5:].strip().strip("'"))
+    except OSError:
+        pass
+    base = os.path.dirname(list_path)
+    return [e if os.path.isabs(e) else os.path.join(base, e) for e in entries]
+
+
+async def estimate_duration(cmd: list) -> float:
+    """
+    Expected output duration of an ffmpeg command in seconds (0 if unknown):
+    the longest input (concat lists are summed), capped by -t / -to.
+    """
+    longest = 0.0
+    last_format = None
+    for i, arg in enumerate(cmd[:-1]):
+        if arg == "-f":
+            last_format = cmd[i + 1]
+        elif arg == "-i":
+            src = cmd[i + 1]
+            if last_format == "concat":
+                dur = 0.0
+                for entry in _concat_entries(src):
+                    dur += await probe_duration(entry)
+            elif last_format == "lavfi":
+                dur = 0.0
+            else:
+                dur = await probe_duration(src)
+            longest = max(longest, dur)
+            last_format = None
+
+    opts = dict(zip(cmd[:-1], cmd[1:]))
+    if "-t" in opts:
+        limit = _parse_seconds(opts["-t"])
+        if limit:
+            longest = min(longest, limit) if longest else limit
+    elif "-to" in opts:
+        end = _parse_seconds(opts["-to"])
+        start = _parse_seconds(opts.get("-ss", "0")) or 0.0
+        if end and end > start:
+            span = end - start
+            longest = min(longest, span) if longest else span
+    return longest
+
+
+def format_progress(label: str, done: float, duration: float, speed: float) -> str:
+    if duration > 0:
+        pct = min(done / duration * 100, 100.0)
+        filled = int(pct // 10)
+        bar = "█" * filled + "░" * (10 - filled)
+        eta = get_readable_time(int((duration - done) / speed)) if speed > 0 else "—"
+        return (
+            f"⚙️ **Processing** — {label}\n"
+            f"[{bar}] **{pct:.1f}%**\n"
+            f"⏱ {get_readable_time(int(done)) or '0s'} / {get_readable_time(int(duration))}"
+            f" • ⚡ {speed:.2f}x • ETA {eta or '0s'}"
+        )
+    return (
+        f"⚙️ **Processing** — {label}\n"
+        f"⏱ {get_readable_time(int(done)) or '0s'} processed • ⚡ {speed:.2f}x"
+    )
+
+
+async def _read_lines(stream, on_line):
+    """Split a pipe on \\n / \\r without ever holding more than one short line."""
+    partial = b""
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        partial += chunk.replace(b"\r", b"\n")
+        *lines, partial = partial.split(b"\n")
+        for line in lines:
+            if line:
+                await on_line(line.decode("utf-8", errors="replace"))
+        partial = partial[-_MAX_PARTIAL_LINE:]
+    if partial:
+        await on_line(partial.decode("utf-8", errors="replace"))
+
+
+async def run_ffmpeg(
+    cmd: list,
+    user_id: int = None,
+    status_msg=None,
+    label: str = "FFmpeg job",
+    duration: float = None,
+    on_start=None,
+    cancel_event: asyncio.Event = None,
+    timeout: float = None,
+    on_progress=None,
+) -> tuple:
+    """
+    Run cmd through the shared scheduler and return (returncode, stderr_tail).
+
+    ffmpeg commands get `-progress pipe:1 -nostats`; with a status_msg the
+    percent, speed and ETA are edited in every PROGRESS_INTERVAL seconds.
+    on_start(proc) is called once the process exists (for cancellation);
+    on_progress(done_seconds, speed) is awaited for every progress block.
+    returncode is -1 if cancel_event was set before start or on timeout.
+    """
+    is_ffmpeg = bool(cmd) and cmd[0] == "ffmpeg"
+    run_cmd = list(cmd)
+    if is_ffmpeg and "-progress" not in run_cmd:
+        run_cmd[1:1] = ["-progress", "pipe:1", "-nostats"]
+    if status_msg is not None and is_ffmpeg and duration is None:
+        duration = await estimate_duration(cmd)
+    duration = duration or 0.0
+
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    block = {}
+    last_edit = 0.0
+
+    async def on_progress_line(line: str):
+        nonlocal last_edit
+        key, sep, value = line.partition("=")
+        if not sep:
+            return
+        block[key.strip()] = value.strip()
+        if key != "progress" or (status_msg is None and on_progress is None):
+            return
+        try:
+            done = int(block.get("out_time_us") or block.get("out_time_ms") or 0) / 1_000_000
+        except ValueError:
+            done = 0.0
+        try:
+            speed = float(block.get("speed", "0").rstrip("x") or 0)
+        except ValueError:
+            speed = 0.0
+        if on_progress is not None:
+            await on_progress(max(done, 0.0), speed)
+        if status_msg is None:
+            return
+        now = time.time()
+        if value.strip() != "end" and now - last_edit < PROGRESS_INTERVAL:
+            return
+        last_edit = now
+        try:
+            await status_msg.edit_text(format_progress(label, max(done, 0.0), duration, speed))
+        except Exception:
+            pass
+
+    async def on_stderr_line(line: str):
+        tail.append(line)
+
+    async with ffmpeg_slot(cmd, user_id, status_msg, label):
+        if cancel_event is not None and cancel_event.is_set():
+            return -1, "Cancelled"
+        proc = await asyncio.create_subprocess_exec(
+            *run_cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        if on_start is not None:
+            on_start(proc)
+        work = asyncio.gather(
+            _read_lines(proc.stdout, on_progress_line),
+            _read_lines(proc.stderr, on_stderr_line),
+            proc.wait(),
+        )
+        try:
+            await asyncio.wait_for(work, timeout=timeout)
+        except asyncio.TimeoutError:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            tail.append("Process timed out.")
+            return -1, "\n".join(tail)
+        except asyncio.CancelledError:
+            if proc.returncode is None:
+                proc.kill()
+            raise
+
+    return proc.returncode, "\n".join(tail)
@@ -0,0 +1,173 @@
+# f2lnk/utils/ffmpeg_scheduler.py
+# One shared queue for every ffmpeg job the bot starts.
+#
+# Encodes (anything that decodes + re-encodes or runs a filter) are CPU bound,
+# so only FFMPEG_ENCODE_SLOTS of them run at once. Stream-copy jobs are mostly
+# I/O and get their own, larger pool so a quick remux is never stuck behind a
+# long compress. Waiters are served by plan priority (owners first, then the
+# biggest plan in Var.USER_PLANS), FIFO within the same priority.
+
+import heapq
+import asyncio
+import logging
+import itertools
+from contextlib import asynccontextmanager
+
+from f2lnk.vars import Var
+from f2lnk.utils.database import Database
+
+logger = logging.getLogger(__name__)
+db = Database(Var.DATABASE_URL, Var.name)
+
+ENCODE = "encode"
+COPY = "copy"
+
+_FILTER_FLAGS = ("-vf", "-af", "-filter_complex", "-lavfi")
+_CODEC_FLAGS = ("-c", "-codec", "-vcodec", "-acodec")
+
+
+def classify_cmd(cmd: list) -> str:
+    """ENCODE unless the command only stream-copies (subtitle codecs ignored)."""
+    if not cmd or cmd[0] != "ffmpeg":
+        return ENCODE
+    codecs = []
+    for i, arg in enumerate(cmd[:-1]):
+        if arg in _FILTER_FLAGS or arg.startswith("-filter:"):
+            return ENCODE
+        flag = arg.split(":", 1)[0]
+        if flag in _CODEC_FLAGS:
+            if arg.startswith(("-c:s", "-codec:s")):
+                continue
+            codecs.append(cmd[i + 1])
+    if codecs and all(c == "copy" for c in codecs):
+        return COPY
+    return ENCODE
+
+
+async def priority_for_user(user_id) -> int:
+    """Lower runs first: 0 for owners, then plans by daily quota, default last."""
+    ranking = sorted(Var.USER_PLANS, key=Var.USER_PLANS.get, reverse=True)
+    lowest = len(ranking) + 1
+    if user_id is None:
+        return lowest
+    if user_id in Var.OWNER_ID:
+        return 0
+    try:
+        info = await db.get_user_info(user_id)
+    except Exception as e:
+        logger.debug("Scheduler: tier lookup failed for %s: %s", user_id, e)
+        return lowest
+    tier = (info or {}).get("tier", Var.DEFAULT_PLAN)
+    if tier in ranking:
+        return ranking.index(tier) + 1
+    return lowest
+
+
+def queue_notifier(status_msg, label: str = "FFmpeg job"):
+    """on_queue callback that shows the queue position on a status message."""
+    if status_msg is None:
+        return None
+
+    async def _notify(position: int):
+        if position:
+            text = (f"⏳ **Queued** — {label}\n"
+                    f"Position **{position}** in line, waiting for a free slot...")
+        else:
+            text = f"⚙️ **Processing** — {label}..."
+        try:
+            await status_msg.edit_text(text)
+        except Exception:
+            pass
+
+    return _notify
+
+
+class _Pool:
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = max(1, size)
+        self.running = 0
+        # entries: [priority, seq, future, on_queue, last_position]
+        self.waiting = []
+
+
+class FFmpegScheduler:
+    def __init__(self, encode_slots: int, copy_slots: int):
+        self._pools = {
+            ENCODE: _Pool(ENCODE, encode_slots),
+            COPY: _Pool(COPY, copy_slots),
+        }
+        self._seq = itertools.count()
+
+    def stats(self) -> dict:
+        return {
+            name: {"running": p.running, "slots": p.size, "queued": len(p.waiting)}
+            for name, p in self._pools.items()
+        }
+
+    @asynccontextmanager
+    async def slot(self, kind: str = ENCODE, priority: int = 0, on_queue=None):
+        """Hold one slot of the given pool for the duration of the block."""
+        pool = self._pools[kind]
+        if pool.running < pool.size and not pool.waiting:
+            pool.running += 1
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            entry = [priority, next(self._seq), fut, on_queue, None]
+            heapq.heappush(pool.waiting, entry)
+            self._announce(pool)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    # The slot was handed over just as we were cancelled.
+                    self._release(pool)
+                elif entry in pool.waiting:
+                    pool.waiting.remove(entry)
+                    heapq.heapify(pool.waiting)
+                    self._announce(pool)
+                raise
+            if on_queue is not None:
+                _fire(on_queue, 0)
+        try:
+            yield
+        finally:
+            self._release(pool)
+
+    def _release(self, pool: _Pool):
+        pool.running -= 1
+        while pool.waiting and pool.running < pool.size:
+            entry = heapq.heappop(pool.waiting)
+            fut = entry[2]
+            if fut.done():
+                continue
+            pool.running += 1
+            fut.set_result(None)
+        self._announce(pool)
+
+    def _announce(self, pool: _Pool):
+        for position, entry in enumerate(sorted(pool.waiting, key=lambda e: e[:2]), 1):
+            if entry[3] is not None and entry[4] != position:
+                entry[4] = position
+                _fire(entry[3], position)
+
+
+def _fire(callback, position: int):
+    async def _run():
+        try:
+            await callback(position)
+        except Exception as e:
+            logger.debug("Scheduler: queue callback failed: %s", e)
+    asyncio.ensure_future(_run())
+
+
+scheduler = FFmpegScheduler(Var.FFMPEG_ENCODE_SLOTS, Var.FFMPEG_COPY_SLOTS)
+
+
+@asynccontextmanager
+async def ffmpeg_slot(cmd: list, user_id=None, status_msg=None, label: str = "FFmpeg job"):
+    """Classify cmd, resolve the user's priority and wait for a matching slot."""
+    kind = classify_cmd(cmd)
+    priority = await priority_for_user(user_id)
+    async with scheduler.slot(kind, priority, queue_notifier(status_msg, label)):
+        yield kind
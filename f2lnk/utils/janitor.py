@@ -0,0 +1,204 @@
+# f2lnk/utils/janitor.py
+# Background cleanup of temp directories left behind by failed or killed jobs.
+#
+# Every JANITOR_INTERVAL seconds the job roots are scanned. An entry is removed
+# only when no live job owns it (running /l tasks, tasks with saved state, and
+# running or queued disk reservations) and nothing in it changed for
+# JANITOR_MAX_AGE_HOURS. The same age rule covers half-written entries in the
+# caches (their owners prune only finished ones) and the .smartcut / .chunks
+# work dirs an ffmpeg step leaves next to its output when it is killed, even
+# inside a task that is still running. Live directories are only searched for
+# those names, never aged. Scans run in an executor. Deletion is paced: files are
+# unlinked one at a time, big files are shrunk in steps first, and the pauses
+# grow while streams or downloads are in flight so the cleanup never competes
+# with them for I/O.
+
+import os
+import time
+import asyncio
+import logging
+
+from f2lnk.vars import Var
+from f2lnk.bot import work_loads
+from f2lnk.bot.task_manager import ACTIVE_LEECH_TASKS, TASKS_ROOT, orphan_task_dirs
+from f2lnk.utils.disk_budget import disk_budget
+
+logger = logging.getLogger(__name__)
+
+# Roots whose entries each belong to one job (./tasks is handled via orphan_task_dirs)
+JOB_ROOTS = ["./downloads", "./qbl_downloads", "./vt_temp", "./zip_temp", "./mediainfo_temp", "./leech_tasks"]
+# Caches whose temp entries (and expired thumbnail failure markers) are swept
+CACHE_ROOTS = ["./encode_cache", "./thumb_cache", "./static_cache"]
+CACHE_TEMP_SUFFIXES = (".tmp", ".failed")
+# Per-step work dirs of smartcut / chunked_encode, found anywhere under the job roots
+STEP_WORK_SUFFIXES = (".smartcut", ".chunks")
+
+STARTUP_DELAY = 300           # let resumed tasks re-register first
+IDLE_PAUSE = 0.05             # seconds between deletions
+BUSY_PAUSE = 0.5              # ... while streams/downloads are running
+TRUNCATE_STEP = 256 * 1024 * 1024
+
+
+def _busy() -> bool:
+    return sum(work_loads.values()) > 0
+
+
+async def _pause():
+    await asyncio.sleep(BUSY_PAUSE if _busy() else IDLE_PAUSE)
+
+
+def _live_paths() -> list:
+    paths = {task.work_dir for task in list(ACTIVE_LEECH_TASKS.values())}
+    paths |= disk_budget.live_paths()
+    return [os.path.abspath(p) for p in paths if p and "://" not in p]
+
+
+def _is_live(entry: str, live: list, inside_ok: bool = False) -> bool:
+    """
+    entry contains, or sits inside, a directory some job is using.
+    With inside_ok, sitting inside a live directory doesn't count.
+    """
+    entry = os.path.abspath(entry)
+    return any(
+        p == entry or p.startswith(entry + os.sep)
+        or (not inside_ok and entry.startswith(p + os.sep))
+        for p in live
+    )
+
+
+def _last_touched(entry: str) -> float:
+    """Newest mtime in the tree (a dir's own mtime misses writes to existing files)."""
+    try:
+        newest = os.path.getmtime(entry)
+    except OSError:
+        return time.time()
+    for root, dirs, files in os.walk(entry):
+        for name in dirs + files:
+            try:
+                newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+            except OSError:
+                pass
+    return newest
+
+
+def _is_cache_temp(name: str) -> bool:
+    # two_pass stages into "<key>.tmp-<pid>-<ms>", the others into "<name>.tmp"
+    return name.endswith(CACHE_TEMP_SUFFIXES) or ".tmp-" in name
+
+
+def _step_work_dirs(live: list) -> list:
+    """
+    Step work dirs inside live job dirs. Anything else under the job roots
+    is aged and removed with the job entry that holds it.
+    """
+    roots = tuple(os.path.abspath(top) + os.sep for top in JOB_ROOTS + [TASKS_ROOT])
+    found = set()
+    for top in live:
+        if not top.startswith(roots) or not os.path.isdir(top):
+            continue
+        for root, dirs, _ in os.walk(top):
+            for name in [d for d in dirs if d.endswith(STEP_WORK_SUFFIXES)]:
+                found.add(os.path.join(root, name))
+                dirs.remove(name)
+    return sorted(found)
+
+
+def _candidates(live: list) -> list:
+    """
+    (entry, inside_ok) pairs; inside_ok entries may sit inside a live job's
+    dir. Blocking: run it in an executor.
+    """
+    entries = [(entry, False) for entry in orphan_task_dirs()]
+    for root in JOB_ROOTS:
+        if not os.path.isdir(root):
+            continue
+        entries += [(os.path.join(root, name), False) for name in os.listdir(root)]
+    for root in CACHE_ROOTS:
+        if not os.path.isdir(root):
+            continue
+        entries += [
+            (os.path.join(root, name), True) for name in os.listdir(root) if _is_cache_temp(name)
+        ]
+    entries += [(entry, True) for entry in _step_work_dirs(live)]
+    return entries
+
+
+async def _remove_file(path: str) -> int:
+    loop = asyncio.get_running_loop()
+    try:
+        size = os.path.getsize(path)
+        # Freeing a huge file's extents in one go stalls the disk; shrink it in steps.
+        for length in range(size - TRUNCATE_STEP, 0, -TRUNCATE_STEP):
+            await loop.run_in_executor(None, os.truncate, path, length)
+            await _pause()
+        await loop.run_in_executor(None, os.remove, path)
+    except OSError as e:
+        logger.debug("Janitor: can't remove %s: %s", path, e)
+        return 0
+    await _pause()
+    return size
+
+
+async def _remove_tree(entry: str) -> int:
+    if not os.path.isdir(entry) or os.path.islink(entry):
+        return await _remove_file(entry)
+    freed = 0
+    for root, dirs, files in os.walk(entry, topdown=False):
+        for name in files:
+            freed += await _remove_file(os.path.join(root, name))
+        for name in dirs:
+            path = os.path.join(root, name)
+            try:
+                if os.path.islink(path):
+                    os.remove(path)
+                else:
+                    os.rmdir(path)
+            except OSError:
+                pass
+    try:
+        os.rmdir(entry)
+    except OSError:
+        pass
+    return freed
+
+
+async def sweep() -> tuple:
+    """One pass over the job roots; returns (entries removed, bytes freed)."""
+    max_age = Var.JANITOR_MAX_AGE_HOURS * 3600
+    removed = freed = 0
+    loop = asyncio.get_running_loop()
+    for entry, inside_ok in await loop.run_in_executor(None, _candidates, _live_paths()):
+        # Gone with an orphan removed earlier in this sweep
+        if not os.path.lexists(entry):
+            continue
+        # Re-read live paths per entry: jobs start while a sweep is running.
+        if _is_live(entry, _live_paths(), inside_ok):
+            continue
+        if time.time() - await loop.run_in_executor(None, _last_touched, entry) < max_age:
+            continue
+        logger.info("Janitor: removing orphan %s", entry)
+        freed += await _remove_tree(entry)
+        removed += 1
+    return removed, freed
+
+
+async def _janitor_loop():
+    await asyncio.sleep(STARTUP_DELAY)
+    while True:
+        try:
+            removed, freed = await sweep()
+            if removed:
+                logger.info("Janitor: removed %d orphan(s), freed %d bytes", removed, freed)
+        except Exception as e:
+            logger.error("Janitor error: %s", e)
+        await asyncio.sleep(Var.JANITOR_INTERVAL)
+
+
+def start_janitor():
+    """Start the janitor background task. Called from __main__.py."""
+    loop = asyncio.get_event_loop()
+    loop.create_task(_janitor_loop())
+    logger.info(
+        "Janitor started: sweep every %ds, orphans older than %sh",
+        Var.JANITOR_INTERVAL, Var.JANITOR_MAX_AGE_HOURS,
+    )
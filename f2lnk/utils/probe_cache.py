@@ -0,0 +1,109 @@
+# f2lnk/utils/probe_cache.py
+# One ffprobe per input file.
+#
+# Results are the parsed `-show_format -show_streams` JSON, cached by
+# (absolute path, size, mtime) so a file rewritten in place is probed again;
+# stream URLs (utils/stream_input) are keyed by the URL itself.
+# Concurrent callers asking for the same file share a single ffprobe run.
+
+import os
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = 256
+
+_cache = OrderedDict()   # key → info dict
+_inflight = {}           # key → Future[info dict]
+
+
+def _cache_key(path: str):
+    if "://" in path:
+        return (path,)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+
+async def _run_ffprobe(path: str) -> dict:
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "quiet", "-print_format", "json",
+            "-show_format", "-show_streams", path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await proc.communicate()
+        info = json.loads(stdout.decode("utf-8", errors="replace") or "{}")
+    except Exception as e:
+        logger.warning("ffprobe failed for %s: %s", path, e)
+        return {}
+    if proc.returncode != 0:
+        return {}
+    return info
+
+
+async def probe(path: str) -> dict:
+    """
+    Parsed ffprobe output ({"format": {...}, "streams": [...]}) for a local
+    file, or {} if it is missing or unreadable. Failures are not cached.
+    The returned dict is shared — don't modify it.
+    """
+    key = _cache_key(path)
+    if key is None:
+        return {}
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+    if key in _inflight:
+        return await asyncio.shield(_inflight[key])
+
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    try:
+        info = await _run_ffprobe(path)
+    except asyncio.CancelledError:
+        fut.set_result({})
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+    if info:
+        _cache[key] = info
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    fut.set_result(info)
+    return info
+
+
+def streams(info: dict, codec_type: str = None) -> list:
+    """Streams of the given type ("video", "audio", "subtitle"), in file order."""
+    result = info.get("streams", [])
+    if codec_type:
+        result = [s for s in result if s.get("codec_type") == codec_type]
+    return result
+
+
+def duration(info: dict) -> float:
+    """Container duration in seconds, falling back to the longest stream."""
+    try:
+        value = float(info.get("format", {}).get("duration", 0) or 0)
+    except (TypeError, ValueError):
+        value = 0.0
+    if value > 0:
+        return value
+    for s in info.get("streams", []):
+        try:
+            value = max(value, float(s.get("duration", 0) or 0))
+        except (TypeError, ValueError):
+            continue
+    return value
+
+
+async def probe_duration(path: str) -> float:
+    return duration(await probe(path))
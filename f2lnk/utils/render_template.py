@@ -3,6 +3,7 @@ from f2lnk.bot import StreamBot
 from f2lnk.utils.human_readable import humanbytes
 from f2lnk.utils.file_properties import get_file_ids
 from f2lnk.server.exceptions import InvalidHash
+from f2lnk.server.static_assets import static_url
 import urllib.parse
 import logging
 import aiohttp
@@ -21,6 +22,11 @@ async def render_page(id, secure_hash, src=None):
         f"{id}/{urllib.parse.quote_plus(file_data.file_name)}?hash={secure_hash}",
     )
 
+    # Seek-preview track, rendered lazily on first request by the thumbs route.
+    thumbs_url = urllib.parse.urljoin(
+        Var.URL, f"thumbs/{id}/thumbs.vtt?hash={secure_hash}"
+    )
+
     tag = file_data.mime_type.split("/")[0].strip()
     file_size = humanbytes(file_data.file_size)
     if tag in ["video", "audio"]:
@@ -41,4 +47,6 @@ async def render_page(id, secure_hash, src=None):
         file_url=src,
         file_size=file_size,
         file_unique_id=file_data.unique_id,
+        thumbs_url=thumbs_url,
+        static=static_url,
     )
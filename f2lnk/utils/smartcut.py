@@ -0,0 +1,247 @@
+# f2lnk/utils/smartcut.py
+# Frame-accurate trimming without re-encoding the whole clip.
+#
+# A trim [start, end) is split at the keyframes inside it:
+#
+#   start ── k1 ─────────────── k2 ── end
+#   [encode] [  stream copy     ] [encode]
+#
+# Only the partial GOPs at both ends are decoded and re-encoded; every whole
+# GOP in between is copied untouched. The video pieces are written as MPEG-TS,
+# concatenated, and muxed with the audio copied straight from the source range.
+#
+# The re-encoded GOPs carry their own SPS/PPS, which differ from the source's
+# even with profile, level, pixel format and colour tags matched, so the
+# parameter sets change mid-stream at each splice. The encoder repeats them
+# before every keyframe and MP4 outputs are tagged avc3/hev1 (parameter sets
+# in-band) so decoders pick the new ones up, but players that only read the
+# container's single set (some browsers, hardware decoders) may still glitch
+# at the seams. That is why TRIM_MODE defaults to "copy". Sources whose
+# parameters the encoder can't reproduce are refused, and callers cut at
+# keyframes instead.
+
+import os
+import shutil
+import asyncio
+import logging
+
+from f2lnk.utils import probe_cache
+from f2lnk.utils.ffmpeg_runner import run_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+# source video codec → encoder used for the boundary GOPs
+SMARTCUT_ENCODERS = {
+    "h264": "libx264",
+    "hevc": "libx265",
+}
+BOUNDARY_CRF = "18"
+# ffprobe profile → encoder profile; anything else is refused
+ENCODER_PROFILES = {
+    "h264": {
+        "Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main",
+        "High": "high", "High 10": "high10", "High 4:2:2": "high422",
+        "High 4:4:4 Predictive": "high444",
+    },
+    "hevc": {"Main": "main", "Main 10": "main10"},
+}
+# MP4 sample entries that allow parameter sets inside the stream
+INBAND_TAGS = {"h264": "avc3", "hevc": "hev1"}
+_INBAND_CONTAINERS = (".mp4", ".m4v", ".mov")
+_EPSILON = 0.0005  # nudges copy seeks past float rounding onto the keyframe
+
+
+def parse_timestamp(value) -> float:
+    """
+    'HH:MM:SS(.ms)', 'MM:SS' or plain seconds → float seconds.
+    Returns None for anything else (including negative values).
+    """
+    text = str(value or "").strip()
+    if not text:
+        return None
+    parts = text.split(":")
+    if len(parts) > 3:
+        return None
+    try:
+        seconds = 0.0
+        for part in parts:
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        return None
+    return seconds if seconds >= 0 else None
+
+
+async def _keyframes_between(path: str, start: float, end: float, start_time: float) -> list:
+    """Keyframe times (relative to the container start) around [start, end]."""
+    interval = f"{max(0.0, start_time + start - 1):.3f}%{start_time + end + 1:.3f}"
+    proc = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-read_intervals", interval,
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0", path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    stdout, _ = await proc.communicate()
+    if proc.returncode != 0:
+        return []
+    times = []
+    for line in stdout.decode("utf-8", errors="replace").splitlines():
+        fields = line.strip().split(",")
+        if len(fields) < 2 or "K" not in fields[1]:
+            continue
+        try:
+            times.append(float(fields[0]) - start_time)
+        except ValueError:
+            continue  # N/A pts
+    return sorted(set(times))
+
+
+async def keyframe_after(path: str, t: float) -> float:
+    """First video keyframe at or after t (container-relative), or None."""
+    info = await probe_cache.probe(path)
+    try:
+        container_start = float(info.get("format", {}).get("start_time", 0) or 0)
+    except ValueError:
+        container_start = 0.0
+    # A GOP is rarely longer than 10 s; widen once for sparse-keyframe files.
+    for window in (10, 120):
+        keyframes = await _keyframes_between(path, t, t + window, container_start)
+        later = [k for k in keyframes if k >= t - 0.001]
+        if later:
+            return later[0]
+    return None
+
+
+def boundary_encoder_args(video: dict):
+    """
+    Encoder options that reproduce the source video stream's profile, level,
+    pixel format and colour tags, with headers repeated before every
+    keyframe. Returns (args, error); args is None when the stream can't be
+    matched (codec, profile, interlacing), and error says why.
+    """
+    codec = video.get("codec_name")
+    if codec not in SMARTCUT_ENCODERS:
+        return None, "Smart cut needs an H.264/HEVC source"
+    profile = ENCODER_PROFILES[codec].get(video.get("profile"))
+    if profile is None:
+        return None, f"Can't match the source's {codec} profile ({video.get('profile')})"
+    if video.get("field_order") not in (None, "unknown", "progressive"):
+        return None, "Can't match an interlaced source"
+    args = [
+        "-c:v", SMARTCUT_ENCODERS[codec], "-preset", "veryfast", "-crf", BOUNDARY_CRF,
+        "-profile:v", profile, "-pix_fmt", video.get("pix_fmt") or "yuv420p",
+    ]
+    level = video.get("level")
+    params = ["repeat-headers=1"]
+    if isinstance(level, int) and level > 0:
+        if codec == "h264":
+            args += ["-level", f"{level / 10:g}"]
+        else:
+            params.append(f"level-idc={level / 30:g}")
+    args += ["-x264-params" if codec == "h264" else "-x265-params", ":".join(params)]
+    for key, option in (
+        ("color_primaries", "-color_primaries"), ("color_transfer", "-color_trc"),
+        ("color_space", "-colorspace"), ("color_range", "-color_range"),
+    ):
+        value = video.get(key)
+        if value and value != "unknown":
+            args += [option, value]
+    return args, ""
+
+
+def inband_tag_args(codec: str, output_path: str) -> list:
+    """Tag MP4/MOV video as carrying its parameter sets in-band (avc3/hev1)."""
+    if os.path.splitext(output_path)[1].lower() in _INBAND_CONTAINERS and codec in INBAND_TAGS:
+        return ["-tag:v", INBAND_TAGS[codec]]
+    return []
+
+
+def plan_cut(keyframes: list, start: float, end: float) -> list:
+    """
+    [(kind, t0, t1), ...] covering [start, end), kind being "encode" or
+    "copy". With no whole GOP inside the range the result is one encode.
+    """
+    inside = [k for k in keyframes if start <= k <= end]
+    if len(inside) < 2:
+        return [("encode", start, end)]
+    k1, k2 = inside[0], inside[-1]
+    plan = [("encode", start, k1), ("copy", k1, k2), ("encode", k2, end)]
+    return [(kind, t0, t1) for kind, t0, t1 in plan if t1 - t0 > 0.001]
+
+
+async def smart_trim(src: str, start, end, output_path: str, **run_kwargs) -> tuple:
+    """
+    Trim src to [start, end) re-encoding only the boundary GOPs.
+    run_kwargs go to run_ffmpeg (user_id, status_msg, on_start, ...).
+    Returns (ok, error_text); ok is False when smart cut can't be used
+    (source parameters the encoder can't match, unparsable times) or any
+    step fails, so callers can fall back to a plain cut.
+    """
+    start_s, end_s = parse_timestamp(start), parse_timestamp(end)
+    if start_s is None or end_s is None or end_s <= start_s:
+        return False, "Invalid start/end time"
+
+    info = await probe_cache.probe(src)
+    video = probe_cache.streams(info, "video")
+    if not video:
+        return False, "Smart cut needs a video stream"
+    encoder_args, err = boundary_encoder_args(video[0])
+    if encoder_args is None:
+        return False, err
+    codec = video[0]["codec_name"]
+    try:
+        container_start = float(info.get("format", {}).get("start_time", 0) or 0)
+    except ValueError:
+        container_start = 0.0
+    end_s = min(end_s, probe_cache.duration(info) or end_s)
+
+    keyframes = await _keyframes_between(src, start_s, end_s, container_start)
+    plan = plan_cut(keyframes, start_s, end_s)
+    logger.info("Smart cut %s [%.3f, %.3f): %s", src, start_s, end_s, plan)
+
+    work_dir = output_path + ".smartcut"
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        parts = []
+        for n, (kind, t0, t1) in enumerate(plan):
+            part = os.path.join(work_dir, f"part{n}.ts")
+            if kind == "copy":
+                cmd = [
+                    "ffmpeg", "-y", "-ss", f"{t0 + _EPSILON:.6f}", "-i", src,
+                    "-t", f"{t1 - t0:.6f}",
+                    "-map", "0:v:0", "-an", "-sn", "-c", "copy",
+                    "-f", "mpegts", part,
+                ]
+            else:
+                cmd = [
+                    "ffmpeg", "-y", "-ss", f"{t0:.6f}", "-i", src,
+                    "-t", f"{t1 - t0:.6f}",
+                    "-map", "0:v:0", "-an", "-sn", *encoder_args,
+                    "-f", "mpegts", part,
+                ]
+            rc, err = await run_ffmpeg(cmd, duration=t1 - t0, **run_kwargs)
+            if rc != 0:
+                return False, err
+            parts.append(part)
+
+        list_path = os.path.join(work_dir, "parts.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for part in parts:
+                f.write(f"file '{os.path.abspath(part)}'\n")
+
+        cmd = [
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-ss", f"{start_s:.6f}", "-t", f"{end_s - start_s:.6f}", "-i", src,
+            "-map", "0:v:0", "-map", "1:a?",
+            "-c", "copy", *inband_tag_args(codec, output_path),
+            "-avoid_negative_ts", "make_zero",
+            output_path,
+        ]
+        rc, err = await run_ffmpeg(cmd, duration=end_s - start_s, **run_kwargs)
+        if rc != 0:
+            return False, err
+        return True, ""
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -1,154 +1,744 @@
-# f2lnk/utils/split_upload.py
-# Central utility for uploading files with auto-split for >2GB files
-
-import os
-import math
-import asyncio
-import logging
-
-logger = logging.getLogger(__name__)
-
-# Telegram Bot API limit: 2GB. Use 1.95GB to be safe.
-TG_MAX_SIZE = int(1.95 * 1024 * 1024 * 1024)
-
-
-async def split_file(file_path: str, max_bytes: int = TG_MAX_SIZE) -> list:
-    """
-    Split a file into parts of max_bytes each.
-    Returns list of part file paths.
-    If file is already small enough, returns [file_path].
-    """
-    file_size = os.path.getsize(file_path)
-    if file_size <= max_bytes:
-        return [file_path]
-
-    base_name = os.path.basename(file_path)
-    split_dir = os.path.join(os.path.dirname(file_path), f"{base_name}_parts")
-    os.makedirs(split_dir, exist_ok=True)
-
-    num_parts = math.ceil(file_size / max_bytes)
-    part_paths = []
-
-    logger.info("Splitting %s (%d bytes) into %d parts", base_name, file_size, num_parts)
-
-    # Use binary split via Python for cross-platform compatibility
-    with open(file_path, "rb") as f:
-        for i in range(num_parts):
-            part_name = f"{base_name}.part{i + 1:02d}"
-            part_path = os.path.join(split_dir, part_name)
-            with open(part_path, "wb") as pf:
-                remaining = max_bytes
-                while remaining > 0:
-                    chunk = f.read(min(remaining, 8 * 1024 * 1024))  # 8MB chunks
-                    if not chunk:
-                        break
-                    pf.write(chunk)
-                    remaining -= len(chunk)
-            if os.path.getsize(part_path) > 0:
-                part_paths.append(part_path)
-                logger.info("  Part %d: %s (%d bytes)", i + 1, part_name, os.path.getsize(part_path))
-
-    return part_paths
-
-
-def _humanbytes(size: int) -> str:
-    """Quick human-readable size."""
-    if not size:
-        return "0 B"
-    units = ["B", "KB", "MB", "GB", "TB"]
-    i = 0
-    while size >= 1024 and i < len(units) - 1:
-        size /= 1024
-        i += 1
-    return f"{size:.2f} {units[i]}"
-
-
-async def upload_file_or_split(
-    client,
-    chat_id: int,
-    file_path: str,
-    caption: str = "",
-    file_name: str = None,
-    reply_to: int = None,
-    progress=None,
-) -> list:
-    """
-    Upload a file to Telegram. If >1.95GB, auto-split and upload parts as documents.
-    Returns list of sent Message objects.
-    """
-    if not os.path.isfile(file_path):
-        logger.error("File not found: %s", file_path)
-        return []
-
-    file_size = os.path.getsize(file_path)
-    fname = file_name or os.path.basename(file_path)
-    sent_messages = []
-
-    if file_size <= TG_MAX_SIZE:
-        # Normal upload — detect type by extension
-        ext = os.path.splitext(file_path)[1].lower()
-        try:
-            if ext in (".mp4", ".mkv", ".avi", ".webm", ".mov", ".flv", ".ts"):
-                msg = await client.send_video(
-                    chat_id, file_path, caption=caption,
-                    file_name=fname, reply_to_message_id=reply_to,
-                    progress=progress,
-                )
-            elif ext in (".mp3", ".aac", ".ogg", ".flac", ".wav", ".m4a", ".opus", ".mka"):
-                msg = await client.send_audio(
-                    chat_id, file_path, caption=caption,
-                    file_name=fname, reply_to_message_id=reply_to,
-                    progress=progress,
-                )
-            else:
-                msg = await client.send_document(
-                    chat_id, file_path, caption=caption,
-                    file_name=fname, reply_to_message_id=reply_to,
-                    progress=progress,
-                )
-            sent_messages.append(msg)
-        except Exception as e:
-            logger.error("Upload failed for %s: %s", fname, e)
-            raise
-    else:
-        # Split and upload as documents
-        logger.info("File %s is %s (>1.95GB), splitting...", fname, _humanbytes(file_size))
-        parts = await split_file(file_path)
-
-        for i, part_path in enumerate(parts):
-            part_size = os.path.getsize(part_path)
-            part_name = os.path.basename(part_path)
-            part_caption = (
-                f"📦 **Split Upload** ({i + 1}/{len(parts)})\n"
-                f"📁 `{part_name}`\n"
-                f"📦 Size: `{_humanbytes(part_size)}`\n"
-            )
-            if i == 0 and caption:
-                part_caption = caption + "\n\n" + part_caption
-
-            try:
-                msg = await client.send_document(
-                    chat_id, part_path, caption=part_caption,
-                    file_name=part_name, reply_to_message_id=reply_to,
-                    progress=progress,
-                )
-                sent_messages.append(msg)
-            except Exception as e:
-                logger.error("Split upload failed for part %d: %s", i + 1, e)
-                raise
-            finally:
-                # Clean up part file after upload
-                try:
-                    os.remove(part_path)
-                except Exception:
-                    pass
-
-        # Clean up split directory
-        split_dir = os.path.dirname(parts[0]) if parts else None
-        if split_dir and split_dir != os.path.dirname(file_path):
-            try:
-                os.rmdir(split_dir)
-            except Exception:
-                pass
-
-    return sent_messages
+# f2lnk/utils/split_upload.py
+# Central utility for uploading files with auto-split for >2GB files
+
+import io
+import os
+import mmap
+import shutil
+import hashlib
+import asyncio
+import logging
+
+from pyrogram.errors import RPCError
+
+from f2lnk.bot import multi_clients, work_loads
+from f2lnk.vars import Var
+from f2lnk.utils.database import Database
+from f2lnk.utils.ffmpeg_runner import run_ffmpeg
+from f2lnk.utils.ffmpeg_scheduler import scheduler, priority_for_user, COPY
+from f2lnk.utils.bin_index import remember_bin_copy
+
+logger = logging.getLogger(__name__)
+db = Database(Var.DATABASE_URL, Var.name)
+
+# Telegram Bot API limit: 2GB. Use 1.95GB to be safe.
+TG_MAX_SIZE = int(1.95 * 1024 * 1024 * 1024)
+
+VIDEO_UPLOAD_EXTENSIONS = (".mp4", ".mkv", ".avi", ".webm", ".mov", ".flv", ".ts")
+AUDIO_UPLOAD_EXTENSIONS = (".mp3", ".aac", ".ogg", ".flac", ".wav", ".m4a", ".opus", ".mka")
+
+# Containers ffmpeg can stream-copy into standalone parts
+MEDIA_SPLIT_EXTENSIONS = (".mp4", ".mkv", ".webm", ".mov", ".ts", ".m4v")
+# Keyframe positions only estimate the muxed part size; leave headroom.
+MEDIA_SPLIT_MARGIN = 0.92
+# Parts of one file cut at once (each cut still takes a scheduler COPY slot)
+MEDIA_SPLIT_CONCURRENCY = 2
+
+
+class FileSlice(io.RawIOBase):
+    """
+    Read-only file object exposing bytes [offset, offset + length) of a file.
+    Lets a part of a big file be uploaded in place instead of copying it out
+    to a .partNN file first. With use_mmap the window is memory-mapped and
+    reads are served from the page cache without an extra syscall each.
+    """
+
+    def __init__(self, path: str, offset: int, length: int, name: str = None, use_mmap: bool = False):
+        super().__init__()
+        self._fp = open(path, "rb")
+        self._offset = offset
+        self._length = max(0, min(length, os.fstat(self._fp.fileno()).st_size - offset))
+        self._pos = 0
+        self._mmap = None
+        self._mmap_skew = 0
+        self.name = name or os.path.basename(path)
+
+        if use_mmap and self._length:
+            # mmap offsets must be a multiple of the allocation granularity
+            aligned = offset - (offset % mmap.ALLOCATIONGRANULARITY)
+            self._mmap_skew = offset - aligned
+            self._mmap = mmap.mmap(
+                self._fp.fileno(), self._length + self._mmap_skew,
+                access=mmap.ACCESS_READ, offset=aligned,
+            )
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            new = pos
+        elif whence == io.SEEK_CUR:
+            new = self._pos + pos
+        elif whence == io.SEEK_END:
+            new = self._length + pos
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if new < 0:
+            raise ValueError("negative seek position")
+        self._pos = new
+        return new
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self._length - self._pos
+        if remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if self._mmap is not None:
+            start = self._mmap_skew + self._pos
+            data = self._mmap[start:start + size]
+        else:
+            self._fp.seek(self._offset + self._pos)
+            data = self._fp.read(size)
+        self._pos += len(data)
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if not self._fp.closed:
+            self._fp.close()
+        super().close()
+
+
+def _slice_windows(file_size: int, max_bytes: int = TG_MAX_SIZE) -> list:
+    """[(offset, length), ...] covering the file in max_bytes windows."""
+    return [
+        (offset, min(max_bytes, file_size - offset))
+        for offset in range(0, file_size, max_bytes)
+    ]
+
+
+async def _probe_keyframes(file_path: str):
+    """
+    Return [(seek_time, byte_pos), ...] for every video keyframe, in order.
+    Times are relative to the container start (what `-ss` expects).
+    Reads packet headers only — nothing is decoded, so it takes a COPY slot.
+    """
+    async with scheduler.slot(COPY, await priority_for_user(None)):
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,pos,flags:format=start_time",
+            "-of", "csv=p=0", file_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, _ = await proc.communicate()
+    if proc.returncode != 0:
+        return []
+
+    keyframes = []
+    start_time = 0.0
+    for line in stdout.decode("utf-8", errors="replace").splitlines():
+        fields = line.strip().split(",")
+        if len(fields) == 1:
+            try:
+                start_time = float(fields[0])
+            except ValueError:
+                pass
+            continue
+        if len(fields) < 3 or "K" not in fields[2]:
+            continue
+        try:
+            keyframes.append((float(fields[0]), int(fields[1])))
+        except ValueError:
+            continue  # N/A pts/pos
+    keyframes.sort()
+    return [(max(0.0, t - start_time), pos) for t, pos in keyframes]
+
+
+def _plan_media_segments(keyframes, file_size: int, max_bytes: int):
+    """
+    Greedily pick keyframe cut points so each segment's byte span stays under
+    max_bytes * MEDIA_SPLIT_MARGIN. Returns [(start, end_or_None), ...] in
+    seconds, or None if some GOP alone is too big to fit.
+    """
+    budget = max_bytes * MEDIA_SPLIT_MARGIN
+    segments = []
+    seg_start_t, seg_start_pos = 0.0, 0
+    last_fit = None
+
+    for t, pos in keyframes:
+        if t <= seg_start_t:
+            continue
+        if pos - seg_start_pos <= budget:
+            last_fit = (t, pos)
+            continue
+        if last_fit is None:
+            return None
+        segments.append((seg_start_t, last_fit[0]))
+        seg_start_t, seg_start_pos = last_fit
+        last_fit = (t, pos) if pos - seg_start_pos <= budget else None
+        if last_fit is None:
+            return None
+
+    if file_size - seg_start_pos > budget:
+        if last_fit is None:
+            return None
+        segments.append((seg_start_t, last_fit[0]))
+        seg_start_t, seg_start_pos = last_fit
+        if file_size - seg_start_pos > budget:
+            return None
+    segments.append((seg_start_t, None))
+    return segments
+
+
+async def split_media(file_path: str, max_bytes: int = TG_MAX_SIZE) -> list:
+    """
+    Split a video at keyframes with stream copy so every part plays on its
+    own. Up to MEDIA_SPLIT_CONCURRENCY segments are cut at once, as
+    stream-copy jobs of the shared ffmpeg scheduler. All parts exist before
+    the upload starts (a second copy of the file; estimate_footprint counts
+    it). Returns the part paths, or [] if the file can't be split this way
+    (caller falls back to raw byte slices).
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext not in MEDIA_SPLIT_EXTENSIONS:
+        return []
+
+    file_size = os.path.getsize(file_path)
+    keyframes = await _probe_keyframes(file_path)
+    segments = _plan_media_segments(keyframes, file_size, max_bytes) if keyframes else None
+    if not segments or len(segments) < 2:
+        return []
+
+    base_name = os.path.basename(file_path)
+    stem = os.path.splitext(base_name)[0]
+    split_dir = os.path.join(os.path.dirname(file_path), f"{base_name}_parts")
+    os.makedirs(split_dir, exist_ok=True)
+
+    logger.info("Media-splitting %s (%d bytes) into %d parts", base_name, file_size, len(segments))
+
+    sem = asyncio.Semaphore(MEDIA_SPLIT_CONCURRENCY)
+
+    async def cut(i, start, end):
+        async with sem:
+            return await _cut_part(i, start, end)
+
+    async def _cut_part(i, start, end):
+        part_path = os.path.join(split_dir, f"{stem}.part{i + 1:02d}{ext}")
+        cmd = ["ffmpeg", "-y", "-v", "error", "-ss", f"{start:.6f}", "-i", file_path]
+        if end is not None:
+            cmd += ["-t", f"{end - start:.6f}"]
+        cmd += ["-map", "0", "-c", "copy", "-avoid_negative_ts", "make_zero"]
+        if ext in (".mp4", ".mov", ".m4v"):
+            cmd += ["-movflags", "+faststart"]
+        cmd.append(part_path)
+        rc, err = await run_ffmpeg(cmd, label=f"split part {i + 1}")
+        if rc != 0:
+            raise RuntimeError(err[-300:])
+        return part_path
+
+    try:
+        part_paths = await asyncio.gather(
+            *[cut(i, start, end) for i, (start, end) in enumerate(segments)]
+        )
+    except Exception as e:
+        logger.warning("Media split failed for %s: %s", base_name, e)
+        shutil.rmtree(split_dir, ignore_errors=True)
+        return []
+
+    oversized = [p for p in part_paths if os.path.getsize(p) > max_bytes]
+    if oversized:
+        logger.warning("Media split of %s produced oversized parts, falling back", base_name)
+        shutil.rmtree(split_dir, ignore_errors=True)
+        return []
+
+    for i, p in enumerate(part_paths):
+        logger.info("  Part %d: %s (%d bytes)", i + 1, os.path.basename(p), os.path.getsize(p))
+    return list(part_paths)
+
+
+def _humanbytes(size: int) -> str:
+    """Quick human-readable size."""
+    if not size:
+        return "0 B"
+    units = ["B", "KB", "MB", "GB", "TB"]
+    i = 0
+    while size >= 1024 and i < len(units) - 1:
+        size /= 1024
+        i += 1
+    return f"{size:.2f} {units[i]}"
+
+
+async def _plan_upload(file_path: str, caption: str, fname: str, split_mode: str = None) -> list:
+    """
+    Turn one file into the list of uploads it needs. Each item is a dict:
+    kind (video/audio/document), path, window ((offset, length) for raw
+    slices, else None), name, size, caption, cut (True if the path is an
+    ffmpeg-cut part to delete after upload).
+    """
+    file_size = os.path.getsize(file_path)
+
+    if file_size <= TG_MAX_SIZE:
+        # Normal upload — detect type by extension
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext in VIDEO_UPLOAD_EXTENSIONS:
+            kind = "video"
+        elif ext in AUDIO_UPLOAD_EXTENSIONS:
+            kind = "audio"
+        else:
+            kind = "document"
+        return [{
+            "kind": kind, "path": file_path, "window": None, "name": fname,
+            "size": file_size, "caption": caption, "cut": False,
+        }]
+
+    logger.info("File %s is %s (>1.95GB), splitting...", fname, _humanbytes(file_size))
+    media_parts = []
+    if (split_mode or Var.SPLIT_MODE) == "media":
+        media_parts = await split_media(file_path)
+
+    if media_parts:
+        items = [{
+            "kind": "video", "path": p, "window": None, "name": os.path.basename(p),
+            "size": os.path.getsize(p), "cut": True,
+        } for p in media_parts]
+    else:
+        # Raw byte split: upload straight from windows of the original file
+        items = [{
+            "kind": "document", "path": file_path, "window": (offset, length),
+            "name": f"{fname}.part{i + 1:02d}", "size": length, "cut": False,
+        } for i, (offset, length) in enumerate(_slice_windows(file_size))]
+
+    for i, item in enumerate(items):
+        part_caption = (
+            f"📦 **Split Upload** ({i + 1}/{len(items)})\n"
+            f"📁 `{item['name']}`\n"
+            f"📦 Size: `{_humanbytes(item['size'])}`\n"
+        )
+        if i == 0 and caption:
+            part_caption = caption + "\n\n" + part_caption
+        item["caption"] = part_caption
+    return items
+
+
+async def _send_item(client, chat_id: int, item: dict, reply_to: int = None, progress=None):
+    """Send one planned upload item with the given client."""
+    kwargs = dict(
+        caption=item["caption"], file_name=item["name"],
+        reply_to_message_id=reply_to, progress=progress,
+    )
+    if item["window"] is not None:
+        offset, length = item["window"]
+        with FileSlice(item["path"], offset, length, name=item["name"],
+                       use_mmap=Var.SPLIT_MMAP) as part:
+            return await client.send_document(chat_id, part, **kwargs)
+    if item["kind"] == "video":
+        return await client.send_video(chat_id, item["path"], supports_streaming=True, **kwargs)
+    if item["kind"] == "audio":
+        return await client.send_audio(chat_id, item["path"], **kwargs)
+    return await client.send_document(chat_id, item["path"], **kwargs)
+
+
+def _cleanup_item(item: dict):
+    if not item.get("cut"):
+        return
+    try:
+        os.remove(item["path"])
+    except Exception:
+        pass
+    # Remove the _parts directory once its last part is gone
+    try:
+        os.rmdir(os.path.dirname(item["path"]))
+    except Exception:
+        pass
+
+
+# ── Dedup: reuse media we already uploaded with identical bytes ──
+
+HASH_CHUNK = 8 * 1024 * 1024
+QUICK_SPAN = 4 * 1024 * 1024  # bytes hashed at each end for the lookup key
+HASH_CONCURRENCY = 2          # files read for dedup at once, across all uploads
+
+_hash_slots = None            # Semaphore, created inside the running loop
+
+
+def _item_window(item: dict) -> tuple:
+    if item["window"] is not None:
+        return item["window"]
+    return 0, item["size"]
+
+
+def _quick_key(item: dict) -> str:
+    """
+    Size + head + tail hash: lets a lookup miss without reading the whole
+    item (same idea as two_pass._fingerprint). Hits are confirmed with the
+    full sha256.
+    """
+    offset, length = _item_window(item)
+    h = hashlib.sha256(str(length).encode())
+    with open(item["path"], "rb") as f:
+        f.seek(offset)
+        h.update(f.read(min(QUICK_SPAN, length)))
+        if length > QUICK_SPAN:
+            f.seek(offset + max(QUICK_SPAN, length - QUICK_SPAN))
+            h.update(f.read(QUICK_SPAN))
+    return h.hexdigest()[:32]
+
+
+def _hash_item(item: dict) -> str:
+    """sha256 of an item's bytes, read in one streaming pass (runs in a thread)."""
+    h = hashlib.sha256()
+    offset, length = _item_window(item)
+    with open(item["path"], "rb") as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(HASH_CHUNK, remaining))
+            if not chunk:
+                break
+            h.update(chunk)
+            remaining -= len(chunk)
+    return h.hexdigest()
+
+
+async def _run_hash(fn, item: dict) -> str:
+    """Run a hashing function in a thread, at most HASH_CONCURRENCY at a time."""
+    global _hash_slots
+    if _hash_slots is None:
+        _hash_slots = asyncio.Semaphore(HASH_CONCURRENCY)
+    async with _hash_slots:
+        return await asyncio.get_running_loop().run_in_executor(None, fn, item)
+
+
+def _media_file_id(msg):
+    media = getattr(msg, "video", None) or getattr(msg, "audio", None) or getattr(msg, "document", None)
+    return media.file_id if media else None
+
+
+async def _lookup_cached(item: dict):
+    """
+    Return the item's media_index entry, if one matches. Only the cheap
+    quick key is read up front; the full hash runs on a candidate hit.
+    """
+    if not Var.UPLOAD_DEDUP:
+        return None
+    try:
+        item["quick"] = await _run_hash(_quick_key, item)
+        # A cached file keeps its original name, so only reuse exact matches.
+        candidates = [
+            doc for doc in await db.find_cached_media_quick(item["quick"], item["size"])
+            if doc.get("name") == item["name"]
+        ]
+        if not candidates:
+            return None
+        item["sha256"] = await _run_hash(_hash_item, item)
+    except Exception as e:
+        logger.debug("Dedup lookup failed for %s: %s", item["name"], e)
+        return None
+    return next((doc for doc in candidates if doc.get("sha256") == item["sha256"]), None)
+
+
+def _start_hashing(item: dict):
+    """Full hash for the index record, read alongside the upload (not before it)."""
+    if not Var.UPLOAD_DEDUP or "sha256" in item:
+        return None
+    return asyncio.ensure_future(_run_hash(_hash_item, item))
+
+
+async def _finish_hashing(item: dict, hashing):
+    """Collect the hash before the item's file is cleaned up."""
+    if hashing is None:
+        return
+    try:
+        item["sha256"] = await hashing
+    except Exception as e:
+        logger.debug("Hashing %s for dedup failed: %s", item["name"], e)
+
+
+async def _send_hashed(client, chat_id: int, item: dict, reply_to: int = None, progress=None):
+    """
+    _send_item, hashing the item for the media_index while it uploads.
+    Call it inside the upload slot, so only items being sent are read.
+    """
+    hashing = _start_hashing(item)
+    try:
+        msg = await _send_item(client, chat_id, item, reply_to, progress)
+    except BaseException:
+        if hashing is not None:
+            hashing.cancel()
+        raise
+    await _finish_hashing(item, hashing)
+    return msg
+
+
+async def _send_cached(client, chat_id: int, doc: dict, item: dict, reply_to: int = None):
+    """Deliver a cached item without transferring bytes. Returns None if stale."""
+    bin_msg_id = doc.get("bin_msg_id")
+    try:
+        if chat_id == Var.BIN_CHANNEL and bin_msg_id:
+            # Already in the channel — reuse that post instead of adding another.
+            msg = await client.get_messages(Var.BIN_CHANNEL, bin_msg_id)
+            if msg and not msg.empty and _media_file_id(msg):
+                return msg
+        elif doc.get("file_id"):
+            return await client.send_cached_media(
+                chat_id, doc["file_id"], caption=item["caption"],
+                reply_to_message_id=reply_to,
+            )
+    except RPCError as e:
+        logger.info("Cached file_id for %s unusable: %s", item["name"], e)
+
+    if bin_msg_id and chat_id != Var.BIN_CHANNEL:
+        try:
+            return await client.copy_message(
+                chat_id, Var.BIN_CHANNEL, bin_msg_id,
+                caption=item["caption"], reply_to_message_id=reply_to,
+            )
+        except RPCError as e:
+            logger.info("Cached BIN copy for %s unusable: %s", item["name"], e)
+
+    try:
+        await db.remove_cached_media(item["sha256"], item["size"])
+    except Exception:
+        pass
+    return None
+
+
+async def _remember(item: dict, msg=None, bin_msg_id: int = None):
+    """Record an uploaded item. `msg` must belong to the main client (file_ids are per bot)."""
+    if not Var.UPLOAD_DEDUP or "sha256" not in item:
+        return
+    try:
+        await db.add_cached_media(
+            item["sha256"], item["size"], item["name"],
+            file_id=_media_file_id(msg) if msg else None,
+            bin_msg_id=bin_msg_id, quick=item.get("quick"),
+        )
+    except Exception as e:
+        logger.debug("Dedup record failed for %s: %s", item["name"], e)
+
+
+# client index → Semaphore capping concurrent uploads on that bot
+_upload_slots = {}
+
+
+def _upload_slot(index: int) -> asyncio.Semaphore:
+    sem = _upload_slots.get(index)
+    if sem is None:
+        sem = asyncio.Semaphore(Var.UPLOAD_SLOTS_PER_CLIENT)
+        _upload_slots[index] = sem
+    return sem
+
+
+async def _stage_item(main_client, item: dict, progress=None):
+    """
+    Upload an item to BIN_CHANNEL on the least-loaded client. Helper bots
+    can only post there, which is why parallel uploads are staged first.
+    Falls back to the main client if a helper can't post.
+    """
+    index = min(multi_clients, key=lambda i: work_loads.get(i, 0)) if multi_clients else None
+    helper = multi_clients.get(index) if index is not None else None
+    if helper is None:
+        async with _upload_slot(0):
+            return await _send_hashed(main_client, Var.BIN_CHANNEL, item, progress=progress)
+
+    work_loads[index] += 1
+    try:
+        async with _upload_slot(index):
+            try:
+                return await _send_hashed(helper, Var.BIN_CHANNEL, item, progress=progress)
+            except RPCError as e:
+                if helper is main_client:
+                    raise
+                logger.warning("Client %s could not stage %s (%s), using main client", index, item["name"], e)
+    finally:
+        work_loads[index] -= 1
+
+    async with _upload_slot(0):
+        return await _send_hashed(main_client, Var.BIN_CHANNEL, item, progress=progress)
+
+
+async def _upload_direct(client, chat_id: int, item: dict, doc, reply_to: int = None, progress=None):
+    """Send one item straight to chat_id (from the media_index if doc); Message or exception."""
+    try:
+        if doc:
+            msg = await _send_cached(client, chat_id, doc, item, reply_to)
+            if msg:
+                return msg
+        async with _upload_slot(0):
+            msg = await _send_hashed(client, chat_id, item, reply_to, progress)
+        if chat_id == Var.BIN_CHANNEL:
+            await remember_bin_copy(msg)
+        await _remember(item, msg, msg.id if chat_id == Var.BIN_CHANNEL else None)
+        return msg
+    except Exception as e:
+        return e
+    finally:
+        _cleanup_item(item)
+
+
+def _combined_progress(progress, items: list):
+    """Per-item progress callbacks that report one running total."""
+    if progress is None:
+        return [None] * len(items)
+    done = [0] * len(items)
+    total = sum(item["size"] for item in items)
+
+    def make(i):
+        async def cb(current, _total):
+            done[i] = current
+            await progress(sum(done), total)
+        return cb
+
+    return [make(i) for i in range(len(items))]
+
+
+async def _upload_items(client, chat_id: int, items: list, reply_to: int = None, progress=None) -> list:
+    """
+    Upload planned items and return one result per item, in order: the
+    Message, or the exception that item raised.
+
+    Items whose bytes were uploaded before (same sha256 + size) are re-sent
+    from the media_index instead; the lookup only reads each item's ends,
+    and new items are hashed while they upload. A single item, or any
+    number without helper bots, goes straight to chat_id in order.
+    Several items are uploaded concurrently across the helper bots into
+    BIN_CHANNEL, then copied to chat_id one by one in order, so the chat
+    still reads part 1, 2, 3... The staged posts are recorded in bin_index,
+    so later forwards of the same media (task dumps, stream links) reuse
+    them instead of storing it twice.
+    """
+    cached = await asyncio.gather(*[_lookup_cached(item) for item in items])
+    callbacks = _combined_progress(progress, items)
+
+    if len(items) == 1 or len(multi_clients) <= 1:
+        # Staging only pays off when helper bots upload in parallel.
+        results = []
+        for item, cb, doc in zip(items, callbacks, cached):
+            result = await _upload_direct(client, chat_id, item, doc, reply_to, cb)
+            if isinstance(result, Exception):
+                logger.error("Upload failed for %s: %s", item["name"], result)
+            results.append(result)
+        return results
+
+    async def stage(item, cb):
+        try:
+            return await _stage_item(client, item, cb)
+        finally:
+            _cleanup_item(item)
+
+    staged = [
+        None if doc else asyncio.ensure_future(stage(item, cb))
+        for item, cb, doc in zip(items, callbacks, cached)
+    ]
+
+    results = []
+    try:
+        for i, item in enumerate(items):
+            if staged[i] is None:
+                msg = await _send_cached(client, chat_id, cached[i], item, reply_to)
+                if msg:
+                    _cleanup_item(item)
+                    results.append(msg)
+                    continue
+                # Stale cache entry — upload it after all.
+                staged[i] = asyncio.ensure_future(stage(item, callbacks[i]))
+            try:
+                staged_msg = await staged[i]
+            except Exception as e:
+                logger.error("Upload failed for %s: %s", item["name"], e)
+                results.append(e)
+                continue
+            await remember_bin_copy(staged_msg)
+            if chat_id == Var.BIN_CHANNEL:
+                results.append(staged_msg)
+                await _remember(item, None, staged_msg.id)
+                continue
+            try:
+                msg = await client.copy_message(
+                    chat_id, Var.BIN_CHANNEL, staged_msg.id,
+                    reply_to_message_id=reply_to,
+                )
+                results.append(msg)
+                await _remember(item, msg, staged_msg.id)
+            except Exception as e:
+                logger.error("Copy to chat failed for %s: %s", item["name"], e)
+                results.append(e)
+    finally:
+        for task in staged:
+            if task is not None and not task.done():
+                task.cancel()
+    return results
+
+
+async def upload_file_or_split(
+    client,
+    chat_id: int,
+    file_path: str,
+    caption: str = "",
+    file_name: str = None,
+    reply_to: int = None,
+    progress=None,
+    split_mode: str = None,
+) -> list:
+    """
+    Upload a file to Telegram. If >1.95GB, auto-split and upload the parts.
+    split_mode "media" (default: Var.SPLIT_MODE) cuts videos into playable
+    parts sent as videos; "raw" or a failed media split sends byte chunks
+    as documents. Parts upload in parallel across all bot clients.
+    Returns list of sent Message objects.
+    """
+    if not os.path.isfile(file_path):
+        logger.error("File not found: %s", file_path)
+        return []
+
+    fname = file_name or os.path.basename(file_path)
+    items = await _plan_upload(file_path, caption, fname, split_mode)
+    results = await _upload_items(client, chat_id, items, reply_to, progress)
+
+    for item, result in zip(items, results):
+        if isinstance(result, Exception):
+            logger.error("Upload failed for %s: %s", item["name"], result)
+            raise result
+    return results
+
+
+async def upload_files_ordered(
+    client,
+    chat_id: int,
+    files: list,
+    reply_to: int = None,
+    progress=None,
+    split_mode: str = None,
+) -> list:
+    """
+    Upload several files (and their split parts) concurrently, keeping chat
+    order. `files` is a list of (file_path, caption, file_name).
+    Returns one entry per file: its list of Messages, or the exception that
+    stopped it, so callers can report per-file failures.
+    """
+    plans = []
+    for file_path, caption, file_name in files:
+        if not os.path.isfile(file_path):
+            plans.append(FileNotFoundError(file_path))
+            continue
+        fname = file_name or os.path.basename(file_path)
+        plans.append(await _plan_upload(file_path, caption, fname, split_mode))
+
+    items = [item for plan in plans if isinstance(plan, list) for item in plan]
+    results = iter(await _upload_items(client, chat_id, items, reply_to, progress) if items else [])
+
+    per_file = []
+    for plan in plans:
+        if isinstance(plan, Exception):
+            per_file.append(plan)
+            continue
+        msgs = [next(results) for _ in plan]
+        error = next((r for r in msgs if isinstance(r, Exception)), None)
+        per_file.append(error if error is not None else msgs)
+    return per_file
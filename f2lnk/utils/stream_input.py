@@ -0,0 +1,29 @@
+# f2lnk/utils/stream_input.py
+# Feed ffmpeg from our own stream route instead of a downloaded copy.
+#
+# The BIN_CHANNEL copy of a message is served by the web server on loopback
+# with HTTP range support, so ffmpeg can read (and seek in) the media while
+# it is being fetched from Telegram. Processing starts with the first bytes
+# and the input never lands in the task directory.
+
+from f2lnk.vars import Var
+from f2lnk.utils.bin_index import get_or_forward_to_bin
+
+# Leech tools with a single input per output that ffmpeg reads front to back
+STREAM_TOOLS = ("cv", "wv", "rv", "ev")
+
+_URL_PREFIX = "http://127.0.0.1:"
+
+
+def local_stream_url(message_id: int, secure_hash: str) -> str:
+    return f"{_URL_PREFIX}{Var.PORT}/{message_id}?hash={secure_hash}"
+
+
+def is_stream_url(path: str) -> bool:
+    return str(path).startswith(_URL_PREFIX)
+
+
+async def stream_url_for(message) -> str:
+    """Loopback URL of the media in `message` (forwarded to BIN_CHANNEL if needed)."""
+    bin_msg_id, _, secure_hash = await get_or_forward_to_bin(message)
+    return local_stream_url(bin_msg_id, secure_hash)
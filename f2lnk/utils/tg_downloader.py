@@ -0,0 +1,304 @@
+# f2lnk/utils/tg_downloader.py
+# Parallel Telegram file downloads for bot-side processing.
+#
+# client.download_media fetches one 1 MiB part at a time. Here the file is
+# preallocated and its parts are fetched concurrently with raw GetFile
+# through ByteStreamer's media sessions: by the client that owns the message
+# and, for big files, by every helper bot through the BIN_CHANNEL copy when
+# one is already indexed (a download never forwards the file there itself).
+# Each part is written at its own offset (pwrite), and finished part numbers
+# are kept in a `<file>.resume` sidecar so a failed or cancelled download
+# picks up where it stopped the next time the same file is fetched.
+
+import os
+import json
+import asyncio
+import inspect
+import logging
+
+from pyrogram import raw
+from pyrogram.errors import FloodWait, FileReferenceExpired, RPCError
+
+from f2lnk.vars import Var
+from f2lnk.bot import multi_clients, work_loads
+from f2lnk.utils.custom_dl import ByteStreamer
+from f2lnk.utils.file_properties import get_media_from_message, parse_file_id
+from f2lnk.utils.bin_index import known_bin_copy
+
+logger = logging.getLogger(__name__)
+
+PART_SIZE = 1024 * 1024           # GetFile maximum; offsets must be multiples of it
+PARALLEL_MIN_SIZE = 8 * PART_SIZE  # smaller files aren't worth the setup
+HELPERS_MIN_SIZE = 64 * PART_SIZE  # below this, don't stage a BIN copy for helpers
+PART_RETRIES = 5
+RESUME_SUFFIX = ".resume"
+RESUME_SAVE_EVERY = 32            # parts between sidecar writes
+
+_streamers = {}                   # client → ByteStreamer (media sessions, locations)
+_session_locks = {}               # client → Lock (one media session per DC)
+
+
+def _streamer(client) -> ByteStreamer:
+    streamer = _streamers.get(client)
+    if streamer is None:
+        streamer = ByteStreamer(client)
+        _streamers[client] = streamer
+    return streamer
+
+
+async def _media_session(client, file_id):
+    lock = _session_locks.setdefault(client, asyncio.Lock())
+    async with lock:
+        return await _streamer(client).generate_media_session(client, file_id)
+
+
+def _target_path(file_name: str, media) -> str:
+    """Same rules as download_media: a directory (or trailing slash) gets the media's own name."""
+    name = getattr(media, "file_name", None) or f"{getattr(media, 'file_unique_id', 'file')}"
+    if not file_name:
+        return os.path.join("downloads", name)
+    if file_name.endswith(("/", os.sep)) or os.path.isdir(file_name):
+        return os.path.join(file_name, name)
+    return file_name
+
+
+def _load_resume(path: str, unique_id: str, size: int) -> set:
+    try:
+        with open(path + RESUME_SUFFIX, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if state.get("file_unique_id") != unique_id or state.get("size") != size:
+        return set()
+    if not os.path.isfile(path) or os.path.getsize(path) != size:
+        return set()
+    return set(state.get("done", []))
+
+
+def _save_resume(path: str, unique_id: str, size: int, done: set):
+    tmp = path + RESUME_SUFFIX + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"file_unique_id": unique_id, "size": size, "done": sorted(done)}, f)
+        os.replace(tmp, path + RESUME_SUFFIX)
+    except OSError as e:
+        logger.debug("Resume state not saved for %s: %s", path, e)
+
+
+def _pwrite(fd: int, data: bytes, offset: int):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+class _Source:
+    """One client's view of the file: its own file_id, location and media session."""
+
+    def __init__(self, index, client, message):
+        self.index = index
+        self.client = client
+        self.message = message
+        self.location = None
+        self.session = None
+
+    async def prepare(self):
+        file_id = await parse_file_id(self.message)
+        self.session = await _media_session(self.client, file_id)
+        self.location = await ByteStreamer.get_location(file_id)
+
+    async def refresh(self):
+        """New file_reference after FileReferenceExpired."""
+        self.message = await self.client.get_messages(self.message.chat.id, self.message.id)
+        await self.prepare()
+
+    async def get_part(self, part: int) -> bytes:
+        r = await self.session.send(
+            raw.functions.upload.GetFile(
+                location=self.location, offset=part * PART_SIZE, limit=PART_SIZE
+            )
+        )
+        if not isinstance(r, raw.types.upload.File):
+            raise RuntimeError(f"Unexpected GetFile result {type(r).__name__}")
+        return r.bytes
+
+
+def _client_index(client) -> int:
+    return next((i for i, c in multi_clients.items() if c is client), 0)
+
+
+async def _helper_sources(client, message) -> list:
+    """Sources for helper bots, reading the indexed BIN_CHANNEL copy of the message."""
+    helpers = [(i, c) for i, c in multi_clients.items() if c is not client]
+    if not helpers:
+        return []
+    bin_msg_id = await known_bin_copy(message)
+    if not bin_msg_id:
+        return []
+    sources = []
+    for index, client in helpers:
+        try:
+            bin_msg = await client.get_messages(Var.BIN_CHANNEL, bin_msg_id)
+            if not bin_msg or bin_msg.empty:
+                break
+            source = _Source(index, client, bin_msg)
+            await source.prepare()
+            sources.append(source)
+        except Exception as e:
+            logger.debug("Client %s can't read BIN message %s: %s", index, bin_msg_id, e)
+    return sources
+
+
+async def _report(progress, progress_args, current, total):
+    if progress is None:
+        return
+    try:
+        result = progress(current, total, *progress_args)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        logger.debug("Download progress callback failed: %s", e)
+
+
+def _counting(progress, on_fetched):
+    """Wrap a download_media progress callback so on_fetched also gets each new chunk's size."""
+    seen = 0
+
+    async def cb(current, total, *args):
+        nonlocal seen
+        on_fetched(current - seen)
+        seen = current
+        await _report(progress, args, current, total)
+
+    return cb
+
+
+async def download_file(
+    client,
+    message,
+    file_name: str = "",
+    progress=None,
+    progress_args: tuple = (),
+    use_helpers: bool = True,
+    on_flood_wait=None,
+    on_fetched=None,
+) -> str:
+    """
+    Drop-in for client.download_media(message, file_name, progress=...).
+    Returns the path of the downloaded file (None if the message has no media).
+    use_helpers=False keeps the download on `client` alone; on_flood_wait
+    (client_index, seconds) is awaited before a part waits out a FloodWait;
+    on_fetched(nbytes) is called for every part fetched by this call (parts
+    resumed from disk are not reported).
+    The download counts towards work_loads of every client taking part.
+    """
+    media = get_media_from_message(message)
+    size = getattr(media, "file_size", 0) or 0
+    if media is None or size < PARALLEL_MIN_SIZE or getattr(message, "photo", None):
+        index = _client_index(client)
+        work_loads[index] = work_loads.get(index, 0) + 1
+        try:
+            return await client.download_media(
+                message, file_name=file_name,
+                progress=progress if on_fetched is None else _counting(progress, on_fetched),
+                progress_args=progress_args,
+            )
+        finally:
+            work_loads[index] -= 1
+
+    path = _target_path(file_name, media)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    unique_id = media.file_unique_id
+    parts = (size + PART_SIZE - 1) // PART_SIZE
+    done = _load_resume(path, unique_id, size)
+    if done:
+        logger.info("Resuming %s: %d/%d parts already on disk", path, len(done), parts)
+
+    main = _Source(_client_index(client), client, message)
+    await main.prepare()
+    sources = [main]
+    if use_helpers and size >= HELPERS_MIN_SIZE:
+        sources += await _helper_sources(client, message)
+
+    pending = asyncio.Queue()
+    for part in range(parts):
+        if part not in done:
+            pending.put_nowait(part)
+    per_source = max(1, Var.TG_DOWNLOAD_WORKERS // len(sources))
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    loop = asyncio.get_running_loop()
+    since_save = 0
+
+    async def worker(source: _Source):
+        nonlocal since_save
+        while True:
+            try:
+                part = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            attempt = 0
+            while True:
+                try:
+                    data = await source.get_part(part)
+                    break
+                except FloodWait as e:
+                    wait = int(getattr(e, "value", 0) or 0) or 1
+                    if on_flood_wait is not None:
+                        await on_flood_wait(source.index, wait)
+                    await asyncio.sleep(wait)
+                except FileReferenceExpired:
+                    await source.refresh()
+                except (RPCError, OSError, asyncio.TimeoutError) as e:
+                    attempt += 1
+                    if attempt >= PART_RETRIES:
+                        if source is not main:
+                            # Hand the part back and let the other sources finish.
+                            logger.warning("Client %s dropped out of download: %s", source.index, e)
+                            pending.put_nowait(part)
+                            return
+                        raise
+                    await asyncio.sleep(attempt)
+            expected = min(PART_SIZE, size - part * PART_SIZE)
+            if len(data) != expected:
+                raise RuntimeError(f"Part {part}: got {len(data)} bytes, expected {expected}")
+            await loop.run_in_executor(None, _pwrite, fd, data, part * PART_SIZE)
+            done.add(part)
+            if on_fetched is not None:
+                on_fetched(len(data))
+            since_save += 1
+            if since_save >= RESUME_SAVE_EVERY:
+                since_save = 0
+                _save_resume(path, unique_id, size, done)
+            await _report(progress, progress_args, min(len(done) * PART_SIZE, size), size)
+
+    for source in sources:
+        work_loads[source.index] = work_loads.get(source.index, 0) + 1
+    workers = [
+        asyncio.ensure_future(worker(source))
+        for source in sources for _ in range(per_source)
+    ]
+    try:
+        os.ftruncate(fd, size)
+        for job in asyncio.as_completed(workers):
+            await job
+        while not pending.empty():
+            # Only reachable if every helper dropped out: finish on the main client.
+            await worker(main)
+    except BaseException:
+        for job in workers:
+            job.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        _save_resume(path, unique_id, size, done)
+        raise
+    finally:
+        os.close(fd)
+        for source in sources:
+            work_loads[source.index] -= 1
+
+    try:
+        os.remove(path + RESUME_SUFFIX)
+    except OSError:
+        pass
+    return path
@@ -0,0 +1,270 @@
+# f2lnk/utils/thumbnails.py
+# Seek-preview thumbnails (sprite sheet + WebVTT track) for the watch page.
+#
+# Frames are grabbed by pointing ffmpeg at our own stream route on loopback,
+# so every seek turns into a ranged ByteStreamer fetch and only the keyframes
+# around each timestamp are pulled from Telegram — never the whole file.
+
+import os
+import json
+import time
+import shutil
+import asyncio
+import logging
+from typing import Dict
+
+from f2lnk.vars import Var
+from f2lnk.utils.stream_input import local_stream_url
+from f2lnk.utils.ffmpeg_runner import run_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+THUMB_ROOT = "./thumb_cache"
+THUMB_WIDTH = 160
+THUMB_HEIGHT = 90
+THUMB_COLS = 10
+MAX_THUMBS = 30           # ffmpeg seeks one first page view may start
+MIN_INTERVAL = 5          # seconds between previews
+GRAB_CONCURRENCY = 4      # parallel ffmpeg seeks per job (still bounded by the scheduler)
+FAILED_TTL = 6 * 3600     # seconds a failed file is not retried
+FAILED_SUFFIX = ".failed"
+
+SPRITE_NAME = "sprite.jpg"
+VTT_NAME = "thumbs.vtt"
+
+# file_unique_id → running generation job
+_jobs: Dict[str, asyncio.Task] = {}
+
+
+def _cache_dir(unique_id: str) -> str:
+    return os.path.join(THUMB_ROOT, unique_id)
+
+
+def cached_paths(unique_id: str):
+    """Return (sprite_path, vtt_path) if both exist on disk, else None."""
+    d = _cache_dir(unique_id)
+    sprite = os.path.join(d, SPRITE_NAME)
+    vtt = os.path.join(d, VTT_NAME)
+    if os.path.isfile(sprite) and os.path.isfile(vtt):
+        return sprite, vtt
+    return None
+
+
+def _failed_recently(unique_id: str) -> bool:
+    try:
+        return time.time() - os.path.getmtime(_cache_dir(unique_id) + FAILED_SUFFIX) < FAILED_TTL
+    except OSError:
+        return False
+
+
+def _mark_failed(unique_id: str):
+    """Negative marker, so audio/broken files don't re-run ffmpeg on every page view."""
+    try:
+        os.makedirs(THUMB_ROOT, exist_ok=True)
+        with open(_cache_dir(unique_id) + FAILED_SUFFIX, "w"):
+            pass
+    except OSError as e:
+        logger.debug("Thumbnails: can't mark %s as failed: %s", unique_id, e)
+
+
+def _prune_cache():
+    """Keep the THUMB_CACHE_MAX_ENTRIES most recently used previews, drop expired markers."""
+    try:
+        names = os.listdir(THUMB_ROOT)
+    except OSError:
+        return
+
+    def _mtime(p):
+        try:
+            return os.path.getmtime(p)
+        except OSError:
+            return 0
+
+    now = time.time()
+    entries = []
+    for name in names:
+        path = os.path.join(THUMB_ROOT, name)
+        if name.endswith(FAILED_SUFFIX):
+            if now - _mtime(path) >= FAILED_TTL:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        elif not name.endswith(".tmp"):
+            entries.append(path)
+    entries.sort(key=_mtime, reverse=True)
+    for stale in entries[Var.THUMB_CACHE_MAX_ENTRIES:]:
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+def _vtt_timestamp(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    h, ms = divmod(ms, 3600000)
+    m, ms = divmod(ms, 60000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+
+async def _probe_duration(url: str) -> float:
+    """Read the container header over HTTP and return the duration."""
+    proc = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", url,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=60)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return 0.0
+    try:
+        info = json.loads(stdout.decode("utf-8", errors="replace"))
+        return float(info.get("format", {}).get("duration", 0))
+    except (ValueError, TypeError):
+        return 0.0
+
+
+async def _grab_frame(url: str, ts: float, out_path: str) -> bool:
+    """
+    Decode the keyframe at/just before `ts`.
+    -noaccurate_seek + -skip_frame nokey: ffmpeg seeks via the index, decodes
+    one keyframe and stops, so only a few ranged reads hit the stream route.
+    """
+    vf = (
+        f"scale={THUMB_WIDTH}:{THUMB_HEIGHT}:force_original_aspect_ratio=decrease,"
+        f"pad={THUMB_WIDTH}:{THUMB_HEIGHT}:(ow-iw)/2:(oh-ih)/2"
+    )
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-noaccurate_seek", "-skip_frame", "nokey",
+        "-ss", f"{ts:.3f}", "-i", url,
+        "-frames:v", "1", "-an", "-vf", vf, "-q:v", "5",
+        out_path,
+    ]
+    # Through the shared scheduler: page views must not start ffmpeg unbounded.
+    rc, _ = await run_ffmpeg(cmd, label="seek previews", timeout=60)
+    return rc == 0 and os.path.isfile(out_path)
+
+
+async def _generate(unique_id: str, message_id: int, secure_hash: str) -> bool:
+    try:
+        ok = await _build(unique_id, message_id, secure_hash)
+    except Exception:
+        _mark_failed(unique_id)
+        raise
+    if not ok:
+        _mark_failed(unique_id)
+    return ok
+
+
+async def _build(unique_id: str, message_id: int, secure_hash: str) -> bool:
+    url = local_stream_url(message_id, secure_hash)
+    duration = await _probe_duration(url)
+    if duration <= 0:
+        logger.warning("Thumbnails: no duration for %s", unique_id)
+        return False
+
+    count = max(1, min(MAX_THUMBS, int(duration // MIN_INTERVAL)))
+    interval = duration / count
+
+    os.makedirs(THUMB_ROOT, exist_ok=True)
+    tmp_dir = _cache_dir(unique_id) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    frames_dir = os.path.join(tmp_dir, "frames")
+    os.makedirs(frames_dir, exist_ok=True)
+
+    sem = asyncio.Semaphore(GRAB_CONCURRENCY)
+
+    async def grab(i):
+        async with sem:
+            out = os.path.join(frames_dir, f"{i:04d}.jpg")
+            return await _grab_frame(url, i * interval, out)
+
+    try:
+        results = await asyncio.gather(*[grab(i) for i in range(count)])
+        if not any(results):
+            return False
+
+        # The tile filter needs a contiguous sequence — reuse the nearest
+        # earlier frame wherever a seek failed.
+        last_ok = None
+        for i, ok in enumerate(results):
+            path = os.path.join(frames_dir, f"{i:04d}.jpg")
+            if ok:
+                last_ok = path
+            else:
+                src = last_ok or os.path.join(frames_dir, f"{results.index(True):04d}.jpg")
+                shutil.copyfile(src, path)
+
+        rows = (count + THUMB_COLS - 1) // THUMB_COLS
+        cols = min(THUMB_COLS, count)
+        sprite_path = os.path.join(tmp_dir, SPRITE_NAME)
+        rc, err = await run_ffmpeg([
+            "ffmpeg", "-y", "-v", "error",
+            "-framerate", "1", "-i", os.path.join(frames_dir, "%04d.jpg"),
+            "-vf", f"tile={cols}x{rows}", "-frames:v", "1", "-q:v", "4",
+            sprite_path,
+        ], label="seek previews")
+        if rc != 0:
+            logger.warning("Thumbnails: tiling failed for %s: %s", unique_id, err[-300:])
+            return False
+
+        # Sprite URL is relative, so the track works behind any public URL.
+        lines = ["WEBVTT", ""]
+        for i in range(count):
+            x = (i % THUMB_COLS) * THUMB_WIDTH
+            y = (i // THUMB_COLS) * THUMB_HEIGHT
+            start = i * interval
+            end = min(duration, (i + 1) * interval)
+            lines.append(f"{_vtt_timestamp(start)} --> {_vtt_timestamp(end)}")
+            lines.append(
+                f"{SPRITE_NAME}?hash={secure_hash}"
+                f"#xywh={x},{y},{THUMB_WIDTH},{THUMB_HEIGHT}"
+            )
+            lines.append("")
+        with open(os.path.join(tmp_dir, VTT_NAME), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+
+        shutil.rmtree(frames_dir, ignore_errors=True)
+        final_dir = _cache_dir(unique_id)
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+        logger.info("Thumbnails: built %d previews for %s", count, unique_id)
+        _prune_cache()
+        return True
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+async def get_thumbnails(unique_id: str, message_id: int, secure_hash: str, wait: float = 25):
+    """
+    Return (sprite_path, vtt_path), generating them on first request.
+    Concurrent requests for the same file share one job. Returns None if the
+    job is still running after `wait` seconds (it keeps going in the
+    background) or if it failed.
+    """
+    paths = cached_paths(unique_id)
+    if paths:
+        try:
+            os.utime(_cache_dir(unique_id))   # LRU for _prune_cache
+            return paths
+        except OSError:
+            pass                              # pruned just now: build it again
+    if _failed_recently(unique_id):
+        return None
+
+    job = _jobs.get(unique_id)
+    if job is None:
+        job = asyncio.create_task(_generate(unique_id, message_id, secure_hash))
+        _jobs[unique_id] = job
+        job.add_done_callback(lambda _t: _jobs.pop(unique_id, None))
+
+    try:
+        await asyncio.wait_for(asyncio.shield(job), timeout=wait)
+    except asyncio.TimeoutError:
+        return None
+    except Exception as e:
+        logger.warning("Thumbnails: job failed for %s: %s", unique_id, e)
+        return None
+    return cached_paths(unique_id)
@@ -0,0 +1,202 @@
+# f2lnk/utils/two_pass.py
+# Two-pass target-size encoding with a reusable first pass.
+#
+# Pass 1 (x264 analysis at a fixed CRF) depends only on the source, not on
+# the requested size, so its stats (.log + .mbtree) and the probed duration
+# are kept in ENCODE_CACHE_ROOT under a content fingerprint of the file.
+# Asking for another size — even after re-downloading the same file in a new
+# task — goes straight to pass 2. If the result still misses the target by
+# more than SIZE_TOLERANCE, pass 2 is re-run once with a corrected bitrate.
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import asyncio
+import logging
+
+from f2lnk.vars import Var
+from f2lnk.utils import probe_cache
+from f2lnk.utils.ffmpeg_runner import run_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+ENCODE_CACHE_ROOT = "./encode_cache"
+META_NAME = "meta.json"
+PASSLOG_PREFIX = "x264"
+PASS1_CRF = "23"
+PRESET = "medium"
+AUDIO_BITRATE = 128000        # bits/s of the AAC track in the output
+MUX_OVERHEAD = 0.015          # container + index share of the output
+MIN_VIDEO_KBPS = 100
+SIZE_TOLERANCE = 0.03
+_FINGERPRINT_SPAN = 4 * 1024 * 1024
+
+
+def _fingerprint(path: str) -> str:
+    """Size + head + tail hash: stable across re-downloads, cheap on big files."""
+    if "://" in path:
+        # Streamed input: the URL names one BIN_CHANNEL copy (see bin_index).
+        return hashlib.sha256(path.encode()).hexdigest()[:32]
+    size = os.path.getsize(path)
+    h = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as f:
+        h.update(f.read(_FINGERPRINT_SPAN))
+        if size > _FINGERPRINT_SPAN:
+            f.seek(max(_FINGERPRINT_SPAN, size - _FINGERPRINT_SPAN))
+            h.update(f.read(_FINGERPRINT_SPAN))
+    return h.hexdigest()[:32]
+
+
+def _load_meta(cache_dir: str):
+    try:
+        with open(os.path.join(cache_dir, META_NAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    stats = os.path.join(cache_dir, f"{PASSLOG_PREFIX}-0.log")
+    if not os.path.isfile(stats):
+        return None
+    return meta
+
+
+def _prune_cache():
+    """Keep only the ENCODE_CACHE_MAX_ENTRIES most recently used analyses."""
+    try:
+        entries = [
+            os.path.join(ENCODE_CACHE_ROOT, d) for d in os.listdir(ENCODE_CACHE_ROOT)
+            if ".tmp-" not in d
+        ]
+    except OSError:
+        return
+
+    def _mtime(p):
+        try:
+            return os.path.getmtime(p)
+        except OSError:
+            return 0
+
+    entries.sort(key=_mtime, reverse=True)
+    for stale in entries[Var.ENCODE_CACHE_MAX_ENTRIES:]:
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+def video_kbps_for(target_bytes: int, duration: float, audio_bps: int = AUDIO_BITRATE) -> int:
+    """Video bitrate (kbps) that fills target_bytes next to the audio track."""
+    usable_bits = target_bytes * 8 * (1 - MUX_OVERHEAD)
+    return int((usable_bits / duration - audio_bps) / 1000)
+
+
+async def _first_pass(src: str, cache_dir: str, run_kwargs: dict):
+    """Run (or reuse) the analysis pass; returns meta or None."""
+    meta = _load_meta(cache_dir)
+    if meta:
+        try:
+            os.utime(cache_dir)
+            logger.info("Two-pass: reusing cached analysis %s", cache_dir)
+            return meta
+        except OSError:
+            pass  # pruned by another job just now: analyse again
+
+    duration = await probe_cache.probe_duration(src)
+    if duration <= 0:
+        return None
+
+    tmp_dir = f"{cache_dir}.tmp-{os.getpid()}-{int(time.time() * 1000)}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    try:
+        cmd = [
+            "ffmpeg", "-y", "-i", src,
+            "-map", "0:v:0", "-an", "-sn",
+            "-c:v", "libx264", "-preset", PRESET, "-crf", PASS1_CRF,
+            "-pass", "1", "-passlogfile", os.path.join(tmp_dir, PASSLOG_PREFIX),
+            "-f", "null", "-",
+        ]
+        rc, err = await run_ffmpeg(cmd, duration=duration, **run_kwargs)
+        if rc != 0:
+            logger.warning("Two-pass: analysis failed for %s: %s", src, err[-300:])
+            return None
+        meta = {"duration": duration, "created": int(time.time())}
+        with open(os.path.join(tmp_dir, META_NAME), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        try:
+            os.replace(tmp_dir, cache_dir)
+        except OSError:
+            # Another task finished the same analysis first — use theirs.
+            pass
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    _prune_cache()
+    return _load_meta(cache_dir)
+
+
+async def target_size_encode(
+    src: str,
+    output_path: str,
+    target_bytes: int,
+    status_msg=None,
+    **run_kwargs,
+) -> tuple:
+    """
+    Encode src to about target_bytes (libx264 two-pass + AAC 128k).
+    run_kwargs go to run_ffmpeg (user_id, label, on_start, cancel_event, ...).
+    Returns (ok, error_text).
+    """
+    os.makedirs(ENCODE_CACHE_ROOT, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    key = await loop.run_in_executor(None, _fingerprint, src)
+    cache_dir = os.path.join(ENCODE_CACHE_ROOT, key)
+    run_kwargs = {**run_kwargs, "status_msg": status_msg}
+
+    label = run_kwargs.pop("label", "FFmpeg job")
+
+    meta = await _first_pass(src, cache_dir, {**run_kwargs, "label": f"{label} (pass 1/2)"})
+    if not meta:
+        return False, "First-pass analysis failed"
+    duration = float(meta["duration"])
+    # No audio stream, no AAC track to leave room for.
+    audio_bps = AUDIO_BITRATE if probe_cache.streams(await probe_cache.probe(src), "audio") else 0
+
+    video_kbps = video_kbps_for(target_bytes, duration, audio_bps)
+    if video_kbps < MIN_VIDEO_KBPS:
+        video_kbps = MIN_VIDEO_KBPS
+        if status_msg is not None:
+            try:
+                await status_msg.edit_text(
+                    "⚠️ Target size too small for duration. Using minimum bitrate.\n"
+                    "Consider a shorter target or lower resolution."
+                )
+            except Exception:
+                pass
+
+    for attempt in range(2):
+        cmd = [
+            "ffmpeg", "-y", "-i", src,
+            # Same video stream as the analysis pass, or the stats don't match.
+            "-map", "0:v:0", "-map", "0:a:0?",
+            "-c:v", "libx264", "-preset", PRESET, "-b:v", f"{video_kbps}k",
+            "-pass", "2", "-passlogfile", os.path.join(cache_dir, PASSLOG_PREFIX),
+            "-c:a", "aac", "-b:a", f"{AUDIO_BITRATE // 1000}k",
+            output_path,
+        ]
+        rc, err = await run_ffmpeg(cmd, duration=duration, label=f"{label} (pass 2/2)", **run_kwargs)
+        if rc != 0:
+            return False, err
+
+        actual = os.path.getsize(output_path)
+        miss = (actual - target_bytes) / target_bytes
+        logger.info("Two-pass: %s → %d bytes (target %d, %+.1f%%) at %dk",
+                    src, actual, target_bytes, miss * 100, video_kbps)
+        if abs(miss) <= SIZE_TOLERANCE or video_kbps <= MIN_VIDEO_KBPS or attempt:
+            break
+        # Scale only the video share; the audio track size doesn't move.
+        audio_bytes = audio_bps / 8 * duration
+        video_bytes = max(actual - audio_bytes, 1)
+        wanted = max(target_bytes * (1 - MUX_OVERHEAD) - audio_bytes, 1)
+        video_kbps = max(MIN_VIDEO_KBPS, int(video_kbps * wanted / video_bytes))
+    try:
+        os.utime(cache_dir)   # LRU for _prune_cache
+    except OSError:
+        pass                  # already pruned by another job; the encode is done
+    return True, ""
@@ -51,4 +51,46 @@ class Var(object):
     QB_PORT = int(getenv('QB_PORT', '8090'))
     QB_USER = str(getenv('QB_USER', 'admin'))
     QB_PASS = str(getenv('QB_PASS', 'adminadmin'))
-    
+
+    # Splitting of files over the Telegram size limit:
+    #   "raw"   — plain byte chunks (.part01, .part02, ...) that must be rejoined,
+    #             uploaded in place from the original file
+    #   "media" — cut at keyframes into independently playable parts (falls back
+    #             to raw); needs disk for a full copy of the file while uploading
+    SPLIT_MODE = str(getenv('SPLIT_MODE', 'raw')).lower()
+    # Memory-map the source windows when uploading raw split parts
+    SPLIT_MMAP = str(getenv('SPLIT_MMAP', 'false')).lower() in ('1', 'true', 'yes')
+    # Concurrent uploads allowed per bot client (split parts, multi-file leeches)
+    UPLOAD_SLOTS_PER_CLIENT = int(getenv('UPLOAD_SLOTS_PER_CLIENT', '2'))
+    # Reuse previously uploaded media when the same bytes are uploaded again
+    UPLOAD_DEDUP = str(getenv('UPLOAD_DEDUP', 'true')).lower() in ('1', 'true', 'yes')
+    # FFmpeg job scheduler: concurrent re-encodes (CPU bound) and stream copies
+    FFMPEG_ENCODE_SLOTS = int(getenv('FFMPEG_ENCODE_SLOTS', str(max(1, (os.cpu_count() or 2) // 2))))
+    FFMPEG_COPY_SLOTS = int(getenv('FFMPEG_COPY_SLOTS', '4'))
+    # Trim: "copy" cuts at keyframes with a plain stream copy; "smart"
+    # re-encodes only the boundary GOPs (frame-accurate, but the codec
+    # parameters change at the splices, which some players mishandle)
+    TRIM_MODE = str(getenv('TRIM_MODE', 'copy')).lower()
+    # Segment-parallel encoding for long inputs (compress tools), opt-in
+    CHUNKED_ENCODE = str(getenv('CHUNKED_ENCODE', 'false')).lower() in ('1', 'true', 'yes')
+    CHUNKED_ENCODE_MIN_SECONDS = int(getenv('CHUNKED_ENCODE_MIN_SECONDS', '600'))
+    # Segments per file, at most half the encode slots (0 = that maximum)
+    ENCODE_CHUNKS = int(getenv('ENCODE_CHUNKS', '0'))
+    # Cached first-pass analyses kept for target-size re-encodes
+    ENCODE_CACHE_MAX_ENTRIES = int(getenv('ENCODE_CACHE_MAX_ENTRIES', '20'))
+    # Multi-file /l tasks: files processed at once while the rest download/upload
+    LEECH_PIPELINE_CONCURRENCY = int(getenv('LEECH_PIPELINE_CONCURRENCY', '2'))
+    # Upper bound for the adaptive /l download concurrency
+    LEECH_MAX_DOWNLOADS = int(getenv('LEECH_MAX_DOWNLOADS', '8'))
+    # Parallel GetFile requests per bot-side download (split across clients)
+    TG_DOWNLOAD_WORKERS = int(getenv('TG_DOWNLOAD_WORKERS', '8'))
+    # Disk admission control: total space jobs may reserve (0 = whole disk)
+    # and the free space always kept spare
+    DISK_BUDGET_GB = float(getenv('DISK_BUDGET_GB', '0'))
+    DISK_FREE_MARGIN_MB = int(getenv('DISK_FREE_MARGIN_MB', '1024'))
+    # Background janitor: how often it runs and how long a temp dir must sit
+    # untouched (and not belong to a live job) before it is removed
+    JANITOR_INTERVAL = int(getenv('JANITOR_INTERVAL', '1800'))
+    JANITOR_MAX_AGE_HOURS = float(getenv('JANITOR_MAX_AGE_HOURS', '6'))
+    # Seek-preview sprite sets kept in ./thumb_cache (least recently used go first)
+    THUMB_CACHE_MAX_ENTRIES = int(getenv('THUMB_CACHE_MAX_ENTRIES', '500'))